@@ -1,3 +1,5 @@
+_module_started = __import__("time").perf_counter()
+#Startup is timed from the line above, ahead of every import, for --profile-startup
 
 #Internship Project v1.0
 
@@ -13,6 +15,8 @@ mySpecs = [
     
     {
         
+        "SPEC_NAME" : "aws-default",
+        
         "KEY_NAME" : "myKey",
         
         "IMAGE_ID" : "ami-0f2176987ee50226e",
@@ -40,6 +44,8 @@ mySpecs = [
     
     {
         
+        "SPEC_NAME" : "gcp-default",
+        
         "PROJECT" : "graphic-boulder-247700",
         "ZONE" : "us-west1-a",
         
@@ -59,6 +65,8 @@ mySpecs = [
     
     {
         
+        "SPEC_NAME" : "azu-default",
+        
         #MUST CONFIGURE DIFFERENTLY EVERY TIME
         
         "VM_NAME" : "instance-1",
@@ -97,744 +105,7903 @@ mySpecs = [
 #----------------------------------------------------------------------------------------
 
 import os
-from Crypto.PublicKey import RSA
 import sys
+import json
+import hashlib
+import argparse
+import sqlite3
+import time
+import random
+import uuid
+import collections
+import itertools
+import importlib
+import subprocess
+import threading
+import queue
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait as futures_wait
+
+log = logging.getLogger("cloud_vms")
 
-#SDK for AWS:
+#Provider SDKs are imported on first use by the matching platform, so a session that
+#only touches AWS never pays for the Google and Azure packages
 
-import boto3
+PROVIDER_MODULES = {
+    
+    #SDK for AWS:
+    
+    "aws" : ("boto3",),
+    
+    #SDK for GCP:
+    
+    "gcp" : ("googleapiclient.discovery", "google.auth", "google_auth_httplib2"),
+    
+    #SDKs For Azure (keys are generated with pycryptodome):
+    
+    "azu" : ("azure.mgmt.compute", "azure.mgmt.network", "Crypto.PublicKey.RSA", "Crypto.PublicKey.ECC")
+    
+}
 
-#SDK for GCP:
+#Seconds from module start to the menu that --profile-startup holds us to
 
-from googleapiclient import discovery
+STARTUP_BUDGET = 0.25
 
-#SDKs For Azure:
+#Seconds spent importing each SDK module, filled in as they are first needed
 
-from azure.common.client_factory import get_client_from_cli_profile
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
+import_times = {}
 
-#----------------------------------------------------------------------------------------
+_import_lock = threading.Lock()
 
-class Cloud(object):
+def _require(name):
+    
+    module = sys.modules.get(name)
     
-    def __init__(self, platform = ""):
+    if module is None:
         
-        self.platform = platform
+        with _import_lock:
+            
+            started = time.perf_counter()
+            
+            module = importlib.import_module(name)
+            
+            import_times.setdefault(name, time.perf_counter() - started)
+            
         
+    
+    return module
+    
 
-    def create_key(self, key_name):
+def profile_startup():
+    
+    #Module load is measured in-process; each provider's SDKs are imported in a fresh
+    #interpreter so shared dependencies are not credited to whichever came first
+    
+    elapsed = time.perf_counter() - _module_started
+    
+    print("\nStartup Profile:\n")
+    print("\tmodule load: {:.1f} ms (budget {:.1f} ms)\n".format(elapsed * 1000, STARTUP_BUDGET * 1000))
+    
+    for platform, modules in PROVIDER_MODULES.items():
         
-        if self.platform == "aws":
+        script = "import time, importlib\nstarted = time.perf_counter()\n"
+        script += "".join("importlib.import_module({!r})\n".format(name) for name in modules)
+        script += "print(time.perf_counter() - started)"
+        
+        result = subprocess.run([sys.executable, "-c", script], stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        
+        if result.returncode == 0:
             
-            client = boto3.client("ec2")
+            print("\t{} SDK import: {:.1f} ms\n".format(platform, float(result.stdout) * 1000))
             
-            keypair = client.create_key_pair(KeyName = key_name)
+        
+        else:
             
-            return keypair["KeyMaterial"]
+            print("\t{} SDK import: failed ({})\n".format(platform, result.stderr.strip().splitlines()[-1]))
             
-        if self.platform == "azu":
-                
-            key = RSA.generate(2048)
-                
-            public_file = open(".ssh/authorized_keys/{}.pem".format(key_name), "wb+")
+        
+    
+    return elapsed <= STARTUP_BUDGET
+    
 
-            pubkey = key.publickey()
-            key_data = pubkey.exportKey("OpenSSH")
-            public_file.write(key_data)
-            public_file.close()
-                
-            return key.exportKey("PEM").decode("UTF-8")
-                
+#----------------------------------------------------------------------------------------
+
+#In-memory stand-in for googleapiclient's discovery cache, so the compute discovery
+#document is fetched and parsed at most once per process
+
+class DiscoveryCache(object):
+    
+    def __init__(self):
+        
+        self._documents = {}
+        self._lock = threading.Lock()
+        
+    
+    def get(self, url):
+        
+        with self._lock:
+            
+            return self._documents.get(url)
+            
+        
+    
+    def set(self, url, content):
+        
+        with self._lock:
+            
+            self._documents[url] = content
             
         
+    
 
-    def launch_instance(self, specifications = []):
+def _credential_key(credentials):
+    
+    try:
         
-        if self.platform == "aws":
+        hash(credentials)
+        
+        return credentials
+        
+    
+    except TypeError:
+        
+        return id(credentials)
+        
+    
+
+#Credentials resolved once per provider and account and shared by every client built
+#from them. Access tokens are refreshed on a background thread margin seconds before
+#they expire, so no worker blocks on a token endpoint. With a path, GCP and Azure tokens
+#are also kept in that file (owner-readable only) and a process adopts a token another
+#one refreshed instead of fetching its own. AWS keys stay with botocore, which keeps
+#its own cache of assumed-role credentials.
+
+CREDENTIAL_MARGIN = 300.0
+
+#Seconds before a failed refresh is tried again
+
+CREDENTIAL_RETRY = 30.0
+
+GCP_SCOPES = ["https://www.googleapis.com/auth/compute"]
+
+AZURE_RESOURCE = "https://management.core.windows.net/"
+
+class _AzureToken(object):
+    
+    #msrest credentials that sign each request with the cached token
+    
+    def __init__(self, cache, key):
+        
+        self.cache = cache
+        self.key = key
+        
+    
+    def signed_session(self, session = None):
+        
+        session = session if session is not None else _require("requests").Session()
+        
+        session.headers["Authorization"] = "Bearer " + self.cache.token(self.key)
+        
+        return session
+        
+    
+
+class CredentialCache(object):
+    
+    def __init__(self, path = None, margin = CREDENTIAL_MARGIN, background = True):
+        
+        self.path = path
+        self.margin = margin
+        self.background = background
+        
+        #{key : {"resolved", "value", "refresh", "adopt", "token", "expires", "retry", "lock"}}
+        
+        self._entries = {}
+        
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        
+        #Entries refresh under their own locks, so writes to the shared file take this one
+        
+        self._write_lock = threading.Lock()
+        
+        self.resolves = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.write_failures = 0
+        self.shared = 0
+        
+    
+    def aws_session(self, profile = None):
+        
+        #One boto3 session per profile; clients pick their region, so every region
+        #shares the credentials the session resolved
+        
+        def resolve():
             
-            ec2 = boto3.resource("ec2")
-            client = boto3.client("ec2")
+            session = _require("boto3").session.Session(profile_name = profile)
             
-            response = ec2.create_instances(
-                
-                ImageId = specifications["IMAGE_ID"],
-                InstanceType = specifications["INSTANCE_TYPE"],
-                
-                MinCount = specifications["MIN_COUNT"],
-                MaxCount = specifications["MAX_COUNT"],
-                
-                KeyName = specifications["KEY_NAME"],
-                
-                BlockDeviceMappings = [
-                    
-                    {
-                        
-                        "DeviceName" : specifications["DEVICE_NAME"],
-                        
-                        "Ebs" : {
-                            
-                            "VolumeType" : specifications["VOLUME_TYPE"],
-                            "VolumeSize" : specifications["VOLUME_SIZE"],
-                            
-                            "DeleteOnTermination" : specifications["BLOCK_DELETE_ON_TERMINATION"],
-                            "Encrypted" : specifications["ENCRYPTED"]
-                            
-                        }
-                        
-                    }
-                    
-                ],
-                
-                NetworkInterfaces = [
-                    
-                    {
-                        
-                        "AssociatePublicIpAddress" : specifications["ASSOCIATE_PUBLIC_IP_ADDRESS"],
-                        "DeleteOnTermination" : specifications["NETWORK_DELETE_ON_TERMINATION"],
-                        
-                        "DeviceIndex" : specifications["DEVICE_INDEX"]
-                        
-                    }
-                    
-                ]
-                
-            )
+            credentials = session.get_credentials()
             
-            instance = client.describe_instances(
+            if credentials is None or not hasattr(credentials, "refresh_needed"):
                 
-                InstanceIds = [
-                    
-                    response[0].id
-                    
-                ]
+                return session, None, None
                 
-            )
-            
-            return instance
-            
-        
-        if self.platform == "gcp":
             
-            compute = discovery.build("compute","v1")
-            
-            config = {
+            def refresh():
                 
-                "name" : specifications["INSTANCE_NAME"],
+                #Refreshes in place when inside botocore's own refresh window
                 
-                "machineType" : specifications["MACHINE_TYPE"],
+                credentials.get_frozen_credentials()
                 
-                "disks" : [
-                    {
-                        'boot': True,
-                        'autoDelete': True,
-                        'initializeParams': {
-                            'sourceImage': specifications["DISK_SOURCE_IMAGE"],
-                            'diskSizeGb' : specifications["DISK_SIZE"]
-                        }
-                    }
-                ],
+                expiry = getattr(credentials, "_expiry_time", None)
+                
+                return None, expiry.timestamp() if expiry is not None else None
                 
-                "networkInterfaces": [
-                    {
-                        "network" : specifications["NETWORK"],
-                        "accessConfigs" : [
-                            {"type" : specifications["NETWORK_TYPE"]}
-                        ]
-                    }
-                ]
             
-            }
+            return session, refresh, None
             
-            return compute.instances().insert(project=specifications["PROJECT"],zone=specifications["ZONE"],body=config).execute()
-         
         
-        if self.platform == "azu":
+        return self._get(("aws", profile or "default"), resolve)
+        
+    
+    def gcp_credentials(self, credentials = None):
+        
+        #Application default credentials unless a credentials object is given
+        
+        def resolve():
             
-            compute_client = get_client_from_cli_profile(ComputeManagementClient)
-            network_client = get_client_from_cli_profile(NetworkManagementClient)
+            resolved = credentials
             
-            ip = network_client.public_ip_addresses.create_or_update(specifications["GROUP_NAME"], specifications["IP_ADDRESS_NAME"], {
+            if resolved is None:
                 
-                "location" : specifications["LOCATION"],
-                "public_ip_allocation_method" : "Dynamic"
+                resolved, project = _require("google.auth").default(scopes = GCP_SCOPES)
                 
-            })
             
-            nic_create = network_client.network_interfaces.create_or_update(specifications["GROUP_NAME"], specifications["NIC_NAME"], {
+            if not hasattr(resolved, "refresh"):
                 
-                "location" : specifications["LOCATION"],
-                "ip_configurations" : [{
-                    
-                    "name" : specifications["NIC_IP_CONFIG"],
-                    
-                    "public_ip_address" : network_client.public_ip_addresses.get(
-                        
-                        specifications["GROUP_NAME"],
-                        specifications["IP_ADDRESS_NAME"]
-                        
-                    ),
-                    
-                    "subnet" : {
-                        
-                        "id" : network_client.subnets.get(
-                        
-                            specifications["GROUP_NAME"],
-                            specifications["VNET_NAME"],
-                            specifications["SUBNET_NAME"]
-                        
-                        ).id
-                        
-                    }
-                    
-                }]
+                return resolved, None, None
                 
-            })
             
-            vm_parameters = {
-                
-                "location": specifications["LOCATION"],
-                
-                "os_profile": {
-                    
-                    "computer_name": specifications["VM_NAME"],
-                    
-                    "admin_username": "userlogin",
-                    
-                    "linux_configuration": {
-                        
-                        "disable_password_authentication": True,
-                        
-                        "ssh": {
-                            
-                            "public_keys": [{
-                                
-                                "path": "/home/userlogin/.ssh/authorized_keys",
-                                "key_data": open(".ssh/authorized_keys/{}.pem".format(specifications["PUBLIC_KEY_NAME"]),"r").read()
-                                
-                            }]
-                            
-                        }
-                        
-                    }
-                    
-                },
+            def refresh():
                 
-                "hardware_profile": {
-                    
-                    "vm_size": specifications["VM_SIZE"]
-                    
-                },
+                resolved.refresh(_require("google_auth_httplib2").Request(_require("httplib2").Http()))
                 
-                "storage_profile": {
-                    
-                    "image_reference": {
-                        
-                        "publisher": specifications["IMAGE_PUBLISHER"],
-                        "offer": specifications["IMAGE_OFFER"],
-                        "sku": specifications["IMAGE_SKU"],
-                        "version": specifications["IMAGE_VERSION"]
-                        
-                    },
-                    
-                },
+                return resolved.token, self._epoch(resolved.expiry)
                 
-                "network_profile": {
+            
+            def adopt(token, expires):
                 
-                    "network_interfaces": [{
-                        
-                        "id": network_client.network_interfaces.get(specifications["GROUP_NAME"], specifications["NIC_NAME"]).id,
-                        
-                    }]
-                    
-                },
+                resolved.token = token
+                resolved.expiry = self._utc(expires)
                 
-            }
             
-            build = compute_client.virtual_machines.create_or_update(specifications["GROUP_NAME"], specifications["VM_NAME"], vm_parameters)
+            return resolved, refresh, adopt
             
-            return build.result()
-            
-
-    def stop_instance(self, instanceId, group = "", area = ""):
         
-        if self.platform == "aws":
-            
-            client = boto3.client("ec2")
-            
-            client.stop_instances(
-                
-                InstanceIds = [
-                    
-                    instanceId
-                    
-                ],
-                
-            )
-          
+        account = getattr(credentials, "service_account_email", None) or getattr(credentials, "client_id", None) or _credential_key(credentials) or "default"
         
-        if self.platform == "gcp":
+        return self._get(("gcp", account), resolve)
+        
+    
+    def azure_credentials(self, subscription = None):
+        
+        #(credentials, subscription ID) from the Azure CLI login; the CLI is asked for a
+        #token only when the cached one is about to expire
+        
+        key = ("azu", subscription or "default")
+        
+        def resolve():
             
-            compute = discovery.build("compute","v1")
+            #The first token comes with the subscription it belongs to
             
-            compute.instances().stop(
-                
-                project = group,
+            first = [self._azure_cli_token(subscription)]
+            
+            def refresh():
                 
-                zone = area,
+                account = first.pop() if first else self._azure_cli_token(subscription)
                 
-                instance = instanceId
+                return account["accessToken"], account.get("expires_on") or time.mktime(time.strptime(account["expiresOn"][:19], "%Y-%m-%d %H:%M:%S"))
                 
-            ).execute()
-            
-        
-        if self.platform == "azu":
-            
-            compute_client = get_client_from_cli_profile(ComputeManagementClient)
             
-            compute_client.virtual_machines.power_off(group, instanceId)
+            return (_AzureToken(self, key), subscription or first[0]["subscription"]), refresh, lambda token, expires: None
             
         
+        return self._get(key, resolve)
+        
     
-    def start_instance(self, instanceId, group = "", area = ""):
+    @staticmethod
+    def _azure_cli_token(subscription):
         
-        if self.platform == "aws":
-            
-            client = boto3.client("ec2")
-            
-            client.start_instances(
-                
-                InstanceIds = [
-                    
-                    instanceId
-                    
-                ]
-                
-            )
-            
+        command = ["az", "account", "get-access-token", "--resource", AZURE_RESOURCE, "--output", "json"]
         
-        if self.platform == "gcp":
-            
-            compute = discovery.build("compute","v1")
+        if subscription:
             
-            compute.instances().start(
-                
-                project = group,
-                
-                zone = area,
-                
-                instance = instanceId
-                
-            ).execute()
+            command += ["--subscription", subscription]
             
         
-        if self.platform == "azu":
-            
-            compute_client = get_client_from_cli_profile(ComputeManagementClient)
+        #az is a script on Windows, so it runs through the shell there
+        
+        result = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, shell = os.name == "nt")
+        
+        if result.returncode != 0:
             
-            compute_client.virtual_machines.start(group, instanceId)
+            raise RuntimeError("az account get-access-token failed: {}".format(result.stderr.strip()))
             
         
-
-    def terminate_instance(self, instanceId = "", group = "", area = "", nic_name = "" , ip_name = "", key_name = ""):
+        return json.loads(result.stdout)
         
-        if self.platform == "aws":
+    
+    @staticmethod
+    def _epoch(expiry):
+        
+        #google-auth keeps expiry as a naive UTC datetime
+        
+        return None if expiry is None else importlib.import_module("calendar").timegm(expiry.utctimetuple())
+        
+    
+    @staticmethod
+    def _utc(expires):
+        
+        datetime = importlib.import_module("datetime")
+        
+        return datetime.datetime.fromtimestamp(expires, datetime.timezone.utc).replace(tzinfo = None)
+        
+    
+    def token(self, key):
+        
+        entry = self._entries[key]
+        
+        self._ensure(key, entry)
+        
+        return entry["token"]
+        
+    
+    def _get(self, key, resolve):
+        
+        #The cache lock only finds or adds the entry; resolving (a CLI subprocess, a
+        #metadata lookup) holds just that entry's lock, so other accounts go on
+        
+        with self._lock:
+            
+            entry = self._entries.setdefault(key, {"resolved" : False, "value" : None, "refresh" : None, "adopt" : None, "token" : None, "expires" : None, "retry" : 0.0, "lock" : threading.Lock()})
             
-            client = boto3.client("ec2")
+        
+        created = False
+        
+        if not entry["resolved"]:
             
-            client.terminate_instances(
+            with entry["lock"]:
                 
-                InstanceIds = [
+                if not entry["resolved"]:
                     
-                    instanceId
+                    entry["value"], entry["refresh"], entry["adopt"] = resolve()
+                    entry["resolved"] = created = True
+                    
+                    self.resolves += 1
                     
-                ],
                 
-            )
-
-            if key_name != "":
-
-                client.delete_key_pair(KeyName=key_name)
             
         
-        if self.platform == "gcp":
+        if entry["refresh"] is not None:
+            
+            self._ensure(key, entry)
             
-            compute = discovery.build("compute","v1")
+            #The refresh thread may be asleep until a later expiry than this one
             
-            compute.instances().delete(
+            if created:
                 
-                project = group,
+                self._start()
+                self._wake.set()
                 
-                zone = area,
+            
+        
+        return entry["value"]
+        
+    
+    def _stale(self, entry):
+        
+        return entry["expires"] is None or entry["expires"] - time.time() < self.margin
+        
+    
+    def _ensure(self, key, entry):
+        
+        #Only the first caller to find the token stale refreshes it; the others wait
+        #for that refresh instead of starting their own
+        
+        if not self._stale(entry):
+            
+            return
+            
+        
+        with entry["lock"]:
+            
+            if self._stale(entry):
                 
-                instance = instanceId
+                self._refresh(key, entry)
                 
-            ).execute()
             
         
-        if self.platform == "azu":
+    
+    def _refresh(self, key, entry):
+        
+        #Called with the entry lock held
+        
+        shared = self._read(key) if entry["adopt"] is not None else None
+        
+        if shared is not None and shared["expires"] - time.time() > self.margin:
             
-            compute_client = get_client_from_cli_profile(ComputeManagementClient)
-            network_client = get_client_from_cli_profile(NetworkManagementClient)
+            entry["adopt"](shared["token"], shared["expires"])
             
-            print("\nDeleting VM...")
-            compute_client.virtual_machines.delete(group, instanceId).wait()
+            entry["token"], entry["expires"] = shared["token"], shared["expires"]
             
-            print("Deleting NIC...")
-            network_client.network_interfaces.delete(group, nic_name).wait()
+            self.shared += 1
             
-            print("Deleting Public IP...")
-            network_client.public_ip_addresses.delete(group, ip_name).wait()
+            return
             
-            if key_name != "":
+        
+        try:
             
-                os.remove(".ssh/authorized_keys/{}.pem".format(key_name))
+            token, expires = entry["refresh"]()
+            
+        
+        except Exception:
+            
+            self.refresh_failures += 1
+            
+            entry["retry"] = time.time() + CREDENTIAL_RETRY
+            
+            raise
+            
+        
+        entry["token"], entry["expires"] = token, expires
+        
+        self.refreshes += 1
+        
+        if entry["adopt"] is not None and token is not None and expires is not None:
+            
+            self._write(key, token, expires)
             
         
-
-#-----------------------------------------------#
-#              ______   __  __    ____          #
-#             / ____/  / / / /   /  _/          #
-#            / / __   / / / /    / /            #
-#           / /_/ /  / /_/ /   _/ /             #
-#           \____/   \____/   /___/             #
-#                                               #
-#-----------------------------------------------#
-
-dictionary_one = {"1" : "aws", "2" : "gcp", "3" : "azu"}
-dictionary_two = {"aws" : "Amazon Web Services", "gcp" : "Google Cloud Platform", "azu" : "Microsoft Azure"}
-dictionary_three = {"1" : "launch", "2" : "stop", "3" : "start", "4" : "terminate", "5" : "back"}
-dictionary_four = {"1" : "list", "2" : "change", "3" : "back"}
-    
-print("\033c", end = "")
-
-while True:
-    
-    print("\nSelect a Cloud Service Provider:\n")
-    print("\t1: Amazon Web Services\n")
-    print("\t2: Google Cloud Platform\n")
-    print("\t3: Microsoft Azure\n")
-    print("\t4: Specifications\n")
-    print("\t5: Exit\n")
     
-    provider = input(" :")
+    def _file_key(self, key):
+        
+        return "{}:{}".format(*key)
+        
     
-    try:
+    def _read(self, key):
         
-        if provider == "4":
+        if self.path is None:
             
-            print("\033c", end = "Specifications\n")
+            return None
             
-            while True:
+        
+        try:
+            
+            with open(self.path) as cache_file:
                 
-                print("\nChoose an Option:\n")
-                print("\t1: List Specifications\n")
-                print("\t2: Change Specifications\n")
-                print("\t3: Back\n")
+                return json.load(cache_file).get(self._file_key(key))
                 
-                selection = input(" :")
+            
+        
+        except (OSError, ValueError):
+            
+            return None
+            
+        
+    
+    def _write(self, key, token, expires):
+        
+        if self.path is None:
+            
+            return
+            
+        
+        #Read-modify-rename: readers see the old file or the new one, never a torn one.
+        #Sharing is best-effort; the token is already in memory, so a failed write
+        #never fails the refresh.
+        
+        partial = "{}.{}.{}.tmp".format(self.path, os.getpid(), threading.get_ident())
+        
+        with self._write_lock:
+            
+            try:
                 
-                if dictionary_four[selection] == "list":
+                try:
                     
-                    for i in range(len(mySpecs)):
-                        
-                        print("\033c", end = dictionary_two[dictionary_one[str(i+1)]] + "\n\n\n")
-                        
-                        for keys, values in mySpecs[i].items():
-                            
-                            print(str(keys) + " : " + str(values))
-                            
+                    with open(self.path) as cache_file:
                         
-                        input("\n\nPress 'Enter' to Continue...")
-                        
-                        print("\033c", end = "")
+                        tokens = json.load(cache_file)
                         
                     
-                    print("\033c", end = "Specifications\n")
+                
+                except (OSError, ValueError):
+                    
+                    tokens = {}
                     
                 
-                elif dictionary_four[selection] == "change":
+                now = time.time()
+                
+                tokens = {name : shared for name, shared in tokens.items() if shared.get("expires", 0) > now}
+                tokens[self._file_key(key)] = {"token" : token, "expires" : expires}
+                
+                with os.fdopen(os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as cache_file:
                     
-                    print("\033c", end = "Specifications\n")
+                    json.dump(tokens, cache_file)
                     
-                    print("\nChoose a Cloud Provider:\n")
-                    print("\t1: Amazon Web Services\n")
-                    print("\t2: Google Cloud Platform\n")
-                    print("\t3: Microsoft Azure\n")
-                    print("\t4: Back\n")
+                
+                os.replace(partial, self.path)
+                
+            
+            except (OSError, TypeError, ValueError) as error:
+                
+                self.write_failures += 1
+                
+                log.warning("could not write token cache %s: %s", self.path, error)
+                
+                try:
                     
-                    choice = input(" :")
+                    os.remove(partial)
                     
-                    print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                
+                except OSError:
                     
-                    if dictionary_one[choice] == "aws":
-                        
-                        while True:
-                        
-                            for keys, values in mySpecs[0].items():
-                                
-                                print(str(keys) + " : " + str(values))
-                                
-                            
-                            change = input("\n\nChange a value? (y/n): ")
-                            
-                            if change == "y":
-                                
-                                name_of_key = input("\nName of Key: ")
-                                name_of_value = input("New Value: ")
-                                
-                                mySpecs[0][name_of_key] = name_of_value
-                                
-                                print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
-                                
-                            
-                            elif change == "n":
-                                
-                                print("\033c", end = "Specifications\n")
-                                
-                                break
-                                
-                            
-                            else:
-                                
-                                print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
-                                
-                            
-                        
+                    pass
                     
-                    elif dictionary_one[choice] == "gcp":
-                        
-                        while True:
+                
+            
+        
+        
+    
+    def _start(self):
+        
+        with self._lock:
+            
+            if self.background and self._thread is None and not self._closed:
+                
+                self._thread = threading.Thread(target = self._run, name = "credential-refresh", daemon = True)
+                self._thread.start()
+                
+            
+        
+    
+    def _run(self):
+        
+        while True:
+            
+            with self._lock:
+                
+                if self._closed:
+                    
+                    return
+                    
+                
+                due = [(max(entry["expires"] - self.margin, entry["retry"]), key, entry) for key, entry in self._entries.items() if entry["refresh"] is not None and entry["expires"] is not None]
+                
+            
+            now = time.time()
+            
+            for when, key, entry in due:
+                
+                if when <= now:
+                    
+                    with entry["lock"]:
                         
-                            for keys, values in mySpecs[1].items():
-                                
-                                print(str(keys) + " : " + str(values))
-                                
-                            
-                            change = input("\n\nChange a value? (y/n): ")
-                            
-                            if change == "y":
-                                
-                                name_of_key = input("\nName of Key: ")
-                                name_of_value = input("New Value: ")
-                                
-                                mySpecs[1][name_of_key] = name_of_value
-                                
-                                print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
-                                
-                            
-                            elif change == "n":
-                                
-                                print("\033c", end = "Specifications\n")
-                                
-                                break
-                                
+                        try:
                             
-                            else:
+                            if self._stale(entry):
                                 
-                                print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                self._refresh(key, entry)
                                 
                             
                         
-                    
-                    elif dictionary_one[choice] == "azu":
-                        
-                        while True:
-                        
-                            for keys, values in mySpecs[2].items():
-                                
-                                print(str(keys) + " : " + str(values))
-                                
-                            
-                            change = input("\n\nChange a value? (y/n): ")
-                            
-                            if change == "y":
-                                
-                                name_of_key = input("\nName of Key: ")
-                                name_of_value = input("New Value: ")
-                                
-                                mySpecs[2][name_of_key] = name_of_value
-                                
-                                print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
-                                
+                        except Exception:
                             
-                            elif change == "n":
-                                
-                                print("\033c", end = "Specifications\n")
-                                
-                                break
-                                
+                            #Counted; the next use or the retry deadline tries again
                             
-                            else:
-                                
-                                print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
-                                
+                            pass
                             
                         
                     
-                    elif dictionary_one[choice] == "back":
-                        
-                        pass
-                        
-                    
-                
-                elif dictionary_four[selection] == "back":
-                    
-                    print("\033c", end = "")
-                    
-                    break
-                    
                 
             
+            pending = [when for when, key, entry in due if when > now]
+            
+            self._wake.wait(min(pending) - now if pending else None)
+            self._wake.clear()
+            
+        
+    
+    def stats(self):
         
-        elif provider == "5":
+        return {"resolves" : self.resolves, "refreshes" : self.refreshes, "refresh_failures" : self.refresh_failures, "write_failures" : self.write_failures, "shared" : self.shared, "entries" : len(self._entries)}
+        
+    
+    def clear(self):
+        
+        with self._lock:
             
-            print("\033c", end = "")
+            self._entries.clear()
             
-            break
+        
+    
+    def close(self):
+        
+        with self._lock:
+            
+            self._closed = True
+            
+        
+        self._wake.set()
+        
+    
+
+#Shared by every pool that is not handed a cache of its own
+
+default_credentials = CredentialCache()
+
+#Registry of SDK clients keyed by (platform, kind, region, credentials). Each client is
+#built once and reused; kinds whose SDK objects are not thread-safe (boto3 resources,
+#httplib2-backed discovery services) are kept one per thread instead.
+
+class ClientPool(object):
+    
+    THREAD_LOCAL_KINDS = {("aws", "resource"), ("gcp", "compute")}
+    
+    def __init__(self, factories = None, credential_cache = None):
+        
+        self.discovery_cache = DiscoveryCache()
+        self.credential_cache = credential_cache if credential_cache is not None else default_credentials
+        
+        self._factories = {
+            
+            ("aws", "client") : self._aws_client,
+            ("aws", "resource") : self._aws_resource,
+            ("gcp", "compute") : self._gcp_compute,
+            ("azu", "compute") : self._azure_compute,
+            ("azu", "network") : self._azure_network
+            
+        }
+        
+        if factories:
+            
+            self._factories.update(factories)
+            
+        
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        
+        #One build lock per platform: a slow login for one provider does not hold up
+        #clients of another
+        
+        self._build_locks = {}
+        
+    
+    def _build_lock(self, platform):
+        
+        with self._lock:
+            
+            return self._build_locks.setdefault(platform, threading.Lock())
+            
+        
+    
+    def get(self, platform, kind, region = None, credentials = None):
+        
+        key = (platform, kind, region, _credential_key(credentials))
+        
+        if (platform, kind) in self.THREAD_LOCAL_KINDS:
+            
+            clients = self._local.__dict__.setdefault("clients", {})
             
         
         else:
             
-            cloud = Cloud(dictionary_one[provider])
+            clients = self._clients
             
-            print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+        
+        client = clients.get(key)
+        
+        if client is None:
             
-            while True:
+            with self._build_lock(platform):
                 
-                print("\nChoose an Option:\n")
-                print("\t1: Launch Instance\n")
-                print("\t2: Stop Instance\n")
-                print("\t3: Start Instance\n")
-                print("\t4: Terminate Instance\n")
-                print("\t5: Back\n")
+                client = clients.get(key)
                 
-                selection = input(" :")
-                
-                if dictionary_three[selection] == "launch":
+                if client is None:
                     
-                    print("\033c", end = "")
+                    client = self._factories[(platform, kind)](region, credentials)
                     
-                    while True:
+                    with self._lock:
                         
-                        new_key = input("\nCreate New Key? (y/n): ")
+                        clients[key] = client
                         
-                        if new_key == "y":
-                            
-                            response = cloud.create_key(input("\nEnter Key Name: "))
+                    
+                
+            
+        
+        return client
+        
+    
+    def clear(self):
+        
+        with self._lock:
+            
+            self._clients.clear()
+            self._local = threading.local()
+            
+        
+    
+    #Factories are called with their platform's build lock held, so one boto3 session
+    #never builds two clients at once
+    
+    def _aws_client(self, region, credentials):
+        
+        return self.credential_cache.aws_session(credentials).client("ec2", region_name = region)
+        
+    
+    def _aws_resource(self, region, credentials):
+        
+        return self.credential_cache.aws_session(credentials).resource("ec2", region_name = region)
+        
+    
+    def _gcp_compute(self, region, credentials):
+        
+        #Every thread's service wraps the same credentials, so one token serves them all
+        
+        return _require("googleapiclient.discovery").build("compute", "v1", credentials = self.credential_cache.gcp_credentials(credentials), cache = self.discovery_cache)
+        
+    
+    def _azure_client(self, client_class, credentials):
+        
+        #credentials is a subscription ID, or None for the CLI's current subscription
+        
+        token, subscription = self.credential_cache.azure_credentials(credentials)
+        
+        return client_class(token, subscription)
+        
+    
+    def _azure_compute(self, region, credentials):
+        
+        return self._azure_client(_require("azure.mgmt.compute").ComputeManagementClient, credentials)
+        
+    
+    def _azure_network(self, region, credentials):
+        
+        return self._azure_client(_require("azure.mgmt.network").NetworkManagementClient, credentials)
+        
+    
+
+#Shared by every Cloud that is not handed a pool of its own
+
+default_pool = ClientPool()
+
+#Largest number of instance IDs each provider accepts in one stop/start/terminate call
+#(for GCP, calls packed into one batch HTTP request)
+
+BATCH_LIMITS = {"aws" : 1000, "gcp" : 1000, "azu" : 1}
+
+#State each action leaves an instance in, in EC2 terms
+
+TARGET_STATES = {"launch" : "running", "stop" : "stopped", "start" : "running", "terminate" : "terminated"}
+
+#State an instance is in while each action is underway
+
+INTERIM_STATES = {"launch" : "pending", "stop" : "stopping", "start" : "pending", "terminate" : "shutting-down"}
+
+#Specification keys that name a single GCP or Azure resource and so must differ between
+#copies of a specification (AWS launches many copies from one request)
+
+NAME_FIELDS = {"aws" : (), "gcp" : ("INSTANCE_NAME",), "azu" : ("VM_NAME", "NIC_NAME", "IP_ADDRESS_NAME")}
+
+def unique_names(platform, specifications, suffix):
+    
+    #Overrides that give one copy of a specification its own resource names
+    
+    return {field : "{}-{}".format(specifications[field], suffix) for field in NAME_FIELDS[platform]}
+    
+
+#Upper bound on concurrent control-plane calls made by the bulk methods
+
+MAX_WORKERS = 16
+
+def _chunked(items, size):
+    
+    for i in range(0, len(items), size):
+        
+        yield items[i:i + size]
+        
+    
+
+def _failure(error):
+    
+    return {"ok" : False, "error" : "{}: {}".format(type(error).__name__, error)}
+    
+
+def _bounded_map(function, items, max_workers):
+    
+    #Yield (item, future) pairs as they finish, pulling items lazily so that no more
+    #than twice max_workers of them are held at once
+    
+    items = iter(items)
+    
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        
+        pending = {}
+        
+        while True:
+            
+            for item in items:
+                
+                pending[executor.submit(function, item)] = item
+                
+                if len(pending) >= max_workers * 2:
+                    
+                    break
+                    
+                
+            
+            if not pending:
+                
+                break
+                
+            
+            finished, _ = futures_wait(pending, return_when = FIRST_COMPLETED)
+            
+            for future in finished:
+                
+                yield pending.pop(future), future
+                
+            
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Sustained requests per second and burst size allowed per (platform, API family). The
+#families follow how the providers meter their control planes: reads, mutating calls
+#and instance creation are throttled separately.
+
+RATE_LIMITS = {
+    
+    ("aws", "describe") : (20.0, 100), ("aws", "mutate") : (5.0, 200), ("aws", "launch") : (2.0, 5),
+    ("gcp", "describe") : (20.0, 50), ("gcp", "mutate") : (10.0, 20), ("gcp", "launch") : (5.0, 10),
+    ("azu", "describe") : (3.0, 50), ("azu", "mutate") : (1.0, 20), ("azu", "launch") : (1.0, 10)
+    
+}
+
+#Error codes the providers use to say "slow down"
+
+THROTTLE_CODES = {"RequestLimitExceeded", "Throttling", "ThrottlingException", "RequestThrottled", "TooManyRequestsException", "rateLimitExceeded", "userRateLimitExceeded"}
+
+class TokenBucket(object):
+    
+    def __init__(self, rate, burst):
+        
+        self.rate = rate
+        self.burst = burst
+        
+        self.tokens = float(burst)
+        self.waiting = 0
+        
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        
+    
+    def take(self, count = 1):
+        
+        #Takes count tokens if they are there and returns 0, otherwise returns the seconds
+        #until they will be. A count above the burst waits for a full bucket and leaves
+        #the rest as debt, so later callers pay for it.
+        
+        with self._lock:
+            
+            now = time.monotonic()
+            
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            
+            needed = min(count, self.burst)
+            
+            if self.tokens >= needed:
+                
+                self.tokens -= count
+                
+                return 0.0
+                
+            
+            return (needed - self.tokens) / self.rate
+            
+        
+    
+    def acquire(self, count = 1):
+        
+        with self._lock:
+            
+            self.waiting += 1
+            
+        
+        try:
+            
+            pause = self.take(count)
+            
+            while pause:
+                
+                time.sleep(pause)
+                
+                pause = self.take(count)
+                
+            
+        
+        finally:
+            
+            with self._lock:
+                
+                self.waiting -= 1
+                
+            
+        
+    
+
+def _asyncio():
+    
+    #asyncio is only imported by the coroutine API, so blocking callers never load it
+    
+    return importlib.import_module("asyncio")
+    
+
+def _throttled(error):
+    
+    #Duck-typed over botocore ClientError, googleapiclient HttpError and Azure's
+    #CloudError/HttpResponseError. Returns (throttled, seconds the provider asked for).
+    
+    headers = {}
+    
+    response = getattr(error, "response", None)
+    
+    if isinstance(response, dict):
+        
+        code = response.get("Error", {}).get("Code", "")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        
+    
+    elif response is not None:
+        
+        code = ""
+        status = getattr(response, "status_code", None)
+        headers = getattr(response, "headers", None) or {}
+        
+    
+    else:
+        
+        resp = getattr(error, "resp", None)
+        
+        code = ""
+        status = getattr(resp, "status", None)
+        headers = resp or {}
+        
+    
+    status = getattr(error, "status_code", None) or status
+    
+    content = getattr(error, "content", b"") or b""
+    
+    if isinstance(content, bytes):
+        
+        content = content.decode("utf-8", "replace")
+        
+    
+    throttled = code in THROTTLE_CODES or status == 429 or status == 403 and any(reason in content for reason in THROTTLE_CODES)
+    
+    retry_after = None
+    
+    for name in ("Retry-After", "retry-after"):
+        
+        if name in headers:
+            
+            try:
+                
+                retry_after = float(headers[name])
+                
+            
+            except (TypeError, ValueError):
+                
+                pass
+                
+            
+        
+    
+    return throttled, retry_after
+    
+
+#Every control-plane call made by Cloud goes through one of these: it takes a token
+#from the bucket for its platform and API family, and retries throttled calls with
+#exponential backoff and jitter, honoring Retry-After when the provider sends one.
+#Callers attach idempotency tokens before the first attempt so a retry can never
+#repeat a launch.
+
+class Scheduler(object):
+    
+    def __init__(self, limits = None, retries = 6, base_delay = 0.5, max_delay = 30.0):
+        
+        self.limits = dict(RATE_LIMITS)
+        self.limits.update(limits or {})
+        
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self._buckets = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        
+    
+    def _bucket(self, key):
+        
+        with self._lock:
+            
+            if key not in self._buckets:
+                
+                rate, burst = self.limits.get(key, (10.0, 10))
+                
+                self._buckets[key] = TokenBucket(rate, burst)
+                self._counters[key] = {"calls" : 0, "throttled" : 0, "retries" : 0, "failed" : 0}
+                
+            
+            return self._buckets[key]
+            
+        
+    
+    def _count(self, key, counter, amount = 1):
+        
+        with self._lock:
+            
+            self._counters[key][counter] += amount
+            
+        
+    
+    def call(self, platform, family, function, *args, **kwargs):
+        
+        return self.call_batch(platform, family, 1, function, *args, **kwargs)
+        
+    
+    def call_batch(self, platform, family, calls, function, *args, **kwargs):
+        
+        #call() for a request that carries several API calls, such as a GCP batch:
+        #the provider meters each inner call, so each one takes a token and is counted
+        
+        key = (platform, family)
+        
+        bucket = self._bucket(key)
+        
+        for attempt in range(self.retries + 1):
+            
+            bucket.acquire(calls)
+            
+            self._count(key, "calls", calls)
+            
+            try:
+                
+                return function(*args, **kwargs)
+                
+            
+            except Exception as error:
+                
+                throttled, retry_after = _throttled(error)
+                
+                if not throttled or attempt == self.retries:
+                    
+                    self._count(key, "failed")
+                    
+                    raise
+                    
+                
+                self._count(key, "throttled")
+                self._count(key, "retries")
+                
+                backoff = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                
+                time.sleep(max(backoff, retry_after or 0.0))
+                
+            
+        
+    
+    async def call_async(self, platform, family, function, *args, **kwargs):
+        
+        #call() for coroutine functions: waits for tokens and backs off on the event
+        #loop, against the same buckets and counters as the blocking calls
+        
+        asyncio = _asyncio()
+        
+        key = (platform, family)
+        
+        bucket = self._bucket(key)
+        
+        for attempt in range(self.retries + 1):
+            
+            pause = bucket.take()
+            
+            while pause:
+                
+                await asyncio.sleep(pause)
+                
+                pause = bucket.take()
+                
+            
+            self._count(key, "calls")
+            
+            try:
+                
+                return await function(*args, **kwargs)
+                
+            
+            except Exception as error:
+                
+                throttled, retry_after = _throttled(error)
+                
+                if not throttled or attempt == self.retries:
+                    
+                    self._count(key, "failed")
+                    
+                    raise
+                    
+                
+                self._count(key, "throttled")
+                self._count(key, "retries")
+                
+                backoff = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                
+                await asyncio.sleep(max(backoff, retry_after or 0.0))
+                
+            
+        
+    
+    def stats(self):
+        
+        #Per "platform/family": call, throttle, retry and failure counts, how many
+        #callers are queued on the bucket and how many tokens it holds
+        
+        with self._lock:
+            
+            return {
+                
+                "{}/{}".format(*key) : dict(self._counters[key], waiting = bucket.waiting, tokens = round(bucket.tokens, 2))
+                
+                for key, bucket in self._buckets.items()
+                
+            }
+            
+        
+    
+
+default_scheduler = Scheduler()
+
+#----------------------------------------------------------------------------------------
+
+#Every Cloud operation returns one of these handles right away. A handle never blocks;
+#wait_all() and as_completed() drive any mix of them to completion, polling each kind
+#on its own backoff schedule and letting handles of the same kind share status calls.
+
+class Operation(object):
+    
+    #Seconds between status checks for this kind of handle: first, ceiling, growth
+    
+    poll_interval = (1.0, 20.0, 1.5)
+    
+    def __init__(self, platform, action, ids):
+        
+        self.platform = platform
+        self.action = action
+        self.ids = list(ids)
+        
+        self.done = False
+        self.value = None
+        self.error = None
+        
+        self.started = time.perf_counter()
+        self.finished = None
+        
+        #(stage name, seconds, ok) for handles that run in stages
+        
+        self.steps = []
+        
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+        
+    
+    @classmethod
+    def completed(cls, platform, action, ids, value = None, error = None):
+        
+        operation = cls(platform, action, ids)
+        operation._finish(value, error)
+        
+        return operation
+        
+    
+    def _finish(self, value = None, error = None):
+        
+        #Handles can be finished from worker threads, so finishing and registering
+        #callbacks are serialized
+        
+        with self._callback_lock:
+            
+            if self.done:
+                
+                return
+                
+            
+            self.value = value
+            self.error = error
+            
+            self.finished = time.perf_counter()
+            self.done = True
+            
+        
+        for callback in self._callbacks:
+            
+            self._run_callback(callback)
+            
+        
+    
+    def _run_callback(self, callback):
+        
+        #One failing callback (an inventory write, say) must not keep the others from
+        #running, nor unwind the thread that happened to finish the handle
+        
+        try:
+            
+            callback(self)
+            
+        
+        except Exception:
+            
+            log.exception("done-callback %r failed for %s %s", callback, self.action, self.ids)
+            
+        
+    
+    def add_done_callback(self, callback):
+        
+        #Called with the handle once it finishes, right away if it already has
+        
+        with self._callback_lock:
+            
+            if not self.done:
+                
+                self._callbacks.append(callback)
+                
+                return
+                
+            
+        
+        self._run_callback(callback)
+        
+    
+    def poll(self):
+        
+        pass
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        for operation in operations:
+            
+            try:
+                
+                operation.poll()
+                
+            
+            except Exception as error:
+                
+                operation._finish(error = error)
+                
+            
+        
+    
+    @property
+    def ok(self):
+        
+        return self.done and self.error is None
+        
+    
+    @property
+    def seconds(self):
+        
+        return (self.finished if self.done else time.perf_counter()) - self.started
+        
+    
+    def wait(self, timeout = None):
+        
+        wait_all([self], timeout)
+        
+        return self
+        
+    
+    def result(self, timeout = None):
+        
+        self.wait(timeout)
+        
+        if not self.done:
+            
+            raise TimeoutError("{} {} did not finish within {} seconds".format(self.platform, self.action, timeout))
+            
+        
+        if self.error is not None:
+            
+            raise self.error
+            
+        
+        return self.value
+        
+    
+    def to_dict(self):
+        
+        record = {"platform" : self.platform, "action" : self.action, "ids" : self.ids, "done" : self.done, "ok" : self.ok, "seconds" : round(self.seconds, 3)}
+        
+        if self.error is not None:
+            
+            record["error"] = _failure(self.error)["error"]
+            
+        
+        return record
+        
+    
+    def __repr__(self):
+        
+        return "<{} {} {} {}>".format(type(self).__name__, self.platform, self.action, "done" if self.done else "pending")
+        
+    
+
+#Finishes once every instance reaches the target state. All pending handles that share
+#an EC2 client are checked with one describe_instances call per 1000 IDs.
+
+class AwsOperation(Operation):
+    
+    poll_interval = (2.0, 15.0, 1.5)
+    
+    #States an instance cannot leave on its way to the target
+    
+    DEAD_ENDS = {"running" : {"terminated", "shutting-down"}, "stopped" : {"terminated"}, "terminated" : set()}
+    
+    def __init__(self, client, action, ids, target, scheduler = None):
+        
+        Operation.__init__(self, "aws", action, ids)
+        
+        self.client = client
+        self.target = target
+        
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        
+        self.instances = {}
+        
+    
+    def update(self, descriptions):
+        
+        for instanceId in self.ids:
+            
+            if instanceId in descriptions:
+                
+                self.instances[instanceId] = descriptions[instanceId]
+                
+            
+        
+        states = [self.instances[i]["State"]["Name"] if i in self.instances else None for i in self.ids]
+        
+        for instanceId, state in zip(self.ids, states):
+            
+            if state in self.DEAD_ENDS[self.target]:
+                
+                self._finish(error = RuntimeError("{} is {} while waiting for {}".format(instanceId, state, self.target)))
+                
+                return
+                
+            
+        
+        if all(state == self.target for state in states):
+            
+            self._finish([self.instances[i] for i in self.ids])
+            
+        
+    
+    def poll(self):
+        
+        AwsOperation.poll_many([self])
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        by_client = {}
+        
+        for operation in operations:
+            
+            by_client.setdefault(id(operation.client), []).append(operation)
+            
+        
+        for group in by_client.values():
+            
+            try:
+                
+                descriptions = _aws_describe(group[0].client, [i for operation in group for i in operation.ids], group[0].scheduler)
+                
+            
+            except Exception as error:
+                
+                for operation in group:
+                    
+                    operation._finish(error = error)
+                    
+                
+                continue
+                
+            
+            for operation in group:
+                
+                operation.update(descriptions)
+                
+            
+        
+    
+
+def _aws_describe(client, instanceIds, scheduler):
+    
+    #Describe any number of instances in as few calls as EC2 allows
+    
+    descriptions = {}
+    
+    for chunk in _chunked(sorted(set(instanceIds)), BATCH_LIMITS["aws"]):
+        
+        _aws_describe_chunk(client, chunk, descriptions, scheduler)
+        
+    
+    return descriptions
+    
+
+def _aws_describe_chunk(client, chunk, descriptions, scheduler):
+    
+    try:
+        
+        response = scheduler.call("aws", "describe", client.describe_instances, InstanceIds = chunk)
+        
+    
+    except Exception as error:
+        
+        if "NotFound" not in str(error):
+            
+            raise
+            
+        
+        #IDs that are not visible yet (or no longer) fail the whole call, so split
+        #them away from the rest; a lone missing ID is simply left out
+        
+        if len(chunk) > 1:
+            
+            middle = len(chunk) // 2
+            
+            _aws_describe_chunk(client, chunk[:middle], descriptions, scheduler)
+            _aws_describe_chunk(client, chunk[middle:], descriptions, scheduler)
+            
+        
+        return
+        
+    
+    for reservation in response["Reservations"]:
+        
+        for instance in reservation["Instances"]:
+            
+            descriptions[instance["InstanceId"]] = instance
+            
+        
+    
+
+#Tracks a GCP zone operation until its status is DONE
+
+class GcpOperation(Operation):
+    
+    def __init__(self, compute, project, zone, action, ids, operation, scheduler = None):
+        
+        Operation.__init__(self, "gcp", action, ids)
+        
+        self.compute = compute
+        self.project = project
+        self.zone = zone
+        
+        self.operation = operation
+        
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        
+    
+    def update(self, operation):
+        
+        self.operation = operation
+        
+        if operation.get("status") == "DONE":
+            
+            if "error" in operation:
+                
+                self._finish(operation, RuntimeError(operation["error"].get("errors", operation["error"])))
+                
+            
+            else:
+                
+                self._finish(operation)
+                
+            
+        
+    
+    def _request(self, zone_operations = None):
+        
+        zone_operations = zone_operations or self.compute.zoneOperations()
+        
+        return zone_operations.get(project = self.project, zone = self.zone, operation = self.operation["name"])
+        
+    
+    def poll(self):
+        
+        self.update(self.scheduler.call("gcp", "describe", self._request().execute))
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        #Pending handles that share a compute client and scheduler are checked with one
+        #batch HTTP request per 1000 operations, whatever their zones
+        
+        groups = {}
+        
+        for operation in operations:
+            
+            groups.setdefault((id(operation.compute), id(operation.scheduler)), []).append(operation)
+            
+        
+        for group in groups.values():
+            
+            if len(group) == 1:
+                
+                super(GcpOperation, cls).poll_many(group)
+                
+                continue
+                
+            
+            #Building a resource object walks the discovery document, so it is done once
+            
+            zone_operations = group[0].compute.zoneOperations()
+            
+            try:
+                
+                outcomes = _gcp_batch(group[0].compute, [(operation, operation._request(zone_operations)) for operation in group], group[0].scheduler, "describe")
+                
+            
+            except Exception as error:
+                
+                for operation in group:
+                    
+                    operation._finish(error = error)
+                    
+                
+                continue
+                
+            
+            for operation, (response, error) in outcomes.items():
+                
+                if error is not None:
+                    
+                    operation._finish(error = error)
+                    
+                
+                else:
+                    
+                    operation.update(response)
+                    
+                
+            
+        
+    
+
+#Sends (key, request) pairs from one compute client as batch HTTP requests of up to
+#GCP_BATCH_CALLS calls each and returns {key : (response, error)}. Each call inside a
+#batch succeeds or fails on its own; the ones GCP throttled go again in a later batch
+#with backoff, the rest keep their first outcome.
+
+GCP_BATCH_CALLS = 1000
+
+def _gcp_batch(compute, requests, scheduler, family, execute = None):
+    
+    #execute(batch, calls) sends one batch of calls inner requests
+    
+    if execute is None:
+        
+        execute = lambda batch, calls: scheduler.call_batch("gcp", family, calls, batch.execute)
+        
+    
+    outcomes = {}
+    
+    pending = list(requests)
+    
+    for attempt in range(scheduler.retries + 1):
+        
+        throttled = []
+        retry_after = 0.0
+        
+        for chunk in _chunked(pending, GCP_BATCH_CALLS):
+            
+            replies = {}
+            
+            def reply(request_id, response, error):
+                
+                replies[int(request_id)] = (response, error)
+                
+            
+            batch = compute.new_batch_http_request()
+            
+            for index, (key, request) in enumerate(chunk):
+                
+                batch.add(request, callback = reply, request_id = str(index))
+                
+            
+            execute(batch, len(chunk))
+            
+            for index, (key, request) in enumerate(chunk):
+                
+                response, error = replies.get(index, (None, RuntimeError("no reply in batch response")))
+                
+                outcomes[key] = (response, error)
+                
+                if error is not None and attempt < scheduler.retries:
+                    
+                    limited, seconds = _throttled(error)
+                    
+                    if limited:
+                        
+                        scheduler._count(("gcp", family), "throttled")
+                        scheduler._count(("gcp", family), "retries")
+                        
+                        throttled.append((key, request))
+                        
+                        retry_after = max(retry_after, seconds or 0.0)
+                        
+                    
+                
+            
+        
+        if not throttled:
+            
+            break
+            
+        
+        pending = throttled
+        
+        time.sleep(max(min(scheduler.max_delay, scheduler.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0), retry_after))
+        
+    
+    return outcomes
+    
+
+
+#Runs a chain of Azure long-running operations without blocking. Each stage is called
+#with the previous stage's result and returns a poller (or a plain value, which counts
+#as already finished); the next stage starts once the current poller is done. Azure
+#pollers wait in their own threads, so checking them costs no API calls. Stage calls
+#themselves take a round trip each, so they are submitted on a shared pool rather than
+#made by the thread polling the handles.
+
+AZURE_STAGE_WORKERS = 32
+
+class AzureOperation(Operation):
+    
+    poll_interval = (0.2, 1.0, 1.5)
+    
+    _executor = None
+    _executor_lock = threading.Lock()
+    
+    def __init__(self, action, ids, stages):
+        
+        Operation.__init__(self, "azu", action, ids)
+        
+        self.stages = list(stages)
+        self.step = 0
+        
+        self._submitted = None
+        self._poller = None
+        self._value = None
+        
+        self._step_started = None
+        
+        #Stages are advanced both by pollers and by the pool as submissions finish
+        
+        self._lock = threading.RLock()
+        
+        #Submit the first stage now, like the other providers do
+        
+        self.poll()
+        
+    
+    @classmethod
+    def _stage_pool(cls):
+        
+        with cls._executor_lock:
+            
+            if cls._executor is None:
+                
+                cls._executor = ThreadPoolExecutor(max_workers = AZURE_STAGE_WORKERS)
+                
+            
+            return cls._executor
+            
+        
+    
+    def _advance(self, *finished):
+        
+        #Called back as a submission or a poller finishes, so the next stage starts
+        #without waiting for the next round of polling
+        
+        try:
+            
+            self.poll()
+            
+        
+        except Exception as error:
+            
+            self._finish(error = error)
+            
+        
+    
+    def poll(self):
+        
+        with self._lock:
+            
+            while not self.done:
+                
+                if self._submitted is not None:
+                    
+                    if not self._submitted.done():
+                        
+                        return
+                        
+                    
+                    submitted, self._submitted = self._submitted, None
+                    
+                    try:
+                        
+                        started = submitted.result()
+                        
+                    
+                    except Exception:
+                        
+                        self._end_step(False)
+                        
+                        raise
+                        
+                    
+                    if hasattr(started, "done") and hasattr(started, "result"):
+                        
+                        self._poller = started
+                        
+                        if hasattr(started, "add_done_callback"):
+                            
+                            started.add_done_callback(self._advance)
+                            
+                        
+                    
+                    else:
+                        
+                        self._value = started
+                        
+                        self._end_step(True)
+                        
+                    
+                
+                if self._poller is not None:
+                    
+                    if not self._poller.done():
+                        
+                        return
+                        
+                    
+                    try:
+                        
+                        self._value = self._poller.result()
+                        
+                    
+                    except Exception:
+                        
+                        self._end_step(False)
+                        
+                        raise
+                        
+                    
+                    self._poller = None
+                    
+                    self._end_step(True)
+                    
+                
+                if self.step == len(self.stages):
+                    
+                    self._finish(self._value)
+                    
+                    return
+                    
+                
+                self._step_started = time.perf_counter()
+                
+                self._submitted = self._stage_pool().submit(self.stages[self.step], self._value)
+                
+                self._submitted.add_done_callback(self._advance)
+                
+            
+        
+    
+    def _end_step(self, ok):
+        
+        #Stage timings are only as fine as the polling, which backs off to a second
+        
+        stage = self.stages[self.step]
+        
+        self.steps.append((getattr(stage, "__name__", str(self.step)), time.perf_counter() - self._step_started, ok))
+        
+        self.step += 1
+        
+    
+
+def as_completed(operations, timeout = None):
+    
+    #Yield each handle as it finishes; handles still pending at the timeout are not yielded
+    
+    operations = list({id(operation) : operation for operation in operations}.values())
+    
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    
+    schedule = {}
+    
+    for operation in operations:
+        
+        if operation.done:
+            
+            yield operation
+            
+        
+        else:
+            
+            schedule.setdefault(type(operation), [0.0, operation.poll_interval[0]])
+            
+        
+    
+    pending = [operation for operation in operations if not operation.done]
+    
+    while pending:
+        
+        now = time.perf_counter()
+        
+        for kind, (due, delay) in schedule.items():
+            
+            group = [operation for operation in pending if type(operation) is kind]
+            
+            if group and due <= now:
+                
+                kind.poll_many(group)
+                
+                first, ceiling, growth = kind.poll_interval
+                
+                schedule[kind] = [now + delay, min(delay * growth, ceiling)]
+                
+            
+        
+        still_pending = []
+        
+        for operation in pending:
+            
+            if operation.done:
+                
+                yield operation
+                
+            
+            else:
+                
+                still_pending.append(operation)
+                
+            
+        
+        pending = still_pending
+        
+        if not pending:
+            
+            break
+            
+        
+        kinds = {type(operation) for operation in pending}
+        
+        wake = min(schedule[kind][0] for kind in kinds)
+        
+        if deadline is not None:
+            
+            if time.perf_counter() >= deadline:
+                
+                return
+                
+            
+            wake = min(wake, deadline)
+            
+        
+        time.sleep(max(0.0, wake - time.perf_counter()))
+        
+    
+
+def wait_all(operations, timeout = None):
+    
+    operations = list(operations)
+    
+    for operation in as_completed(operations, timeout):
+        
+        pass
+        
+    
+    return operations
+    
+
+#----------------------------------------------------------------------------------------
+
+#Latency metrics. Every tracked operation, every provider call and every Azure stage is
+#counted into a fixed-bucket histogram, so recording is a lookup and two additions under
+#a lock. Snapshots export as JSON or as a Prometheus textfile (node_exporter's textfile
+#collector picks the latter up).
+
+METRIC_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0, 300.0, 600.0)
+
+METRIC_HELP = {
+    
+    "cloud_vms_operation_seconds" : "Time from submitting an operation until it settles",
+    "cloud_vms_step_seconds" : "Time spent in each stage of a multi-stage operation",
+    "cloud_vms_call_seconds" : "Time spent in a single provider API call, retries included",
+    "cloud_vms_acquire_seconds" : "Time from asking a warm pool for an instance until it is running"
+    
+}
+
+class Histogram(object):
+    
+    __slots__ = ("counts", "total", "ok", "errors")
+    
+    def __init__(self):
+        
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)
+        self.total = 0.0
+        
+        self.ok = 0
+        self.errors = 0
+        
+    
+    def observe(self, seconds, ok):
+        
+        index = 0
+        
+        while index < len(METRIC_BUCKETS) and seconds > METRIC_BUCKETS[index]:
+            
+            index += 1
+            
+        
+        self.counts[index] += 1
+        self.total += seconds
+        
+        if ok:
+            
+            self.ok += 1
+            
+        
+        else:
+            
+            self.errors += 1
+            
+        
+    
+    @property
+    def count(self):
+        
+        return self.ok + self.errors
+        
+    
+    def quantile(self, q):
+        
+        #Upper bound of the bucket holding the q-th observation
+        
+        rank = q * self.count
+        seen = 0
+        
+        for bound, count in zip(METRIC_BUCKETS + (float("inf"),), self.counts):
+            
+            seen += count
+            
+            if seen >= rank and count:
+                
+                return bound
+                
+            
+        
+        return 0.0
+        
+    
+
+class Metrics(object):
+    
+    def __init__(self):
+        
+        self._lock = threading.Lock()
+        
+        #{metric name : {(label, value) pairs : Histogram}}
+        
+        self._histograms = collections.defaultdict(dict)
+        
+    
+    def observe(self, name, seconds, ok = True, **labels):
+        
+        key = tuple(sorted(labels.items()))
+        
+        with self._lock:
+            
+            histogram = self._histograms[name].get(key)
+            
+            if histogram is None:
+                
+                histogram = self._histograms[name][key] = Histogram()
+                
+            
+            histogram.observe(seconds, ok)
+            
+        
+    
+    def record(self, operation):
+        
+        #Done callback for operation handles
+        
+        self.observe("cloud_vms_operation_seconds", operation.seconds, operation.ok, platform = operation.platform, action = operation.action)
+        
+        for step, seconds, ok in operation.steps:
+            
+            self.observe("cloud_vms_step_seconds", seconds, ok, platform = operation.platform, action = operation.action, step = step)
+            
+        
+    
+    def timed(self, function, *args, **labels):
+        
+        #Calls function(*args), recording how long it took under cloud_vms_call_seconds
+        
+        started = time.perf_counter()
+        
+        try:
+            
+            result = function(*args)
+            
+        
+        except Exception:
+            
+            self.observe("cloud_vms_call_seconds", time.perf_counter() - started, False, **labels)
+            
+            raise
+            
+        
+        self.observe("cloud_vms_call_seconds", time.perf_counter() - started, True, **labels)
+        
+        return result
+        
+    
+    def reset(self):
+        
+        with self._lock:
+            
+            self._histograms.clear()
+            
+        
+    
+    def _copy(self):
+        
+        with self._lock:
+            
+            return {name : {key : (list(histogram.counts), histogram.total, histogram.ok, histogram.errors) for key, histogram in series.items()} for name, series in self._histograms.items()}
+            
+        
+    
+    def snapshot(self):
+        
+        snapshot = {"time" : time.time(), "metrics" : {}}
+        
+        with self._lock:
+            
+            for name, series in sorted(self._histograms.items()):
+                
+                snapshot["metrics"][name] = [
+                    
+                    dict(key, count = histogram.count, ok = histogram.ok, errors = histogram.errors, sum = round(histogram.total, 6),
+                         mean = round(histogram.total / histogram.count, 6) if histogram.count else 0.0,
+                         p50 = histogram.quantile(0.5), p99 = histogram.quantile(0.99),
+                         buckets = dict(zip([str(bound) for bound in METRIC_BUCKETS] + ["+Inf"], histogram.counts)))
+                    
+                    for key, histogram in sorted(series.items())
+                    
+                ]
+                
+            
+        
+        return snapshot
+        
+    
+    def to_json(self):
+        
+        return json.dumps(self.snapshot(), sort_keys = True)
+        
+    
+    def to_prometheus(self):
+        
+        lines = []
+        
+        for name, series in sorted(self._copy().items()):
+            
+            lines.append("# HELP {} {}".format(name, METRIC_HELP.get(name, name)))
+            lines.append("# TYPE {} histogram".format(name))
+            
+            for key, (counts, total, ok, errors) in sorted(series.items()):
+                
+                labels = ",".join('{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"')) for label, value in key)
+                
+                cumulative = 0
+                
+                for bound, count in zip([repr(bound) for bound in METRIC_BUCKETS] + ["+Inf"], counts):
+                    
+                    cumulative += count
+                    
+                    lines.append('{}_bucket{{{}}} {}'.format(name, ",".join(filter(None, [labels, 'le="{}"'.format(bound)])), cumulative))
+                    
+                
+                lines.append("{}_sum{{{}}} {}".format(name, labels, repr(total)))
+                lines.append("{}_count{{{}}} {}".format(name, labels, ok + errors))
+                
+                #Outcome counters next to each histogram
+                
+                counter = name[:-len("_seconds")] if name.endswith("_seconds") else name
+                
+                lines.append('{}_total{{{}}} {}'.format(counter, ",".join(filter(None, [labels, 'outcome="ok"'])), ok))
+                lines.append('{}_total{{{}}} {}'.format(counter, ",".join(filter(None, [labels, 'outcome="error"'])), errors))
+                
+            
+        
+        return "\n".join(lines) + "\n"
+        
+    
+    def write(self, path):
+        
+        #Written beside the target and renamed over it, so a collector never reads half a file;
+        #a .json path gets the JSON snapshot, anything else the Prometheus text format
+        
+        text = self.to_json() + "\n" if path.endswith(".json") else self.to_prometheus()
+        
+        partial = "{}.{}.tmp".format(path, os.getpid())
+        
+        with open(partial, "w") as metrics_file:
+            
+            metrics_file.write(text)
+            
+        
+        os.replace(partial, path)
+        
+    
+
+default_metrics = Metrics()
+
+#----------------------------------------------------------------------------------------
+
+#Key material for Azure VMs is generated ahead of time in worker processes, so create_key
+#hands out a ready key instead of running RSA generation on the launch path
+
+KEY_TYPES = ("rsa", "ed25519")
+
+#Keys kept ready per key type
+
+KEY_POOL_SIZE = 4
+
+def _generate_key(key_type):
+    
+    #Runs in a worker process; returns (private PEM, public OpenSSH) as text
+    
+    if key_type == "ed25519":
+        
+        key = _require("Crypto.PublicKey.ECC").generate(curve = "ed25519")
+        
+        return key.export_key(format = "PEM"), key.public_key().export_key(format = "OpenSSH")
+        
+    
+    key = _require("Crypto.PublicKey.RSA").generate(2048)
+    
+    return key.exportKey("PEM").decode("UTF-8"), key.publickey().exportKey("OpenSSH").decode("UTF-8")
+    
+
+class KeyPool(object):
+    
+    def __init__(self, key_type = "rsa", watermark = KEY_POOL_SIZE, processes = 2):
+        
+        if key_type not in KEY_TYPES:
+            
+            raise ValueError("unknown key type {!r}".format(key_type))
+            
+        
+        self.key_type = key_type
+        self.watermark = watermark
+        self.processes = processes
+        
+        self._keys = collections.deque()
+        self._pending = 0
+        
+        self._executor = None
+        self._lock = threading.Lock()
+        
+    
+    def __len__(self):
+        
+        return len(self._keys)
+        
+    
+    def fill(self):
+        
+        #Top the pool up to its watermark in the background
+        
+        with self._lock:
+            
+            if self._executor is None:
+                
+                #Spawned, not forked: the process already runs scheduler and pool threads
+                
+                self._executor = ProcessPoolExecutor(max_workers = self.processes, mp_context = multiprocessing.get_context("spawn"))
+                
+            
+            needed = max(self.watermark - len(self._keys) - self._pending, 0)
+            
+            self._pending += needed
+            
+            futures = [self._executor.submit(_generate_key, self.key_type) for _ in range(needed)]
+            
+        
+        for future in futures:
+            
+            future.add_done_callback(self._stock)
+            
+        
+    
+    def _stock(self, future):
+        
+        with self._lock:
+            
+            self._pending -= 1
+            
+        
+        if not future.cancelled() and future.exception() is None:
+            
+            self._keys.append(future.result())
+            
+        
+    
+    def take(self):
+        
+        #A pre-generated (private, public) pair when one is ready, else one made on the spot
+        
+        try:
+            
+            key = self._keys.popleft()
+            
+        
+        except IndexError:
+            
+            key = None
+            
+        
+        self.fill()
+        
+        return key if key is not None else _generate_key(self.key_type)
+        
+    
+    def close(self):
+        
+        #Drops keys still being made so the workers do not hold up exit; a later take()
+        #starts the pool again. Cancelling runs _stock for each dropped key, so the
+        #executor is shut down outside the lock.
+        
+        with self._lock:
+            
+            executor, self._executor = self._executor, None
+            
+        
+        if executor is not None:
+            
+            executor.shutdown(wait = False, cancel_futures = True)
+            
+        
+    
+
+_key_pools = {}
+
+_key_pools_lock = threading.Lock()
+
+def key_pool(key_type = "rsa"):
+    
+    #The process-wide pool for a key type, created on first use
+    
+    with _key_pools_lock:
+        
+        if key_type not in _key_pools:
+            
+            _key_pools[key_type] = KeyPool(key_type)
+            
+        
+        return _key_pools[key_type]
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Provider-specific instance states mapped onto the EC2 vocabulary used everywhere else
+
+GCP_STATES = {
+    
+    "PROVISIONING" : "pending", "STAGING" : "pending", "RUNNING" : "running",
+    "STOPPING" : "stopping", "SUSPENDING" : "stopping", "REPAIRING" : "pending",
+    "STOPPED" : "stopped", "SUSPENDED" : "stopped", "TERMINATED" : "stopped"
+    
+}
+
+AZURE_STATES = {
+    
+    "PowerState/starting" : "pending", "PowerState/running" : "running",
+    "PowerState/stopping" : "stopping", "PowerState/deallocating" : "stopping",
+    "PowerState/stopped" : "stopped", "PowerState/deallocated" : "stopped"
+    
+}
+
+def normalize_state(platform, state):
+    
+    if platform == "gcp":
+        
+        return GCP_STATES.get(state, "unknown")
+        
+    
+    if platform == "azu":
+        
+        return AZURE_STATES.get(state, "unknown")
+        
+    
+    return state
+    
+
+#Instance names matched by one GCP list filter
+
+GCP_FILTER_NAMES = 100
+
+#Seconds a completed list_instances sweep is served from memory
+
+LIST_TTL = 30.0
+
+#Completed list_instances sweeps keyed by (platform, region, credentials, project/group).
+#A sweep is only stored once it has been read to the end, and any mutating Cloud call
+#drops every sweep of its platform. Each invalidation also bumps a generation, so a
+#sweep that was running across one is not stored.
+
+class ListCache(object):
+    
+    def __init__(self, ttl = LIST_TTL):
+        
+        self.ttl = ttl
+        
+        self._entries = {}
+        self._lock = threading.Lock()
+        
+        #Invalidation counts per platform, and under None for everything at once
+        
+        self._generations = {}
+        
+    
+    def get(self, key):
+        
+        with self._lock:
+            
+            entry = self._entries.get(key)
+            
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                
+                return None
+                
+            
+            return entry[1]
+            
+        
+    
+    def generation(self, platform):
+        
+        with self._lock:
+            
+            return (self._generations.get(None, 0), self._generations.get(platform, 0))
+            
+        
+    
+    def put(self, key, records, fetched, generation = None):
+        
+        #generation is what generation(platform) returned before the sweep started
+        
+        with self._lock:
+            
+            if generation is not None and generation != (self._generations.get(None, 0), self._generations.get(key[0], 0)):
+                
+                return
+                
+            
+            self._entries[key] = (fetched, records)
+            
+        
+    
+    def invalidate(self, platform = None):
+        
+        with self._lock:
+            
+            self._generations[platform] = self._generations.get(platform, 0) + 1
+            
+            for key in [key for key in self._entries if platform is None or key[0] == platform]:
+                
+                del self._entries[key]
+                
+            
+        
+    
+
+default_list_cache = ListCache()
+
+def _azure_group(resource_id):
+    
+    parts = resource_id.split("/")
+    
+    for i, part in enumerate(parts[:-1]):
+        
+        if part.lower() == "resourcegroups":
+            
+            return parts[i + 1]
+            
+        
+    
+    return ""
+    
+
+#----------------------------------------------------------------------------------------
+
+#Local record of everything launched through Cloud, so later operations can find an
+#instance's project/group, zone and dependent resources from its ID or a tag alone
+
+INVENTORY_PATH = "cloud_vms.db"
+
+class Inventory(object):
+    
+    SCHEMA = """
+    
+        CREATE TABLE IF NOT EXISTS instances (
+            
+            platform TEXT NOT NULL,
+            instance_id TEXT NOT NULL,
+            
+            region TEXT,
+            group_name TEXT,
+            area TEXT,
+            spec_name TEXT,
+            
+            nic_name TEXT,
+            ip_name TEXT,
+            key_name TEXT,
+            
+            state TEXT,
+            launched REAL,
+            updated REAL,
+            
+            PRIMARY KEY (platform, instance_id)
+            
+        );
+        
+        CREATE TABLE IF NOT EXISTS tags (
+            
+            platform TEXT NOT NULL,
+            instance_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            
+            PRIMARY KEY (platform, instance_id, tag)
+            
+        );
+        
+        CREATE TABLE IF NOT EXISTS placements (
+            
+            platform TEXT NOT NULL,
+            candidate TEXT NOT NULL,
+            
+            seconds REAL,
+            ok INTEGER,
+            capacity INTEGER,
+            error TEXT,
+            
+            at REAL
+            
+        );
+        
+        CREATE INDEX IF NOT EXISTS instances_by_region ON instances (platform, region, state);
+        CREATE INDEX IF NOT EXISTS instances_by_spec ON instances (spec_name, platform, state);
+        CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag, platform);
+        CREATE INDEX IF NOT EXISTS placements_by_candidate ON placements (platform, candidate, at);
+        
+    """
+    
+    COLUMNS = ("platform", "instance_id", "region", "group_name", "area", "spec_name", "nic_name", "ip_name", "key_name", "state", "launched", "updated")
+    
+    def __init__(self, path = INVENTORY_PATH):
+        
+        self.path = path
+        
+        self._lock = threading.Lock()
+        
+        self._connection = sqlite3.connect(path, check_same_thread = False)
+        
+        with self._lock, self._connection:
+            
+            if path != ":memory:":
+                
+                self._connection.execute("PRAGMA journal_mode = WAL")
+                
+            
+            self._connection.executescript(self.SCHEMA)
+            
+        
+    
+    def close(self):
+        
+        with self._lock:
+            
+            self._connection.close()
+            
+        
+    
+    def record_launch(self, platform, instanceIds, region = "", group = "", area = "", spec_name = "", nic_name = "", ip_name = "", key_name = "", tags = (), state = "pending"):
+        
+        now = time.time()
+        
+        rows = [(platform, instanceId, region, group, area, spec_name, nic_name, ip_name, key_name, state, now, now) for instanceId in instanceIds]
+        
+        with self._lock, self._connection:
+            
+            self._connection.executemany("INSERT OR REPLACE INTO instances VALUES ({})".format(", ".join("?" * len(self.COLUMNS))), rows)
+            self._connection.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?, ?)", [(platform, instanceId, tag) for instanceId in instanceIds for tag in tags])
+            
+        
+    
+    def set_state(self, platform, instanceIds, state):
+        
+        with self._lock, self._connection:
+            
+            self._connection.executemany("UPDATE instances SET state = ?, updated = ? WHERE platform = ? AND instance_id = ?", [(state, time.time(), platform, instanceId) for instanceId in instanceIds])
+            
+        
+    
+    def untag(self, platform, instanceIds, tag):
+        
+        with self._lock, self._connection:
+            
+            self._connection.executemany("DELETE FROM tags WHERE platform = ? AND instance_id = ? AND tag = ?", [(platform, instanceId, tag) for instanceId in instanceIds])
+            
+        
+    
+    def record_placement(self, platform, candidate, seconds, ok, capacity = False, error = ""):
+        
+        with self._lock, self._connection:
+            
+            self._connection.execute("INSERT INTO placements VALUES (?, ?, ?, ?, ?, ?, ?)", (platform, candidate, seconds, int(ok), int(capacity), error, time.time()))
+            
+        
+    
+    def placements(self, platform, since = 0.0):
+        
+        #Launch outcomes newer than since, oldest first
+        
+        with self._lock:
+            
+            cursor = self._connection.execute("SELECT candidate, seconds, ok, capacity, at FROM placements WHERE platform = ? AND at >= ? ORDER BY at", (platform, since))
+            
+            return [dict(zip(("candidate", "seconds", "ok", "capacity", "at"), row)) for row in cursor.fetchall()]
+            
+        
+    
+    def get(self, platform, instanceId):
+        
+        rows = self._select("platform = ? AND instance_id = ?", (platform, instanceId))
+        
+        return rows[0] if rows else None
+        
+    
+    def find(self, platform = None, region = None, spec_name = None, tag = None, state = None, include_terminated = False):
+        
+        clauses = []
+        values = []
+        
+        for column, value in (("platform", platform), ("region", region), ("spec_name", spec_name), ("state", state)):
+            
+            if value is not None:
+                
+                clauses.append("{} = ?".format(column))
+                values.append(value)
+                
+            
+        
+        if tag is not None:
+            
+            clauses.append("EXISTS (SELECT 1 FROM tags WHERE tags.platform = instances.platform AND tags.instance_id = instances.instance_id AND tags.tag = ?)")
+            values.append(tag)
+            
+        
+        if not include_terminated and state is None:
+            
+            clauses.append("state != 'terminated'")
+            
+        
+        return self._select(" AND ".join(clauses) or "1", values)
+        
+    
+    def _select(self, where, values):
+        
+        with self._lock:
+            
+            cursor = self._connection.execute("SELECT {} FROM instances WHERE {} ORDER BY launched".format(", ".join(self.COLUMNS), where), tuple(values))
+            
+            return [dict(zip(self.COLUMNS, row)) for row in cursor.fetchall()]
+            
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Typed specifications, one class per provider. Values are validated and coerced when set
+#(menu edits arrive as strings), and each specification compiles its request payload
+#into a template once. A launch that varies only names or counts copies the path to
+#each changed field and shares the rest of the template.
+
+REQUIRED = object()
+
+def _coerce(key, kind, value):
+    
+    if value is None:
+        
+        raise ValueError("{} must be set".format(key))
+        
+    
+    if kind is bool:
+        
+        if isinstance(value, str):
+            
+            lowered = value.strip().lower()
+            
+            if lowered in ("true", "yes", "y", "1"):
+                
+                return True
+                
+            
+            if lowered in ("false", "no", "n", "0"):
+                
+                return False
+                
+            
+            raise ValueError("{} must be true or false, got {!r}".format(key, value))
+            
+        
+        return bool(value)
+        
+    
+    if kind is int:
+        
+        try:
+            
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                
+                raise ValueError
+                
+            
+            return int(value)
+            
+        
+        except (TypeError, ValueError):
+            
+            raise ValueError("{} must be a whole number, got {!r}".format(key, value))
+            
+        
+    
+    if kind is tuple:
+        
+        if isinstance(value, str):
+            
+            return tuple(part.strip() for part in value.split(",") if part.strip())
+            
+        
+        return tuple(str(part) for part in value)
+        
+    
+    return str(value)
+    
+
+def _patched(template, changes):
+    
+    #Copy of template with each path in changes set to its value. Only the containers
+    #along those paths are copied; everything else is shared with the template.
+    
+    result = dict(template)
+    
+    copies = {() : result}
+    
+    for path, value in changes.items():
+        
+        node = result
+        
+        for depth in range(1, len(path)):
+            
+            prefix = path[:depth]
+            
+            if prefix not in copies:
+                
+                #A section the template leaves out (e.g. HibernationOptions) starts empty
+                
+                child = node.get(path[depth - 1], {}) if isinstance(node, dict) else node[path[depth - 1]]
+                child = list(child) if isinstance(child, list) else dict(child)
+                
+                node[path[depth - 1]] = child
+                copies[prefix] = child
+                
+            
+            node = copies[prefix]
+            
+        
+        node[path[-1]] = value
+        
+    
+    return result
+    
+
+class Spec(object):
+    
+    platform = None
+    
+    #(KEY, type, default or REQUIRED, path or paths of the field in the template)
+    
+    FIELDS = ()
+    
+    __slots__ = ("_template",)
+    
+    def __init_subclass__(cls, **kwargs):
+        
+        super().__init_subclass__(**kwargs)
+        
+        cls.KINDS = {key : kind for key, kind, default, paths in cls.FIELDS}
+        cls.DEFAULTS = {key : default for key, kind, default, paths in cls.FIELDS}
+        cls.PATHS = {key : paths if not paths or isinstance(paths[0], tuple) else (paths,) for key, kind, default, paths in cls.FIELDS}
+        
+    
+    def __init__(self, **values):
+        
+        unknown = set(values) - set(self.KINDS)
+        
+        if unknown:
+            
+            raise KeyError("unknown {} specification keys: {}".format(self.platform, ", ".join(sorted(unknown))))
+            
+        
+        object.__setattr__(self, "_template", None)
+        
+        for key, default in self.DEFAULTS.items():
+            
+            if key in values:
+                
+                self[key] = values[key]
+                
+            
+            elif default is REQUIRED:
+                
+                raise ValueError("{} specification is missing {}".format(self.platform, key))
+                
+            
+            else:
+                
+                object.__setattr__(self, key.lower(), default)
+                
+            
+        
+    
+    def __setattr__(self, name, value):
+        
+        key = name.upper()
+        
+        if key not in self.KINDS:
+            
+            raise AttributeError("{} specifications have no field {}".format(self.platform, key))
+            
+        
+        if value is not None or self.DEFAULTS[key] is not None:
+            
+            value = _coerce(key, self.KINDS[key], value)
+            
+        
+        object.__setattr__(self, name, value)
+        
+        #Any change invalidates the compiled template
+        
+        object.__setattr__(self, "_template", None)
+        
+    
+    def __getitem__(self, key):
+        
+        if key not in self.KINDS:
+            
+            raise KeyError(key)
+            
+        
+        return getattr(self, key.lower())
+        
+    
+    def __setitem__(self, key, value):
+        
+        if key not in self.KINDS:
+            
+            raise KeyError(key)
+            
+        
+        setattr(self, key.lower(), value)
+        
+    
+    def __contains__(self, key):
+        
+        return key in self.KINDS
+        
+    
+    def get(self, key, default = None):
+        
+        return self[key] if key in self.KINDS else default
+        
+    
+    def keys(self):
+        
+        return list(self.KINDS)
+        
+    
+    def items(self):
+        
+        return [(key, self[key]) for key in self.KINDS]
+        
+    
+    def to_dict(self):
+        
+        return dict(self.items())
+        
+    
+    def replace(self, **changes):
+        
+        return type(self)(**dict(self.to_dict(), **changes))
+        
+    
+    def check(self, overrides):
+        
+        #Validated copy of per-launch overrides
+        
+        unknown = set(overrides) - set(self.KINDS)
+        
+        if unknown:
+            
+            raise KeyError("unknown {} specification keys: {}".format(self.platform, ", ".join(sorted(unknown))))
+            
+        
+        return {key : _coerce(key, self.KINDS[key], value) for key, value in overrides.items()}
+        
+    
+    def template(self):
+        
+        #_compile comes from each provider's subclass; Spec itself is never instantiated
+        
+        if self._template is None:
+            
+            object.__setattr__(self, "_template", self._compile())
+            
+        
+        return self._template
+        
+    
+    def request(self, overrides = None):
+        
+        #Request payload for one launch; overrides must have been through check()
+        
+        changes = {}
+        
+        for key, value in (overrides or {}).items():
+            
+            for path in self.PATHS[key]:
+                
+                changes[path] = value
+                
+            
+        
+        return _patched(self.template(), changes)
+        
+    
+    def __repr__(self):
+        
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(key, value) for key, value in self.items()))
+        
+    
+
+class AwsSpec(Spec):
+    
+    platform = "aws"
+    
+    FIELDS = (
+        
+        ("SPEC_NAME", str, "", ()),
+        ("TAGS", tuple, (), ()),
+        
+        ("KEY_NAME", str, REQUIRED, ("KeyName",)),
+        
+        ("IMAGE_ID", str, REQUIRED, ("ImageId",)),
+        ("INSTANCE_TYPE", str, REQUIRED, ("InstanceType",)),
+        
+        ("MIN_COUNT", int, 1, ("MinCount",)),
+        ("MAX_COUNT", int, 1, ("MaxCount",)),
+        
+        ("DEVICE_NAME", str, REQUIRED, ("BlockDeviceMappings", 0, "DeviceName")),
+        
+        ("VOLUME_TYPE", str, REQUIRED, ("BlockDeviceMappings", 0, "Ebs", "VolumeType")),
+        ("VOLUME_SIZE", int, REQUIRED, ("BlockDeviceMappings", 0, "Ebs", "VolumeSize")),
+        
+        ("BLOCK_DELETE_ON_TERMINATION", bool, True, ("BlockDeviceMappings", 0, "Ebs", "DeleteOnTermination")),
+        ("ENCRYPTED", bool, True, ("BlockDeviceMappings", 0, "Ebs", "Encrypted")),
+        
+        ("ASSOCIATE_PUBLIC_IP_ADDRESS", bool, True, ("NetworkInterfaces", 0, "AssociatePublicIpAddress")),
+        ("NETWORK_DELETE_ON_TERMINATION", bool, True, ("NetworkInterfaces", 0, "DeleteOnTermination")),
+        
+        ("DEVICE_INDEX", int, 0, ("NetworkInterfaces", 0, "DeviceIndex")),
+        
+        ("HIBERNATE", bool, False, ("HibernationOptions", "Configured"))
+        
+    )
+    
+    __slots__ = tuple(key.lower() for key, kind, default, paths in FIELDS)
+    
+    def _compile(self):
+        
+        if self.min_count > self.max_count:
+            
+            raise ValueError("MIN_COUNT ({}) is larger than MAX_COUNT ({})".format(self.min_count, self.max_count))
+            
+        
+        payload = {
+            
+            "ImageId" : self.image_id,
+            "InstanceType" : self.instance_type,
+            
+            "MinCount" : self.min_count,
+            "MaxCount" : self.max_count,
+            
+            "KeyName" : self.key_name,
+            
+            "BlockDeviceMappings" : [
+                
+                {
+                    
+                    "DeviceName" : self.device_name,
+                    
+                    "Ebs" : {
+                        
+                        "VolumeType" : self.volume_type,
+                        "VolumeSize" : self.volume_size,
+                        
+                        "DeleteOnTermination" : self.block_delete_on_termination,
+                        "Encrypted" : self.encrypted
+                        
+                    }
+                    
+                }
+                
+            ],
+            
+            "NetworkInterfaces" : [
+                
+                {
+                    
+                    "AssociatePublicIpAddress" : self.associate_public_ip_address,
+                    "DeleteOnTermination" : self.network_delete_on_termination,
+                    
+                    "DeviceIndex" : self.device_index
+                    
+                }
+                
+            ]
+            
+        }
+        
+        #Hibernation needs to be enabled at launch (and an encrypted root volume). It is
+        #left out otherwise: some instance types and AMIs reject the section outright.
+        
+        if self.hibernate:
+            
+            payload["HibernationOptions"] = {"Configured" : True}
+            
+        
+        return payload
+        
+    
+
+class GcpSpec(Spec):
+    
+    platform = "gcp"
+    
+    FIELDS = (
+        
+        ("SPEC_NAME", str, "", ()),
+        ("TAGS", tuple, (), ()),
+        
+        ("PROJECT", str, REQUIRED, ()),
+        ("ZONE", str, REQUIRED, ()),
+        
+        ("INSTANCE_NAME", str, REQUIRED, ("name",)),
+        
+        ("MACHINE_TYPE", str, REQUIRED, ("machineType",)),
+        
+        ("DISK_SOURCE_IMAGE", str, REQUIRED, ("disks", 0, "initializeParams", "sourceImage")),
+        ("DISK_SIZE", int, REQUIRED, ("disks", 0, "initializeParams", "diskSizeGb")),
+        
+        ("NETWORK", str, "global/networks/default", ("networkInterfaces", 0, "network")),
+        ("NETWORK_TYPE", str, "ONE_TO_ONE_NAT", ("networkInterfaces", 0, "accessConfigs", 0, "type"))
+        
+    )
+    
+    __slots__ = tuple(key.lower() for key, kind, default, paths in FIELDS)
+    
+    def _compile(self):
+        
+        return {
+            
+            "name" : self.instance_name,
+            
+            "machineType" : self.machine_type,
+            
+            "disks" : [
+                {
+                    'boot': True,
+                    'autoDelete': True,
+                    'initializeParams': {
+                        'sourceImage': self.disk_source_image,
+                        'diskSizeGb' : self.disk_size
+                    }
+                }
+            ],
+            
+            "networkInterfaces": [
+                {
+                    "network" : self.network,
+                    "accessConfigs" : [
+                        {"type" : self.network_type}
+                    ]
+                }
+            ]
+            
+        }
+        
+    
+
+class AzureSpec(Spec):
+    
+    platform = "azu"
+    
+    FIELDS = (
+        
+        ("SPEC_NAME", str, "", ()),
+        ("TAGS", tuple, (), ()),
+        
+        ("VM_NAME", str, REQUIRED, ("vm", "os_profile", "computer_name")),
+        ("IP_ADDRESS_NAME", str, REQUIRED, ()),
+        ("NIC_NAME", str, REQUIRED, ()),
+        
+        ("PUBLIC_KEY_NAME", str, REQUIRED, ()),
+        ("PUBLIC_KEY", str, None, ("vm", "os_profile", "linux_configuration", "ssh", "public_keys", 0, "key_data")),
+        
+        ("GROUP_NAME", str, REQUIRED, ()),
+        
+        ("LOCATION", str, REQUIRED, (("ip", "location"), ("nic", "location"), ("vm", "location"))),
+        
+        ("VNET_NAME", str, REQUIRED, ()),
+        ("SUBNET_NAME", str, "default", ()),
+        
+        ("NIC_IP_CONFIG", str, "ipconfig", ("nic", "ip_configurations", 0, "name")),
+        
+        ("VM_SIZE", str, REQUIRED, ("vm", "hardware_profile", "vm_size")),
+        
+        ("IMAGE_PUBLISHER", str, REQUIRED, ("vm", "storage_profile", "image_reference", "publisher")),
+        ("IMAGE_OFFER", str, REQUIRED, ("vm", "storage_profile", "image_reference", "offer")),
+        ("IMAGE_SKU", str, REQUIRED, ("vm", "storage_profile", "image_reference", "sku")),
+        ("IMAGE_VERSION", str, "latest", ("vm", "storage_profile", "image_reference", "version"))
+        
+    )
+    
+    __slots__ = tuple(key.lower() for key, kind, default, paths in FIELDS)
+    
+    #Where the resources created earlier in the launch are wired into the later requests
+    
+    IP_ID_PATH = ("ip_configurations", 0, "public_ip_address", "id")
+    SUBNET_ID_PATH = ("ip_configurations", 0, "subnet", "id")
+    NIC_ID_PATH = ("network_profile", "network_interfaces", 0, "id")
+    KEY_DATA_PATH = ("os_profile", "linux_configuration", "ssh", "public_keys", 0, "key_data")
+    
+    def _compile(self):
+        
+        return {
+            
+            "ip" : {
+                
+                "location" : self.location,
+                "public_ip_allocation_method" : "Dynamic"
+                
+            },
+            
+            "nic" : {
+                
+                "location" : self.location,
+                "ip_configurations" : [{
+                    
+                    "name" : self.nic_ip_config,
+                    
+                    "public_ip_address" : {
+                        
+                        "id" : None
+                        
+                    },
+                    
+                    "subnet" : {
+                        
+                        "id" : None
+                        
+                    }
+                    
+                }]
+                
+            },
+            
+            "vm" : {
+                
+                "location": self.location,
+                
+                "os_profile": {
+                    
+                    "computer_name": self.vm_name,
+                    
+                    "admin_username": "userlogin",
+                    
+                    "linux_configuration": {
+                        
+                        "disable_password_authentication": True,
+                        
+                        "ssh": {
+                            
+                            "public_keys": [{
+                                
+                                "path": "/home/userlogin/.ssh/authorized_keys",
+                                "key_data": self.public_key
+                                
+                            }]
+                            
+                        }
+                        
+                    }
+                    
+                },
+                
+                "hardware_profile": {
+                    
+                    "vm_size": self.vm_size
+                    
+                },
+                
+                "storage_profile": {
+                    
+                    "image_reference": {
+                        
+                        "publisher": self.image_publisher,
+                        "offer": self.image_offer,
+                        "sku": self.image_sku,
+                        "version": self.image_version
+                        
+                    },
+                    
+                },
+                
+                "network_profile": {
+                
+                    "network_interfaces": [{
+                        
+                        "id": None,
+                        
+                    }]
+                    
+                },
+                
+            }
+            
+        }
+        
+    
+
+SPEC_CLASSES = {"aws" : AwsSpec, "gcp" : GcpSpec, "azu" : AzureSpec}
+
+def as_spec(platform, specifications):
+    
+    if isinstance(specifications, Spec):
+        
+        return specifications
+        
+    
+    return SPEC_CLASSES[platform](**specifications)
+    
+
+#The configuration at the top of the file, validated once
+
+mySpecs = [as_spec(platform, specifications) for platform, specifications in zip(("aws", "gcp", "azu"), mySpecs)]
+
+#----------------------------------------------------------------------------------------
+
+#EC2 launch templates, one per distinct AWS launch payload. The template is named after a
+#hash of its contents, so every process that launches the same spec finds the same
+#template, and a changed spec gets a new one instead of a new version of the old one.
+#Launches then send the template reference and the counts instead of the full payload.
+
+TEMPLATE_PREFIX = "cloud-vms-"
+
+class LaunchTemplates(object):
+    
+    def __init__(self):
+        
+        #{(region, credentials, digest) : {"LaunchTemplateId", "Version"}, or None where
+        #templates cannot be used and launches send the payload inline}
+        
+        self._templates = {}
+        
+        self._locks = {}
+        self._lock = threading.Lock()
+        
+    
+    @staticmethod
+    def template_data(payload):
+        
+        return {key : value for key, value in payload.items() if key not in ("MinCount", "MaxCount")}
+        
+    
+    @staticmethod
+    def digest(data):
+        
+        return hashlib.sha256(json.dumps(data, sort_keys = True).encode()).hexdigest()
+        
+    
+    def _key(self, cloud, payload):
+        
+        data = self.template_data(payload)
+        
+        return (cloud.region, _credential_key(cloud.credentials), self.digest(data)), data
+        
+    
+    def get(self, cloud, payload):
+        
+        key, data = self._key(cloud, payload)
+        digest = key[2]
+        
+        if key in self._templates:
+            
+            return self._templates[key]
+            
+        
+        with self._lock:
+            
+            lock = self._locks.setdefault(key, threading.Lock())
+            
+        
+        #Concurrent launches of a new spec wait for the one creating its template
+        
+        with lock:
+            
+            if key not in self._templates:
+                
+                self._templates[key] = self._register(cloud, data, digest)
+                
+            
+            return self._templates[key]
+            
+        
+    
+    def _register(self, cloud, data, digest):
+        
+        client = cloud._client("client")
+        
+        name = TEMPLATE_PREFIX + digest[:32]
+        
+        try:
+            
+            response = cloud._call("mutate", client.create_launch_template, LaunchTemplateName = name, LaunchTemplateData = data, ClientToken = digest)
+            
+            template = response["LaunchTemplate"]
+            
+        
+        except Exception as error:
+            
+            code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code", "")
+            
+            if code != "InvalidLaunchTemplateName.AlreadyExistsException":
+                
+                if code in ("UnauthorizedOperation", "AccessDenied", "AccessDeniedException"):
+                    
+                    #Not allowed to manage templates: launch with the payload inline
+                    
+                    return None
+                    
+                
+                raise
+                
+            
+            #Made earlier by another process; the name pins the contents
+            
+            response = cloud._call("describe", client.describe_launch_templates, LaunchTemplateNames = [name])
+            
+            template = response["LaunchTemplates"][0]
+            
+        
+        #The version EC2 reports as default, which the name pins to these contents
+        
+        version = template.get("DefaultVersionNumber")
+        
+        return {"LaunchTemplateId" : template["LaunchTemplateId"], "Version" : "$Default" if version is None else str(version)}
+        
+    
+    def forget(self, cloud, payload):
+        
+        #For a template that was deleted behind our back
+        
+        key, data = self._key(cloud, payload)
+        
+        self._templates.pop(key, None)
+        
+    
+    def clear(self):
+        
+        with self._lock:
+            
+            self._templates.clear()
+            self._locks.clear()
+            
+        
+    
+
+default_launch_templates = LaunchTemplates()
+
+#----------------------------------------------------------------------------------------
+
+#Placement: a policy holds candidate placements, each a set of spec overrides such as
+#{"ZONE" : "us-east1-b", "MACHINE_TYPE" : "zones/us-east1-b/machineTypes/e2-small"}
+#(GCP machine types name their zone) or {"LOCATION" : "eastus", "VM_SIZE" : "Standard_B1s"}.
+#Every launch records its launch-to-running seconds, or its error, in the inventory.
+#Candidates are tried fastest first by recent median; one that reported a capacity
+#error goes to the back until its cooldown passes. A launch that fails moves on to the
+#next candidate, and one that runs past spill_after starts the next candidate
+#alongside it; the first to come up wins and the other is terminated once it settles.
+
+#Seconds of history considered, and the newest samples kept per candidate
+
+PLACEMENT_WINDOW = 7 * 24 * 3600.0
+PLACEMENT_SAMPLES = 50
+
+#Seconds a candidate stays at the back after a capacity error
+
+CAPACITY_COOLDOWN = 900.0
+
+#Error codes that mean the zone or size is out of capacity rather than a bad request
+
+CAPACITY_ERRORS = (
+    
+    "InsufficientInstanceCapacity", "InsufficientHostCapacity", "InsufficientCapacity", "Unsupported",
+    "ZONE_RESOURCE_POOL_EXHAUSTED", "ZONE_RESOURCE_POOL_EXHAUSTED_WITH_DETAILS", "RESOURCE_POOL_EXHAUSTED",
+    "SkuNotAvailable", "AllocationFailed", "ZonalAllocationFailed", "OverconstrainedAllocationRequest", "OverconstrainedZonalAllocationRequest"
+    
+)
+
+def _capacity_error(error):
+    
+    text = str(error) + " " + type(error).__name__
+    
+    return any(code in text for code in CAPACITY_ERRORS)
+    
+
+class PlacementPolicy(object):
+    
+    def __init__(self, candidates, store = None, spill_after = None, cooldown = CAPACITY_COOLDOWN):
+        
+        #spill_after is seconds, or None to use twice the candidate's slowest recent
+        #launch once it has a few
+        
+        self.candidates = [dict(candidate) for candidate in candidates]
+        
+        if not self.candidates:
+            
+            raise ValueError("a placement policy needs at least one candidate")
+            
+        
+        self.store = store
+        self.spill_after = spill_after
+        self.cooldown = cooldown
+        
+        self._lock = threading.Lock()
+        
+    
+    @staticmethod
+    def key(candidate):
+        
+        return json.dumps(candidate, sort_keys = True)
+        
+    
+    def _store(self, cloud):
+        
+        #The policy's own store, then the cloud's inventory, then one kept in memory
+        
+        with self._lock:
+            
+            if self.store is None:
+                
+                self.store = cloud.inventory if cloud.inventory is not None else Inventory(":memory:")
+                
+            
+            return self.store
+            
+        
+    
+    def stats(self, cloud):
+        
+        #{candidate key : {"launches", "failures", "p50", "p90", "capacity_at"}}
+        
+        now = time.time()
+        
+        samples = {self.key(candidate) : [] for candidate in self.candidates}
+        
+        stats = {key : {"launches" : 0, "failures" : 0, "p50" : None, "p90" : None, "capacity_at" : None} for key in samples}
+        
+        for row in self._store(cloud).placements(cloud.platform, now - PLACEMENT_WINDOW):
+            
+            if row["candidate"] not in stats:
+                
+                continue
+                
+            
+            if row["ok"]:
+                
+                samples[row["candidate"]].append(row["seconds"])
+                
+            
+            else:
+                
+                stats[row["candidate"]]["failures"] += 1
+                
+            
+            if row["capacity"]:
+                
+                stats[row["candidate"]]["capacity_at"] = row["at"]
+                
+            
+        
+        for key, seconds in samples.items():
+            
+            seconds = seconds[-PLACEMENT_SAMPLES:]
+            
+            stats[key].update(launches = len(seconds), p50 = _percentile(seconds, 0.5), p90 = _percentile(seconds, 0.9))
+            
+        
+        return stats
+        
+    
+    def rank(self, cloud):
+        
+        #Candidates best first. One never launched is assumed as fast as the typical
+        #candidate, so it gets tried; ties keep the listed order.
+        
+        stats = self.stats(cloud)
+        
+        now = time.time()
+        
+        known = [stat["p50"] for stat in stats.values() if stat["p50"] is not None]
+        
+        typical = _percentile(known, 0.5) or 0.0
+        
+        def score(indexed):
+            
+            index, candidate = indexed
+            
+            stat = stats[self.key(candidate)]
+            
+            cooling = stat["capacity_at"] is not None and now - stat["capacity_at"] < self.cooldown
+            
+            return (cooling, typical if stat["p50"] is None else stat["p50"], index)
+            
+        
+        return [candidate for index, candidate in sorted(enumerate(self.candidates), key = score)]
+        
+    
+    def spill_seconds(self, cloud, candidate, stats = None):
+        
+        if self.spill_after is not None:
+            
+            return self.spill_after
+            
+        
+        stat = (stats or self.stats(cloud))[self.key(candidate)]
+        
+        return 2 * stat["p90"] if stat["launches"] >= 5 else None
+        
+    
+    def record(self, cloud, candidate, operation):
+        
+        capacity = operation.error is not None and _capacity_error(operation.error)
+        
+        self._store(cloud).record_placement(cloud.platform, self.key(candidate), operation.seconds, operation.ok, capacity, "" if operation.ok else _failure(operation.error)["error"])
+        
+    
+    def launch(self, cloud, specifications, overrides = None):
+        
+        return PlacedOperation(self, cloud, as_spec(cloud.platform, specifications), overrides)
+        
+    
+
+class PlacedOperation(Operation):
+    
+    #One launch across placement candidates; ids and value are those of the attempt
+    #that came up
+    
+    poll_interval = (0.5, 5.0, 1.5)
+    
+    def __init__(self, policy, cloud, spec, overrides = None):
+        
+        Operation.__init__(self, cloud.platform, "launch", [])
+        
+        self.policy = policy
+        self.cloud = cloud
+        self.spec = spec
+        self.overrides = dict(overrides or {})
+        
+        self._stats = policy.stats(cloud)
+        self._queue = collections.deque(policy.rank(cloud))
+        
+        #[(candidate, handle)] in the order they were started, and the overrides each
+        #was launched with
+        
+        self.attempts = []
+        self._overrides = {}
+        
+        #Outcome of removing each attempt that lost, as bulk calls report them
+        
+        self.discarded = {}
+        
+        self._advance_lock = threading.Lock()
+        
+        self._attempt()
+        
+    
+    @property
+    def candidate(self):
+        
+        #Placement of the attempt that came up
+        
+        for candidate, operation in self.attempts:
+            
+            if operation.ok:
+                
+                return candidate
+                
+            
+        
+        return None
+        
+    
+    def _attempt(self):
+        
+        candidate = self._queue.popleft()
+        
+        overrides = dict(self.overrides, **candidate)
+        
+        #Attempts after the first may overlap the one before, so they get their own names
+        
+        if self.attempts:
+            
+            overrides.update(unique_names(self.platform, self.spec, "p{}".format(len(self.attempts))))
+            
+        
+        try:
+            
+            operation = self.cloud.launch_instance(self.spec, overrides)
+            
+        
+        except Exception as error:
+            
+            operation = Operation.completed(self.platform, "launch", [], error = error)
+            
+        
+        operation.add_done_callback(lambda operation: self.policy.record(self.cloud, candidate, operation))
+        
+        self._overrides[id(operation)] = overrides
+        
+        self.attempts.append((candidate, operation))
+        
+    
+    def _advance(self):
+        
+        with self._advance_lock:
+            
+            if self.done:
+                
+                return
+                
+            
+            live = [operation for candidate, operation in self.attempts if not operation.done]
+            
+            for candidate, operation in self.attempts:
+                
+                if operation.ok:
+                    
+                    self.ids = list(operation.ids)
+                    
+                    for loser in live:
+                        
+                        threading.Thread(target = self._discard, args = (loser,), daemon = True).start()
+                        
+                    
+                    self._finish(operation.value)
+                    
+                    return
+                    
+                
+            
+            if not live:
+                
+                if not self._queue:
+                    
+                    self._finish(error = self.attempts[-1][1].error)
+                    
+                    return
+                    
+                
+                self._attempt()
+                
+                return
+                
+            
+            #The newest attempt is taking too long; start the next candidate next to it
+            
+            candidate, newest = self.attempts[-1]
+            
+            spill = self.policy.spill_seconds(self.cloud, candidate, self._stats)
+            
+            if self._queue and spill is not None and not newest.done and newest.seconds > spill:
+                
+                self._attempt()
+                
+            
+        
+    
+    def _discard(self, operation):
+        
+        #A slower attempt still settles, so its latency is recorded, and is then removed.
+        #Where it lives comes from the attempt itself, since there may be no inventory
+        #to look it up in.
+        
+        overrides = self._overrides[id(operation)]
+        
+        field = lambda name: overrides[name] if name in overrides else self.spec.get(name, "")
+        
+        location = {
+            
+            "aws" : ("", "", "", ""),
+            "gcp" : (field("PROJECT"), field("ZONE"), "", ""),
+            "azu" : (field("GROUP_NAME"), "", field("NIC_NAME"), field("IP_ADDRESS_NAME"))
+            
+        }[self.platform]
+        
+        try:
+            
+            wait_all([operation])
+            
+            if not operation.ok:
+                
+                return
+                
+            
+            teardowns = wait_all([self.cloud.terminate_instance(instanceId, *location) for instanceId in operation.ids])
+            
+        
+        except Exception as error:
+            
+            log.warning("could not remove losing placement attempt %s: %s", operation.ids, error)
+            
+            self.discarded.update((instanceId, _failure(error)) for instanceId in operation.ids)
+            
+            return
+            
+        
+        for teardown in teardowns:
+            
+            self.discarded[teardown.ids[0]] = {"ok" : True} if teardown.ok else _failure(teardown.error)
+            
+            if not teardown.ok:
+                
+                log.warning("could not remove losing placement attempt %s: %s", teardown.ids, teardown.error)
+                
+            
+        
+    
+    def poll(self):
+        
+        self.poll_many([self])
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        #Attempts of every placed launch are polled together by their own kind
+        
+        attempts = {}
+        
+        for operation in operations:
+            
+            for candidate, attempt in operation.attempts:
+                
+                if not attempt.done:
+                    
+                    attempts.setdefault(type(attempt), []).append(attempt)
+                    
+                
+            
+        
+        for kind, group in attempts.items():
+            
+            kind.poll_many(group)
+            
+        
+        for operation in operations:
+            
+            operation._advance()
+            
+        
+    
+    def to_dict(self):
+        
+        record = Operation.to_dict(self)
+        
+        record["attempts"] = [dict(operation.to_dict(), placement = candidate) for candidate, operation in self.attempts]
+        
+        if self.discarded:
+            
+            record["discarded"] = dict(self.discarded)
+            
+        
+        return record
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+class Cloud(object):
+    
+    def __init__(self, platform = "", region = None, credentials = None, pool = None, inventory = None, list_cache = None, scheduler = None, key_type = "rsa", metrics = None, launch_templates = None):
+        
+        self.platform = platform
+        
+        self.region = region
+        self.credentials = credentials
+        
+        self.pool = pool if pool is not None else default_pool
+        self.inventory = inventory
+        self.list_cache = list_cache if list_cache is not None else default_list_cache
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.launch_templates = launch_templates if launch_templates is not None else default_launch_templates
+        
+        self.key_type = key_type
+        
+        #Public halves of keys made by create_key, handed to launches in memory
+        
+        self._public_keys = {}
+        
+        #Key pools used by create_key; they start filling on the first key, not here,
+        #so clouds that never make keys never start worker processes
+        
+        self._key_pools = set()
+        
+        self._lock = threading.Lock()
+        self._executor = None
+        
+        #Subnet IDs per (resource group, VNet, subnet) name
+        
+        self._subnets = {}
+        
+    
+    def _client(self, kind):
+        
+        return self.pool.get(self.platform, kind, self.region, self.credentials)
+        
+    
+    def _call(self, family, function, *args, **kwargs):
+        
+        return self._call_batch(family, 1, function, *args, **kwargs)
+        
+    
+    def _call_batch(self, family, calls, function, *args, **kwargs):
+        
+        call = lambda: self.scheduler.call_batch(self.platform, family, calls, function, *args, **kwargs)
+        
+        return self.metrics.timed(call, platform = self.platform, family = family, call = getattr(function, "__name__", "call"))
+        
+
+    def create_key(self, key_name, key_type = None):
+        
+        key_type = key_type or self.key_type
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            keypair = self._call("mutate", client.create_key_pair, KeyName = key_name, KeyType = key_type)
+            
+            return keypair["KeyMaterial"]
+            
+        if self.platform == "azu":
+                
+            with self._lock:
+                
+                self._key_pools.add(key_type)
+                
+            
+            private_key, public_key = key_pool(key_type).take()
+            
+            self._public_keys[key_name] = public_key
+            
+            #The file is kept so the key outlives this process; launches use the copy above
+                
+            public_file = open(".ssh/authorized_keys/{}.pem".format(key_name), "w+")
+            public_file.write(public_key)
+            public_file.close()
+                
+            return private_key
+                
+            
+        
+
+    def launch_instance(self, specifications = [], overrides = None, placement = None):
+        
+        #specifications is a Spec or a plain dict of the same keys; overrides changes
+        #individual fields for this launch without recompiling the specification.
+        #placement is a PlacementPolicy that picks the zone or size to launch in.
+        
+        if placement is not None:
+            
+            return placement.launch(self, specifications, overrides)
+            
+        
+        spec = as_spec(self.platform, specifications)
+        
+        overrides = spec.check(overrides or {})
+        
+        values = collections.ChainMap(overrides, spec)
+        
+        operation = self._launch_instance(spec, values, spec.request(overrides))
+        
+        if self.inventory is not None and operation.ids:
+            
+            self._record_launch(operation, values)
+            
+        
+        return self._track(operation)
+        
+    
+    def stop_instance(self, instanceId, group = "", area = "", hibernate = False, deallocate = False):
+        
+        #hibernate only applies to AWS instances launched with HIBERNATE set; deallocate
+        #only to Azure, where a VM that is merely powered off is still billed for compute
+        
+        group, area = self._locate(instanceId, group, area)
+        
+        return self._track(self._stop_instance(instanceId, group, area, hibernate, deallocate))
+        
+    
+    def start_instance(self, instanceId, group = "", area = ""):
+        
+        group, area = self._locate(instanceId, group, area)
+        
+        return self._track(self._start_instance(instanceId, group, area))
+        
+    
+    def terminate_instance(self, instanceId = "", group = "", area = "", nic_name = "" , ip_name = "", key_name = ""):
+        
+        #Key pairs and key files can be shared between instances, so they are only
+        #removed when named explicitly, never because the inventory mentions them
+        
+        group, area, nic_name, ip_name = self._attached(instanceId, group, area, nic_name, ip_name)
+        
+        return self._track(self._terminate_instance(instanceId, group, area, nic_name, ip_name, key_name))
+        
+    
+    def _attached(self, instanceId, group, area, nic_name, ip_name):
+        
+        #Location and attached resource names, filled in from the inventory where not given
+        
+        row = self.inventory.get(self.platform, instanceId) if self.inventory is not None else None
+        
+        if row is not None:
+            
+            group = group or row["group_name"]
+            area = area or row["area"]
+            
+            nic_name = nic_name or row["nic_name"]
+            ip_name = ip_name or row["ip_name"]
+            
+        
+        return group, area, nic_name, ip_name
+        
+    
+    def list_instances(self, group = "", refresh = False):
+        
+        #Yield one normalized record per instance as each page arrives; GCP needs the
+        #project as group, and an Azure group narrows the listing to that resource group
+        
+        key = (self.platform, self.region, _credential_key(self.credentials), group)
+        
+        records = None if refresh else self.list_cache.get(key)
+        
+        if records is not None:
+            
+            for record in records:
+                
+                yield record
+                
+            
+            return
+            
+        
+        fetched = time.monotonic()
+        generation = self.list_cache.generation(self.platform)
+        
+        records = []
+        
+        for record in self._list_pages(group):
+            
+            records.append(record)
+            
+            yield record
+            
+        
+        self.list_cache.put(key, records, fetched, generation)
+        
+    
+    def _list_pages(self, group):
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            pages = {"MaxResults" : 1000}
+            
+            while pages is not None:
+                
+                page = self._call("describe", client.describe_instances, **pages)
+                
+                pages = {"MaxResults" : 1000, "NextToken" : page["NextToken"]} if page.get("NextToken") else None
+                
+                for reservation in page["Reservations"]:
+                    
+                    for instance in reservation["Instances"]:
+                        
+                        zone = instance.get("Placement", {}).get("AvailabilityZone", "")
+                        
+                        yield {
+                            
+                            "platform" : "aws",
+                            "id" : instance["InstanceId"],
+                            "name" : {tag["Key"] : tag["Value"] for tag in instance.get("Tags", [])}.get("Name", ""),
+                            "region" : zone[:-1] if zone else self.region or "",
+                            "group" : "",
+                            "zone" : zone,
+                            "state" : instance["State"]["Name"],
+                            "type" : instance.get("InstanceType", ""),
+                            "launched" : str(instance.get("LaunchTime", ""))
+                            
+                        }
+                        
+                    
+                
+            
+        
+        if self.platform == "gcp":
+            
+            instances = self._client("compute").instances()
+            
+            request = instances.aggregatedList(project = group, maxResults = 500)
+            
+            while request is not None:
+                
+                response = self._call("describe", request.execute)
+                
+                for scope in response.get("items", {}).values():
+                    
+                    for instance in scope.get("instances", []):
+                        
+                        zone = instance["zone"].rsplit("/", 1)[-1]
+                        
+                        yield {
+                            
+                            "platform" : "gcp",
+                            "id" : instance["name"],
+                            "name" : instance["name"],
+                            "region" : zone.rsplit("-", 1)[0],
+                            "group" : group,
+                            "zone" : zone,
+                            "state" : normalize_state("gcp", instance["status"]),
+                            "type" : instance["machineType"].rsplit("/", 1)[-1],
+                            "launched" : instance.get("creationTimestamp", "")
+                            
+                        }
+                        
+                    
+                
+                request = instances.aggregatedList_next(request, response)
+                
+            
+        
+        if self.platform == "azu":
+            
+            virtual_machines = self._client("compute").virtual_machines
+            
+            #The listing pages lazily as it is iterated. Only the subscription-wide listing
+            #can carry each VM's power state (status_only), so a group is filtered here
+            #rather than listed on its own.
+            
+            pages = self._call("describe", virtual_machines.list_all, status_only = "true")
+            
+            for vm in pages:
+                
+                if group and (_azure_group(vm.id) or "").lower() != group.lower():
+                    
+                    continue
+                    
+                
+                statuses = vm.instance_view.statuses if getattr(vm, "instance_view", None) else []
+                
+                power = [status.code for status in statuses if status.code.startswith("PowerState/")]
+                
+                yield {
+                    
+                    "platform" : "azu",
+                    "id" : vm.name,
+                    "name" : vm.name,
+                    "region" : vm.location,
+                    "group" : _azure_group(vm.id) or group,
+                    "zone" : ",".join(getattr(vm, "zones", None) or []),
+                    "state" : normalize_state("azu", power[0]) if power else "unknown",
+                    "type" : vm.hardware_profile.vm_size if getattr(vm, "hardware_profile", None) else "",
+                    "launched" : ""
+                    
+                }
+                
+            
+        
+    
+    def fetch_states(self, instanceIds, group = "", area = ""):
+        
+        #Current state of every instance, in EC2 terms, using the fewest status calls
+        #the provider allows: one describe per 1000 IDs on AWS, one filtered list per
+        #zone on GCP and concurrent instance views on Azure. IDs whose location is not
+        #given are looked up in the inventory.
+        
+        instanceIds = list(instanceIds)
+        
+        if self.platform == "aws":
+            
+            return {instanceId : description["State"]["Name"] for instanceId, description in _aws_describe(self._client("client"), instanceIds, self.scheduler).items()}
+            
+        
+        locations = {}
+        
+        for instanceId in instanceIds:
+            
+            locations.setdefault(self._locate(instanceId, group, area), []).append(instanceId)
+            
+        
+        states = {}
+        
+        if self.platform == "gcp":
+            
+            instances = self._client("compute").instances()
+            
+            for (project, zone), names in locations.items():
+                
+                for chunk in _chunked(names, GCP_FILTER_NAMES):
+                    
+                    found = {}
+                    
+                    request = instances.list(project = project, zone = zone, filter = " OR ".join('(name = "{}")'.format(name) for name in chunk), maxResults = 500)
+                    
+                    while request is not None:
+                        
+                        response = self._call("describe", request.execute)
+                        
+                        for instance in response.get("items", []):
+                            
+                            found[instance["name"]] = normalize_state("gcp", instance["status"])
+                            
+                        
+                        request = instances.list_next(request, response)
+                        
+                    
+                    for name in chunk:
+                        
+                        states[name] = found.get(name, "terminated")
+                        
+                    
+                
+            
+        
+        if self.platform == "azu":
+            
+            virtual_machines = self._client("compute").virtual_machines
+            
+            def view(location_name):
+                
+                (resource_group, _), name = location_name
+                
+                try:
+                    
+                    statuses = self._call("describe", virtual_machines.instance_view, resource_group, name).statuses
+                    
+                
+                except Exception as error:
+                    
+                    return name, "terminated" if "NotFound" in str(error) else "unknown"
+                    
+                
+                power = [status.code for status in statuses if status.code.startswith("PowerState/")]
+                
+                return name, normalize_state("azu", power[0]) if power else "pending"
+                
+            
+            views = [(location, name) for location, names in locations.items() for name in names]
+            
+            states.update(self._background().map(view, views))
+            
+        
+        return states
+        
+    
+    def wait_for_state(self, instanceIds, state, group = "", area = "", timeout = None, interval = 2.0, max_interval = 20.0, callback = None):
+        
+        #Poll every pending instance together until each reaches state (EC2 names, or
+        #the provider's own) and return its seconds-to-state, None where it timed out.
+        #callback(instanceId, seconds) is called as each one converges.
+        
+        target = state if state in TARGET_STATES.values() else normalize_state(self.platform, state)
+        
+        started = time.perf_counter()
+        
+        pending = set(instanceIds)
+        reached = {}
+        
+        delay = interval
+        
+        while pending:
+            
+            states = self.fetch_states(pending, group, area)
+            
+            converged = [instanceId for instanceId in pending if states.get(instanceId) == target]
+            
+            for instanceId in converged:
+                
+                reached[instanceId] = time.perf_counter() - started
+                pending.discard(instanceId)
+                
+                if callback is not None:
+                    
+                    callback(instanceId, reached[instanceId])
+                    
+                
+            
+            elapsed = time.perf_counter() - started
+            
+            if not pending or timeout is not None and elapsed >= timeout:
+                
+                break
+                
+            
+            #Poll quickly while instances are converging, back off while nothing moves,
+            #and jitter so that many waiters do not poll in lockstep
+            
+            delay = interval if converged else min(delay * 1.5, max_interval)
+            
+            pause = delay * random.uniform(0.8, 1.2)
+            
+            if timeout is not None:
+                
+                pause = min(pause, timeout - elapsed)
+                
+            
+            time.sleep(pause)
+            
+        
+        for instanceId in pending:
+            
+            reached[instanceId] = None
+            
+        
+        return reached
+        
+    
+    def select(self, **query):
+        
+        #IDs of this platform's inventoried instances matching region, spec_name, tag or state
+        
+        return [row["instance_id"] for row in self.inventory.find(platform = self.platform, **query)]
+        
+    
+    def _locate(self, instanceId, group, area):
+        
+        if self.inventory is not None and not (group and area):
+            
+            row = self.inventory.get(self.platform, instanceId)
+            
+            if row is not None:
+                
+                return group or row["group_name"], area or row["area"]
+                
+            
+        
+        return group, area
+        
+    
+    def _record_launch(self, operation, specifications):
+        
+        if self.platform == "aws":
+            
+            location = {"region" : self.region or "", "key_name" : specifications["KEY_NAME"]}
+            
+        
+        elif self.platform == "gcp":
+            
+            location = {"region" : specifications["ZONE"].rsplit("-", 1)[0], "group" : specifications["PROJECT"], "area" : specifications["ZONE"]}
+            
+        
+        else:
+            
+            location = {
+                
+                "region" : specifications["LOCATION"],
+                "group" : specifications["GROUP_NAME"],
+                
+                "nic_name" : specifications["NIC_NAME"],
+                "ip_name" : specifications["IP_ADDRESS_NAME"],
+                "key_name" : specifications["PUBLIC_KEY_NAME"]
+                
+            }
+            
+        
+        self.inventory.record_launch(self.platform, operation.ids, spec_name = specifications.get("SPEC_NAME", ""), tags = specifications.get("TAGS", ()), **location)
+        
+    
+    def _track(self, operation):
+        
+        #Anything cached from list_instances is stale once an operation is submitted,
+        #and again once it settles
+        
+        self.list_cache.invalidate(self.platform)
+        
+        operation.add_done_callback(lambda operation: self.list_cache.invalidate(self.platform))
+        operation.add_done_callback(self.metrics.record)
+        
+        if self.inventory is not None and operation.ids:
+            
+            self.inventory.set_state(self.platform, operation.ids, INTERIM_STATES[operation.action])
+            
+            def settle(operation):
+                
+                if operation.ok:
+                    
+                    state = TARGET_STATES[operation.action]
+                    
+                
+                else:
+                    
+                    state = "failed" if operation.action == "launch" else "unknown"
+                    
+                
+                self.inventory.set_state(self.platform, operation.ids, state)
+                
+            
+            operation.add_done_callback(settle)
+            
+        
+        return operation
+        
+    
+    def _launch_instance(self, spec, specifications, payload):
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            #The client token makes EC2 treat a retried request as the same launch
+            
+            template = self.launch_templates.get(self, payload)
+            
+            response = None
+            
+            if template is not None:
+                
+                try:
+                    
+                    response = self._call("launch", client.run_instances, ClientToken = str(uuid.uuid4()), LaunchTemplate = template, MinCount = payload["MinCount"], MaxCount = payload["MaxCount"])
+                    
+                
+                except Exception as error:
+                    
+                    if not (getattr(error, "response", None) or {}).get("Error", {}).get("Code", "").startswith("InvalidLaunchTemplate"):
+                        
+                        raise
+                        
+                    
+                    #The template was deleted elsewhere; launch inline and register it
+                    #again next time
+                    
+                    self.launch_templates.forget(self, payload)
+                    
+                
+            
+            if response is None:
+                
+                response = self._call("launch", client.run_instances, ClientToken = str(uuid.uuid4()), **payload)
+                
+            
+            instances = response["Instances"]
+            
+            operation = AwsOperation(client, "launch", [instance["InstanceId"] for instance in instances], "running", self.scheduler)
+            
+            #The response already describes the new instances
+            
+            operation.update({instance["InstanceId"] : instance for instance in instances})
+            
+            return operation
+            
+        
+        if self.platform == "gcp":
+            
+            compute = self._client("compute")
+            
+            #requestId lets GCP recognise a retried insert as the one it already has
+            
+            operation = self._call("launch", compute.instances().insert(project=specifications["PROJECT"],zone=specifications["ZONE"],body=payload,requestId=str(uuid.uuid4())).execute)
+            
+            return GcpOperation(compute, specifications["PROJECT"], specifications["ZONE"], "launch", [specifications["INSTANCE_NAME"]], operation, self.scheduler)
+         
+        
+        if self.platform == "azu":
+            
+            return self._azure_launch(specifications, payload)
+            
+        
+    
+    def launch_instances(self, specifications_list, max_workers = MAX_WORKERS):
+        
+        #Start several launches at once and return one handle per specification;
+        #a launch that cannot even be submitted comes back as a failed handle
+        
+        specifications_list = list(specifications_list)
+        
+        results = []
+        
+        if not specifications_list:
+            
+            return results
+            
+        
+        with ThreadPoolExecutor(max_workers = min(max_workers, len(specifications_list))) as executor:
+            
+            futures = [executor.submit(self.launch_instance, specifications) for specifications in specifications_list]
+            
+            for future in futures:
+                
+                try:
+                    
+                    results.append(future.result())
+                    
+                
+                except Exception as error:
+                    
+                    results.append(Operation.completed(self.platform, "launch", [], error = error))
+                    
+                
+            
+        
+        return results
+        
+    
+    def launch_copies(self, specifications, count = 1, prefix = "", overrides = None):
+        
+        #AWS launches every copy from one request; GCP and Azure need a call per copy,
+        #each with its own resource names, and GCP packs those calls into batches
+        
+        spec = as_spec(self.platform, specifications)
+        
+        if self.platform == "aws":
+            
+            return [self.launch_instance(spec, dict(overrides or {}, MIN_COUNT = count, MAX_COUNT = count))]
+            
+        
+        if count == 1 and not prefix:
+            
+            return [self.launch_instance(spec, overrides)]
+            
+        
+        #prefix keeps the names of copies from separate calls apart
+        
+        names = collections.ChainMap(overrides or {}, spec)
+        
+        copies = [dict(overrides or {}, **unique_names(self.platform, names, "{}{}".format(prefix, i + 1))) for i in range(count)]
+        
+        if self.platform == "gcp":
+            
+            return self._gcp_launches(spec, copies)
+            
+        
+        return [self.launch_instance(spec, copy) for copy in copies]
+        
+    
+    def _gcp_launches(self, spec, overrides_list):
+        
+        #Inserts packed into batch HTTP requests; a copy GCP refused comes back as a
+        #failed handle, like launch_instances does
+        
+        compute = self._client("compute")
+        instances = compute.instances()
+        
+        launches = [collections.ChainMap(spec.check(overrides), spec) for overrides in overrides_list]
+        
+        requests = [(index, instances.insert(project = values["PROJECT"], zone = values["ZONE"], body = spec.request(values.maps[0]), requestId = str(uuid.uuid4()))) for index, values in enumerate(launches)]
+        
+        outcomes = _gcp_batch(compute, requests, self.scheduler, "launch", lambda batch, calls: self._call_batch("launch", calls, batch.execute))
+        
+        operations = []
+        
+        for index, values in enumerate(launches):
+            
+            response, error = outcomes[index]
+            
+            if error is not None:
+                
+                operations.append(Operation.completed(self.platform, "launch", [], error = error))
+                
+                continue
+                
+            
+            operation = GcpOperation(compute, values["PROJECT"], values["ZONE"], "launch", [values["INSTANCE_NAME"]], response, self.scheduler)
+            
+            if self.inventory is not None:
+                
+                self._record_launch(operation, values)
+                
+            
+            operations.append(self._track(operation))
+            
+        
+        return operations
+        
+    
+    def _background(self):
+        
+        #Small pool for leaf lookups that overlap with other provisioning steps
+        
+        with self._lock:
+            
+            if self._executor is None:
+                
+                self._executor = ThreadPoolExecutor(max_workers = MAX_WORKERS)
+                
+            
+            return self._executor
+            
+        
+    
+    def close(self):
+        
+        #Stops the background pool and the key pools this cloud has drawn keys from
+        
+        with self._lock:
+            
+            executor, self._executor = self._executor, None
+            
+            key_types, self._key_pools = self._key_pools, set()
+            
+        
+        if executor is not None:
+            
+            executor.shutdown(wait = False)
+            
+        
+        for key_type in key_types:
+            
+            key_pool(key_type).close()
+            
+        
+    
+    def _azure_subnet_id(self, group, vnet_name, subnet_name):
+        
+        key = (group, vnet_name, subnet_name)
+        
+        subnet_id = self._subnets.get(key)
+        
+        if subnet_id is None:
+            
+            subnet_id = self._call("describe", self._client("network").subnets.get, group, vnet_name, subnet_name).id
+            
+            self._subnets[key] = subnet_id
+            
+        
+        return subnet_id
+        
+    
+    def _azure_launch(self, specifications, payload):
+        
+        compute_client = self._client("compute")
+        network_client = self._client("network")
+        
+        group = specifications["GROUP_NAME"]
+        
+        vm_parameters = payload["vm"]
+        
+        if not specifications["PUBLIC_KEY"]:
+            
+            key_data = self._public_keys.get(specifications["PUBLIC_KEY_NAME"])
+            
+            if key_data is None:
+                
+                with open(".ssh/authorized_keys/{}.pem".format(specifications["PUBLIC_KEY_NAME"]), "r") as key_file:
+                    
+                    key_data = key_file.read()
+                    
+                
+            
+            vm_parameters = _patched(vm_parameters, {AzureSpec.KEY_DATA_PATH : key_data})
+            
+        
+        #The subnet lookup does not depend on the public IP, so it runs alongside it
+        
+        subnet = self._background().submit(self._azure_subnet_id, group, specifications["VNET_NAME"], specifications["SUBNET_NAME"])
+        
+        def create_ip(previous):
+            
+            return self._call("mutate", network_client.public_ip_addresses.create_or_update, group, specifications["IP_ADDRESS_NAME"], payload["ip"])
+            
+        
+        def create_nic(ip):
+            
+            nic_parameters = _patched(payload["nic"], {AzureSpec.IP_ID_PATH : ip.id, AzureSpec.SUBNET_ID_PATH : subnet.result()})
+            
+            return self._call("mutate", network_client.network_interfaces.create_or_update, group, specifications["NIC_NAME"], nic_parameters)
+            
+        
+        def create_vm(nic):
+            
+            return self._call("launch", compute_client.virtual_machines.create_or_update, group, specifications["VM_NAME"], _patched(vm_parameters, {AzureSpec.NIC_ID_PATH : nic.id}))
+            
+        
+        return AzureOperation("launch", [specifications["VM_NAME"]], [create_ip, create_nic, create_vm])
+        
+    
+
+    def _stop_instance(self, instanceId, group, area, hibernate = False, deallocate = False):
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            self._call("mutate", client.stop_instances,
+                
+                InstanceIds = [
+                    
+                    instanceId
+                    
+                ],
+                
+                Hibernate = hibernate
+                
+            )
+            
+            return AwsOperation(client, "stop", [instanceId], "stopped", self.scheduler)
+          
+        
+        if self.platform == "gcp":
+            
+            compute = self._client("compute")
+            
+            operation = self._call("mutate", compute.instances().stop(
+                
+                project = group,
+                
+                zone = area,
+                
+                instance = instanceId,
+                
+                requestId = str(uuid.uuid4())
+                
+            ).execute)
+            
+            return GcpOperation(compute, group, area, "stop", [instanceId], operation, self.scheduler)
+            
+        
+        if self.platform == "azu":
+            
+            compute_client = self._client("compute")
+            
+            stop = compute_client.virtual_machines.deallocate if deallocate else compute_client.virtual_machines.power_off
+            
+            return AzureOperation("stop", [instanceId], [lambda previous: self._call("mutate", stop, group, instanceId)])
+            
+        
+    
+    def _start_instance(self, instanceId, group, area):
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            self._call("mutate", client.start_instances,
+                
+                InstanceIds = [
+                    
+                    instanceId
+                    
+                ]
+                
+            )
+            
+            return AwsOperation(client, "start", [instanceId], "running", self.scheduler)
+            
+        
+        if self.platform == "gcp":
+            
+            compute = self._client("compute")
+            
+            operation = self._call("mutate", compute.instances().start(
+                
+                project = group,
+                
+                zone = area,
+                
+                instance = instanceId,
+                
+                requestId = str(uuid.uuid4())
+                
+            ).execute)
+            
+            return GcpOperation(compute, group, area, "start", [instanceId], operation, self.scheduler)
+            
+        
+        if self.platform == "azu":
+            
+            compute_client = self._client("compute")
+            
+            return AzureOperation("start", [instanceId], [lambda previous: self._call("mutate", compute_client.virtual_machines.start, group, instanceId)])
+            
+        
+
+    def _terminate_instance(self, instanceId, group, area, nic_name, ip_name, key_name):
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            self._call("mutate", client.terminate_instances,
+                
+                InstanceIds = [
+                    
+                    instanceId
+                    
+                ],
+                
+            )
+
+            if key_name != "":
+
+                self._call("mutate", client.delete_key_pair, KeyName=key_name)
+                
+            
+            return AwsOperation(client, "terminate", [instanceId], "terminated", self.scheduler)
+            
+        
+        if self.platform == "gcp":
+            
+            compute = self._client("compute")
+            
+            operation = self._call("mutate", compute.instances().delete(
+                
+                project = group,
+                
+                zone = area,
+                
+                instance = instanceId,
+                
+                requestId = str(uuid.uuid4())
+                
+            ).execute)
+            
+            return GcpOperation(compute, group, area, "terminate", [instanceId], operation, self.scheduler)
+            
+        
+        if self.platform == "azu":
+            
+            return Teardown(self).start([TeardownOperation(instanceId, group, nic_name, ip_name, key_name)])[0]
+            
+        
+
+    #Bulk variants: IDs are split into the largest batch each provider allows, batches
+    #run concurrently, and the result maps every instance ID to its own outcome. Each
+    #successful outcome carries the handle of the operation that covers it.
+    
+    def stop_instances(self, instanceIds, group = "", area = "", max_workers = MAX_WORKERS):
+        
+        return self._bulk("stop", instanceIds, group, area, max_workers)
+        
+    
+    def start_instances(self, instanceIds, group = "", area = "", max_workers = MAX_WORKERS):
+        
+        return self._bulk("start", instanceIds, group, area, max_workers)
+        
+    
+    def terminate_instances(self, instanceIds, group = "", area = "", nic_names = None, ip_names = None, key_names = None, max_workers = MAX_WORKERS):
+        
+        if self.platform == "azu":
+            
+            #Each Azure VM drags its own NIC, IP and key along. One teardown covers all of
+            #them, so every layer of deletes overlaps across the whole set. Nothing is
+            #accepted up front the way a bulk call is, so each ID reports how its own
+            #teardown settled.
+            
+            nic_names = nic_names or {}
+            ip_names = ip_names or {}
+            key_names = key_names or {}
+            
+            results = {}
+            operations = []
+            
+            for instanceId in instanceIds:
+                
+                try:
+                    
+                    vm_group, _, nic_name, ip_name = self._attached(instanceId, group, area, nic_names.get(instanceId, ""), ip_names.get(instanceId, ""))
+                    
+                
+                except Exception as error:
+                    
+                    results[instanceId] = _failure(error)
+                    
+                    continue
+                    
+                
+                operations.append(self._track(TeardownOperation(instanceId, vm_group, nic_name, ip_name, key_names.get(instanceId, ""))))
+                
+            
+            if operations:
+                
+                Teardown(self, max_workers).run(operations)
+                
+            
+            for operation in operations:
+                
+                results[operation.ids[0]] = dict({"ok" : True} if operation.ok else _failure(operation.error), operation = operation)
+                
+            
+            return results
+            
+        
+        results = self._bulk("terminate", instanceIds, group, area, max_workers)
+        
+        if self.platform == "aws":
+            
+            client = self._client("client")
+            
+            for key_name in key_names or ():
+                
+                try:
+                    
+                    self._call("mutate", client.delete_key_pair, KeyName = key_name)
+                    
+                
+                except Exception as error:
+                    
+                    #Reported next to the instances, whose terminations stand
+                    
+                    results["key-pair:{}".format(key_name)] = _failure(error)
+                    
+                
+            
+        
+        return results
+        
+    
+    def _bulk(self, action, instanceIds, group, area, max_workers):
+        
+        return self._run_chunks(instanceIds, lambda chunk: self._bulk_call(action, chunk, group, area), max_workers)
+        
+    
+    def _run_chunks(self, instanceIds, call, max_workers):
+        
+        chunks = list(_chunked(list(instanceIds), BATCH_LIMITS[self.platform]))
+        
+        results = {}
+        
+        if not chunks:
+            
+            return results
+            
+        
+        with ThreadPoolExecutor(max_workers = min(max_workers, len(chunks))) as executor:
+            
+            futures = [(executor.submit(call, chunk), chunk) for chunk in chunks]
+            
+            for future, chunk in futures:
+                
+                try:
+                    
+                    results.update(future.result())
+                    
+                
+                except Exception as error:
+                    
+                    for instanceId in chunk:
+                        
+                        results[instanceId] = _failure(error)
+                        
+                    
+                
+            
+        
+        return results
+        
+    
+    def _bulk_call(self, action, chunk, group, area):
+        
+        if self.platform == "aws":
+            
+            method, key = {
+                
+                "stop" : ("stop_instances", "StoppingInstances"),
+                "start" : ("start_instances", "StartingInstances"),
+                "terminate" : ("terminate_instances", "TerminatingInstances")
+                
+            }[action]
+            
+            try:
+                
+                response = self._call("mutate", getattr(self._client("client"), method), InstanceIds = chunk)
+                
+            
+            except Exception as error:
+                
+                #A single bad ID fails the whole request, so bisect until it is isolated.
+                #Any other error (access, exhausted throttling retries) would fail every
+                #half the same way, and splitting would only multiply the calls.
+                
+                code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code", "")
+                
+                if len(chunk) == 1 or not code.startswith("InvalidInstanceID"):
+                    
+                    return {instanceId : _failure(error) for instanceId in chunk}
+                    
+                
+                
+                middle = len(chunk) // 2
+                
+                results = self._bulk_call(action, chunk[:middle], group, area)
+                results.update(self._bulk_call(action, chunk[middle:], group, area))
+                
+                return results
+                
+            
+            items = response[key]
+            
+            operation = self._track(AwsOperation(self._client("client"), action, [item["InstanceId"] for item in items], TARGET_STATES[action], self.scheduler))
+            
+            return {item["InstanceId"] : {"ok" : True, "state" : item["CurrentState"]["Name"], "operation" : operation} for item in items}
+            
+        
+        if self.platform == "gcp":
+            
+            return self._gcp_bulk_call(action, chunk, group, area)
+            
+        
+        single = {"stop" : self.stop_instance, "start" : self.start_instance, "terminate" : self.terminate_instance}[action]
+        
+        return {instanceId : {"ok" : True, "operation" : single(instanceId, group, area)} for instanceId in chunk}
+        
+    
+    def _gcp_bulk_call(self, action, chunk, group, area):
+        
+        #One batch HTTP request for the whole chunk, which may span zones
+        
+        compute = self._client("compute")
+        
+        method = getattr(compute.instances(), {"stop" : "stop", "start" : "start", "terminate" : "delete"}[action])
+        
+        locations = {instanceId : self._locate(instanceId, group, area) for instanceId in chunk}
+        
+        requests = [(instanceId, method(project = project, zone = zone, instance = instanceId, requestId = str(uuid.uuid4()))) for instanceId, (project, zone) in locations.items()]
+        
+        outcomes = _gcp_batch(compute, requests, self.scheduler, "mutate", lambda batch, calls: self._call_batch("mutate", calls, batch.execute))
+        
+        results = {}
+        
+        for instanceId, (response, error) in outcomes.items():
+            
+            if error is not None:
+                
+                results[instanceId] = _failure(error)
+                
+                continue
+                
+            
+            project, zone = locations[instanceId]
+            
+            results[instanceId] = {"ok" : True, "operation" : self._track(GcpOperation(compute, project, zone, action, [instanceId], response, self.scheduler))}
+            
+        
+        return results
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Azure teardown for many VMs at once. Every VM brings up to four resources, and each is
+#deleted as soon as the one it hangs off is gone: the NIC once its VM is, the public IP
+#once its NIC is, the local key file once the VM is. Deletes are submitted from a thread
+#pool and their pollers checked together, so N VMs take about three long-running
+#operations rather than 3N.
+
+TEARDOWN_DEPENDS = {"vm" : None, "nic" : "vm", "ip" : "nic", "key" : "vm"}
+
+class TeardownOperation(Operation):
+    
+    poll_interval = (0.2, 1.0, 1.5)
+    
+    def __init__(self, instanceId, group, nic_name = "", ip_name = "", key_name = ""):
+        
+        Operation.__init__(self, "azu", "terminate", [instanceId])
+        
+        self.group = group
+        
+        self.resources = {"vm" : instanceId, "nic" : nic_name, "ip" : ip_name, "key" : key_name}
+        
+        #{resource kind : {"name", "ok", "seconds", and "error", "skipped" or "absent"}}
+        
+        self.outcomes = {}
+        
+    
+    def to_dict(self):
+        
+        record = Operation.to_dict(self)
+        
+        record["resources"] = self.outcomes
+        
+        return record
+        
+    
+
+class Teardown(object):
+    
+    def __init__(self, cloud, max_workers = MAX_WORKERS):
+        
+        self.cloud = cloud
+        self.max_workers = max_workers
+        
+    
+    def start(self, operations):
+        
+        #Runs the teardown on its own thread; the handles finish as their VMs are cleared
+        
+        operations = list(operations)
+        
+        if operations:
+            
+            threading.Thread(target = self.run, args = (operations,), daemon = True).start()
+            
+        
+        return operations
+        
+    
+    def _delete(self, operation, kind):
+        
+        name = operation.resources[kind]
+        
+        if kind == "key":
+            
+            os.remove(".ssh/authorized_keys/{}.pem".format(name))
+            
+            return None
+            
+        
+        if kind == "vm":
+            
+            delete = self.cloud._client("compute").virtual_machines.delete
+            
+        
+        elif kind == "nic":
+            
+            delete = self.cloud._client("network").network_interfaces.delete
+            
+        
+        else:
+            
+            delete = self.cloud._client("network").public_ip_addresses.delete
+            
+        
+        return self.cloud._call("mutate", delete, operation.group, name)
+        
+    
+    def run(self, operations):
+        
+        first, ceiling, growth = TeardownOperation.poll_interval
+        
+        submitting = {}
+        polling = []
+        
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            
+            def schedule(operation, parent):
+                
+                for kind, depends in TEARDOWN_DEPENDS.items():
+                    
+                    if depends != parent:
+                        
+                        continue
+                        
+                    
+                    if operation.resources[kind]:
+                        
+                        submitting[executor.submit(self._delete, operation, kind)] = (operation, kind, time.perf_counter())
+                        
+                    
+                    else:
+                        
+                        #Nothing known to delete; whatever hangs off it can still go
+                        
+                        settle(operation, kind, {"name" : "", "ok" : True, "skipped" : True})
+                        
+                    
+                
+            
+            def settle(operation, kind, outcome):
+                
+                operation.outcomes[kind] = outcome
+                
+                if outcome["ok"]:
+                    
+                    schedule(operation, kind)
+                    
+                
+                else:
+                    
+                    block(operation, kind)
+                    
+                
+                if len(operation.outcomes) == len(TEARDOWN_DEPENDS):
+                    
+                    failed = [kind for kind in TEARDOWN_DEPENDS if not operation.outcomes[kind]["ok"]]
+                    
+                    error = RuntimeError("could not delete {} of {}".format(", ".join(failed), operation.ids[0])) if failed else None
+                    
+                    operation._finish(operation.outcomes, error)
+                    
+                
+            
+            def block(operation, parent):
+                
+                for kind, depends in TEARDOWN_DEPENDS.items():
+                    
+                    if depends == parent:
+                        
+                        operation.outcomes[kind] = {"name" : operation.resources[kind], "ok" : False, "error" : "not attempted, {} was not deleted".format(parent)}
+                        
+                        block(operation, kind)
+                        
+                    
+                
+            
+            def deleted(operation, kind, started, error = None):
+                
+                seconds = time.perf_counter() - started
+                
+                outcome = {"name" : operation.resources[kind], "ok" : error is None, "seconds" : round(seconds, 3)}
+                
+                if error is not None:
+                    
+                    if isinstance(error, FileNotFoundError) or "NotFound" in str(error):
+                        
+                        #Already gone counts as deleted
+                        
+                        outcome.update(ok = True, absent = True)
+                        
+                    
+                    else:
+                        
+                        outcome["error"] = _failure(error)["error"]
+                        
+                    
+                
+                operation.steps.append(("delete_" + kind, seconds, outcome["ok"]))
+                
+                settle(operation, kind, outcome)
+                
+            
+            for operation in operations:
+                
+                schedule(operation, None)
+                
+            
+            delay = first
+            
+            while submitting or polling:
+                
+                progressed = False
+                
+                if submitting:
+                    
+                    finished, _ = futures_wait(list(submitting), timeout = delay if polling else None, return_when = FIRST_COMPLETED)
+                    
+                    for future in finished:
+                        
+                        operation, kind, started = submitting.pop(future)
+                        
+                        progressed = True
+                        
+                        try:
+                            
+                            poller = future.result()
+                            
+                        
+                        except Exception as error:
+                            
+                            deleted(operation, kind, started, error)
+                            
+                            continue
+                            
+                        
+                        if hasattr(poller, "done") and hasattr(poller, "result"):
+                            
+                            polling.append((operation, kind, started, poller))
+                            
+                        
+                        else:
+                            
+                            deleted(operation, kind, started)
+                            
+                        
+                    
+                
+                elif polling:
+                    
+                    time.sleep(delay)
+                    
+                
+                still_polling = []
+                
+                for operation, kind, started, poller in polling:
+                    
+                    if not poller.done():
+                        
+                        still_polling.append((operation, kind, started, poller))
+                        
+                        continue
+                        
+                    
+                    progressed = True
+                    
+                    try:
+                        
+                        poller.result()
+                        
+                    
+                    except Exception as error:
+                        
+                        deleted(operation, kind, started, error)
+                        
+                    
+                    else:
+                        
+                        deleted(operation, kind, started)
+                        
+                    
+                
+                polling = still_polling
+                
+                delay = first if progressed else min(delay * growth, ceiling)
+                
+            
+        
+        return operations
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Concurrent launch jobs allowed per provider during a fan-out
+
+FAN_OUT_LIMITS = {"aws" : 4, "gcp" : 8, "azu" : 8}
+
+#Runs (platform, specifications, count) launch jobs concurrently on a bounded pool and
+#yields one record per job as soon as all of its instances are running. Jobs are read
+#lazily, so the job source can be a generator of any length. A job may add overrides and
+#a name prefix, (platform, specifications, count, overrides, prefix), which go to
+#launch_copies.
+
+class FanOut(object):
+    
+    def __init__(self, limits = None, pool = None, timeout = None, inventory = None):
+        
+        self.limits = dict(FAN_OUT_LIMITS)
+        self.limits.update(limits or {})
+        
+        self.pool = pool
+        self.inventory = inventory
+        self.timeout = timeout
+        
+        self.elapsed = None
+        
+        self._semaphores = {platform : threading.BoundedSemaphore(limit) for platform, limit in self.limits.items()}
+        self._clouds = {}
+        self._lock = threading.Lock()
+        
+    
+    def _cloud(self, platform):
+        
+        #Jobs of one platform run on several workers at once
+        
+        with self._lock:
+            
+            if platform not in self._clouds:
+                
+                self._clouds[platform] = Cloud(platform, pool = self.pool, inventory = self.inventory)
+                
+            
+            return self._clouds[platform]
+        
+    
+    def _launch(self, platform, specifications, count, started, overrides = None, prefix = ""):
+        
+        with self._semaphores[platform]:
+            
+            job_started = time.perf_counter()
+            
+            cloud = self._cloud(platform)
+            
+            operations = cloud.launch_copies(specifications, count, prefix, overrides)
+            
+            wait_all(operations, self.timeout)
+            
+        
+        now = time.perf_counter()
+        
+        errors = [_failure(operation.error)["error"] for operation in operations if operation.done and not operation.ok]
+        
+        if any(not operation.done for operation in operations):
+            
+            errors.append("timed out")
+            
+        
+        record = {
+            
+            "platform" : platform,
+            "count" : count,
+            "ok" : not errors,
+            "ids" : [i for operation in operations for i in operation.ids],
+            "seconds" : round(now - job_started, 3),
+            "elapsed" : round(now - started, 3)
+            
+        }
+        
+        if overrides:
+            
+            record["overrides"] = overrides
+            
+        
+        if errors:
+            
+            record["errors"] = errors
+            
+        
+        return record
+        
+    
+    def run(self, jobs, max_workers = None):
+        
+        started = time.perf_counter()
+        
+        def launch(job):
+            
+            return self._launch(job[0], job[1], job[2], started, *job[3:])
+            
+        
+        for job, future in _bounded_map(launch, jobs, max_workers or sum(self.limits.values())):
+            
+            try:
+                
+                yield future.result()
+                
+            
+            except Exception as error:
+                
+                yield {"platform" : job[0], "count" : job[2], "ok" : False, "ids" : [], "errors" : [_failure(error)["error"]], "elapsed" : round(time.perf_counter() - started, 3)}
+                
+            
+        
+        self.elapsed = time.perf_counter() - started
+        
+    
+
+def fan_out(jobs, limits = None, pool = None, timeout = None, inventory = None):
+    
+    return FanOut(limits, pool, timeout, inventory).run(jobs)
+    
+
+#----------------------------------------------------------------------------------------
+
+#Spec matrices: a base spec plus axes, each a field and the values it takes, expands to
+#one launch job per combination, e.g. for GCP
+#
+#   {"DISK_SOURCE_IMAGE" : ["projects/debian-cloud/global/images/family/debian-11", ...],
+#    "zone" : [{"ZONE" : "us-east1-b", "MACHINE_TYPE" : "zones/us-east1-b/machineTypes/e2-small"}, ...],
+#    "count" : [1, 5]}
+#
+#An axis whose values are dicts sets several fields together and its own name is only a
+#label; the "count" axis is the number of copies per job. Jobs are generated as they are
+#read, so FanOut only ever holds the few it is running, and each job gets a name prefix
+#that keeps INSTANCE_NAME, VM_NAME, NIC_NAME and IP_ADDRESS_NAME apart across cells and
+#across runs.
+
+class SpecMatrix(object):
+    
+    def __init__(self, platform, base, axes, prefix = None):
+        
+        self.platform = platform
+        self.spec = as_spec(platform, base)
+        
+        self.axes = [(name, list(values)) for name, values in (axes.items() if isinstance(axes, dict) else axes)]
+        
+        #Run tag: names from two expansions of the same matrix must not collide
+        
+        self.prefix = "m{}-".format(uuid.uuid4().hex[:4]) if prefix is None else prefix
+        
+        for name, values in self.axes:
+            
+            if not values:
+                
+                raise ValueError("matrix axis {} has no values".format(name))
+                
+            
+            if name == "count":
+                
+                if any(int(value) < 1 for value in values):
+                    
+                    raise ValueError("matrix counts must be at least 1")
+                    
+                
+                continue
+                
+            
+            #Unknown fields and bad values fail here, not thousands of launches later
+            
+            for value in values:
+                
+                self.spec.check(value if isinstance(value, dict) else {name : value})
+                
+            
+        
+    
+    def __len__(self):
+        
+        #Number of jobs
+        
+        cells = 1
+        
+        for name, values in self.axes:
+            
+            cells *= len(values)
+            
+        
+        return cells
+        
+    
+    @property
+    def instances(self):
+        
+        counts = dict(self.axes).get("count", [1])
+        
+        return len(self) // len(counts) * sum(int(count) for count in counts)
+        
+    
+    def cells(self):
+        
+        #(overrides, count) per combination, in axis order
+        
+        for combination in itertools.product(*(values for name, values in self.axes)):
+            
+            overrides = {}
+            count = 1
+            
+            for (name, values), value in zip(self.axes, combination):
+                
+                if name == "count":
+                    
+                    count = int(value)
+                    
+                
+                elif isinstance(value, dict):
+                    
+                    overrides.update(value)
+                    
+                
+                else:
+                    
+                    overrides[name] = value
+                    
+                
+            
+            yield overrides, count
+            
+        
+    
+    def __iter__(self):
+        
+        #FanOut jobs
+        
+        for index, (overrides, count) in enumerate(self.cells()):
+            
+            yield (self.platform, self.spec, count, overrides, "{}{}-".format(self.prefix, index + 1))
+            
+        
+    
+
+def launch_matrix(platform, base, axes, limits = None, pool = None, timeout = None, inventory = None, max_workers = None):
+    
+    return FanOut(limits, pool, timeout, inventory).run(SpecMatrix(platform, base, axes), max_workers)
+    
+
+#----------------------------------------------------------------------------------------
+
+#Warm pools: stopped instances built ahead of time from one spec and handed out by
+#starting them, which skips the cold boot and, on Azure, the IP/NIC/VM chain. A
+#background refill keeps the pool at its size. With an inventory, members carry a tag,
+#so a new pool picks up the instances an earlier process left stopped.
+
+WARM_POOL_TAG = "warm-pool:{}"
+
+#Seconds before a refill is tried again after a round that came up short, doubling
+#with each such round in a row up to the ceiling
+
+WARM_POOL_BACKOFF = 5.0
+WARM_POOL_MAX_BACKOFF = 600.0
+
+#Acquire latencies kept for the percentiles in stats()
+
+ACQUIRE_SAMPLES = 1000
+
+def _percentile(values, q):
+    
+    if not values:
+        
+        return None
+        
+    
+    ordered = sorted(values)
+    
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+
+class WarmPool(object):
+    
+    def __init__(self, cloud, specifications, size = 2, hibernate = False, timeout = None):
+        
+        self.cloud = cloud
+        self.spec = as_spec(cloud.platform, specifications)
+        
+        self.size = size
+        self.timeout = timeout
+        
+        #Only EC2 hibernates; elsewhere members are plain stopped instances
+        
+        self.hibernate = hibernate and cloud.platform == "aws"
+        
+        self.tag = WARM_POOL_TAG.format(self.spec["SPEC_NAME"] or LaunchTemplates.digest(self.spec.template())[:12])
+        
+        #Where members live when there is no inventory to look them up in
+        
+        self.group, self.area = {
+            
+            "aws" : ("", ""),
+            "gcp" : (self.spec.get("PROJECT"), self.spec.get("ZONE")),
+            "azu" : (self.spec.get("GROUP_NAME"), "")
+            
+        }[cloud.platform]
+        
+        self._ready = collections.deque()
+        self._building = 0
+        self._refilling = False
+        self._closed = False
+        
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.refill_failures = 0
+        
+        #Most recent reason a build came up short, and when refilling may resume
+        
+        self.last_error = None
+        
+        self._short_rounds = 0
+        self._retry_at = 0.0
+        
+        self._latencies = {"hit" : collections.deque(maxlen = ACQUIRE_SAMPLES), "miss" : collections.deque(maxlen = ACQUIRE_SAMPLES)}
+        
+        if cloud.inventory is not None:
+            
+            for row in cloud.inventory.find(platform = cloud.platform, tag = self.tag, state = "stopped"):
+                
+                self._ready.append((row["instance_id"], row["group_name"], row["area"]))
+                
+            
+        
+    
+    def acquire(self):
+        
+        #Handle that finishes once an instance is running: a member being started on a
+        #hit, a cold launch on a miss
+        
+        started = time.perf_counter()
+        
+        with self._lock:
+            
+            member = self._ready.popleft() if self._ready else None
+            
+            if member is not None:
+                
+                self.hits += 1
+                
+            
+            else:
+                
+                self.misses += 1
+                
+            
+        
+        if member is not None:
+            
+            instanceId, group, area = member
+            
+            if self.cloud.inventory is not None:
+                
+                self.cloud.inventory.untag(self.cloud.platform, [instanceId], self.tag)
+                
+            
+            operation = self.cloud.start_instance(instanceId, group, area)
+            
+        
+        else:
+            
+            operation = self.cloud.launch_copies(self.spec, 1, self._prefix())[0]
+            
+        
+        outcome = "hit" if member is not None else "miss"
+        
+        operation.add_done_callback(lambda operation: self._acquired(outcome, started, operation))
+        
+        self.refill()
+        
+        return operation
+        
+    
+    def _acquired(self, outcome, started, operation):
+        
+        seconds = time.perf_counter() - started
+        
+        with self._lock:
+            
+            self._latencies[outcome].append(seconds)
+            
+        
+        self.cloud.metrics.observe("cloud_vms_acquire_seconds", seconds, operation.ok, platform = self.cloud.platform, outcome = outcome)
+        
+    
+    def _prefix(self):
+        
+        return "w{}-".format(uuid.uuid4().hex[:6])
+        
+    
+    def refill(self):
+        
+        #Starts a background refill unless one is running or the pool is full
+        
+        with self._lock:
+            
+            if self._refilling or self._closed or len(self._ready) >= self.size or time.monotonic() < self._retry_at:
+                
+                return
+                
+            
+            self._refilling = True
+            
+        
+        self.cloud._background().submit(self._refill)
+        
+    
+    def _refill(self):
+        
+        try:
+            
+            while True:
+                
+                with self._lock:
+                    
+                    deficit = self.size - len(self._ready)
+                    
+                    if deficit <= 0 or self._closed:
+                        
+                        return
+                        
+                    
+                    self._building = deficit
+                    
+                
+                #A round that comes up short ends the refill; the next acquire retries
+                
+                if self._build(deficit) < deficit:
+                    
+                    return
+                    
+                
+            
+        
+        finally:
+            
+            with self._lock:
+                
+                self._refilling = False
+                self._building = 0
+                
+            
+        
+    
+    def _build(self, count):
+        
+        overrides = {"TAGS" : self.spec["TAGS"] + (self.tag,)}
+        
+        if self.hibernate:
+            
+            overrides["HIBERNATE"] = True
+            
+        
+        launches = []
+        stops = []
+        
+        errors = []
+        
+        try:
+            
+            launches = wait_all(self.cloud.launch_copies(self.spec, count, self._prefix(), overrides), self.timeout)
+            
+            for operation in launches:
+                
+                for instanceId in operation.ids if operation.ok else []:
+                    
+                    #Azure members are deallocated, since a powered-off VM still bills
+                    
+                    stops.append(self.cloud.stop_instance(instanceId, self.group, self.area, self.hibernate, deallocate = self.cloud.platform == "azu"))
+                    
+                
+            
+            wait_all(stops, self.timeout)
+            
+        
+        except Exception as error:
+            
+            errors.append(_failure(error)["error"])
+            
+        
+        finally:
+            
+            for operation in launches + stops:
+                
+                if not operation.done:
+                    
+                    errors.append("{} of {} timed out".format(operation.action, ", ".join(operation.ids) or "an instance"))
+                    
+                
+                elif not operation.ok:
+                    
+                    errors.append(_failure(operation.error)["error"])
+                    
+                
+            
+            built = [operation.ids[0] for operation in stops if operation.ok]
+            
+            #Anything launched that did not make it to stopped (a failed or timed out
+            #stop, or a round cut short by an error) is terminated, not left running
+            
+            strays = [instanceId for operation in launches for instanceId in operation.ids if instanceId not in built]
+            
+            if strays:
+                
+                try:
+                    
+                    self.cloud.terminate_instances(strays, self.group, self.area)
+                    
+                
+                except Exception as error:
+                    
+                    errors.append(_failure(error)["error"])
+                    
+                
+            
+        
+        with self._lock:
+            
+            self._ready.extend((instanceId, self.group, self.area) for instanceId in built)
+            
+            self.refill_failures += count - len(built)
+            
+            if errors:
+                
+                self.last_error = errors[-1]
+                
+            
+            #A short round holds off the next refill, for longer each time in a row
+            
+            if len(built) < count:
+                
+                self._short_rounds += 1
+                
+                self._retry_at = time.monotonic() + min(WARM_POOL_MAX_BACKOFF, WARM_POOL_BACKOFF * 2 ** (self._short_rounds - 1))
+                
+            
+            else:
+                
+                self._short_rounds = 0
+                self._retry_at = 0.0
+                
+            
+        
+        return len(built)
+        
+    
+    def stats(self):
+        
+        with self._lock:
+            
+            requests = self.hits + self.misses
+            
+            stats = {
+                
+                "spec" : self.spec["SPEC_NAME"],
+                "size" : self.size,
+                "ready" : len(self._ready),
+                "building" : self._building,
+                
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "hit_rate" : round(self.hits / requests, 3) if requests else None,
+                
+                "refill_failures" : self.refill_failures,
+                "last_error" : self.last_error,
+                "retry_in" : round(max(0.0, self._retry_at - time.monotonic()), 3)
+                
+            }
+            
+            for outcome, latencies in self._latencies.items():
+                
+                for name, q in (("p50", 0.5), ("p99", 0.99)):
+                    
+                    seconds = _percentile(latencies, q)
+                    
+                    stats["{}_{}".format(outcome, name)] = None if seconds is None else round(seconds, 3)
+                    
+                
+            
+        
+        return stats
+        
+    
+    def close(self, drain = False):
+        
+        #Stops refilling; drain also terminates the members still in the pool
+        
+        with self._lock:
+            
+            self._closed = True
+            
+            members = list(self._ready) if drain else []
+            
+            if drain:
+                
+                self._ready.clear()
+                
+            
+        
+        if not members:
+            
+            return {}
+            
+        
+        return self.cloud.terminate_instances([instanceId for instanceId, group, area in members], self.group, self.area)
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Status watcher: one cache of instance states for everything tracked in the process. A
+#single poll loop per provider and region refreshes all of its instances with the
+#fewest status calls fetch_states can make, polling quickly while anything is changing
+#and backing off while everything is steady. Subscribers hear about transitions through
+#a callback or a queue instead of polling on their own.
+
+WATCH_INTERVAL = 2.0
+WATCH_MAX_INTERVAL = 30.0
+
+#States that are about to change by themselves
+
+TRANSITIONAL_STATES = ("pending", "stopping", "shutting-down")
+
+class Subscription(object):
+    
+    #Transitions matching the filters go to callback(event) or, without one, to queue.
+    #An event is {"platform", "id", "old", "new", "at"}; old is None on the first
+    #observation.
+    
+    def __init__(self, watcher, callback = None, platform = None, ids = None, states = None):
+        
+        self.watcher = watcher
+        self.callback = callback
+        
+        self.platform = platform
+        self.ids = None if ids is None else set(ids)
+        self.states = None if states is None else set(states)
+        
+        self.queue = None if callback else queue.Queue()
+        
+    
+    def matches(self, event):
+        
+        return (self.platform is None or event["platform"] == self.platform) and (self.ids is None or event["id"] in self.ids) and (self.states is None or event["new"] in self.states)
+        
+    
+    def deliver(self, event):
+        
+        if self.callback is None:
+            
+            self.queue.put(event)
+            
+            return
+            
+        
+        try:
+            
+            self.callback(event)
+            
+        
+        except Exception:
+            
+            #A failing subscriber must not stop the poll loop for everyone else
+            
+            pass
+            
+        
+    
+    def get(self, timeout = None):
+        
+        #Next event from the queue, None once timeout passes
+        
+        try:
+            
+            return self.queue.get(timeout = timeout)
+            
+        
+        except queue.Empty:
+            
+            return None
+            
+        
+    
+    def __iter__(self):
+        
+        while True:
+            
+            yield self.queue.get()
+            
+        
+    
+    def close(self):
+        
+        self.watcher.unsubscribe(self)
+        
+    
+
+class StatusWatcher(object):
+    
+    def __init__(self, pool = None, inventory = None, interval = WATCH_INTERVAL, max_interval = WATCH_MAX_INTERVAL, clouds = None):
+        
+        self.pool = pool
+        self.inventory = inventory
+        
+        self.interval = interval
+        self.max_interval = max_interval
+        
+        #{(platform, region) : Cloud}; callers may hand in clouds of their own
+        
+        self._clouds = dict(clouds or {})
+        
+        #{(platform, region) : {instance ID : (group, area)}}
+        
+        self._tracked = {}
+        
+        self._states = {}
+        self._seen = {}
+        
+        self._loops = {}
+        self._wake = {}
+        self._subscriptions = []
+        
+        self._closed = False
+        
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        
+        self.polls = 0
+        self.poll_failures = 0
+        
+    
+    def _cloud(self, platform, region):
+        
+        key = (platform, region)
+        
+        if key not in self._clouds:
+            
+            self._clouds[key] = Cloud(platform, region, pool = self.pool, inventory = self.inventory)
+            
+        
+        return self._clouds[key]
+        
+    
+    def track(self, platform, instanceIds, group = "", area = "", region = None):
+        
+        #Start watching instances; the loop for their provider and region starts with
+        #the first of them and polls at once
+        
+        key = (platform, region)
+        
+        with self._lock:
+            
+            if self._closed:
+                
+                raise RuntimeError("status watcher is closed")
+                
+            
+            self._cloud(platform, region)
+            
+            tracked = self._tracked.setdefault(key, {})
+            
+            for instanceId in instanceIds:
+                
+                tracked[instanceId] = (group, area)
+                
+            
+            if key not in self._loops:
+                
+                self._wake[key] = threading.Event()
+                self._loops[key] = threading.Thread(target = self._loop, args = (key,), name = "status-watch-{}-{}".format(platform, region or "default"), daemon = True)
+                self._loops[key].start()
+                
+            
+            self._wake[key].set()
+            
+        
+    
+    def track_operation(self, operation, group = "", area = "", region = None):
+        
+        #Watch the instances of a launch once its handle knows their IDs
+        
+        operation.add_done_callback(lambda operation: operation.ok and self.track(operation.platform, operation.ids, group, area, region))
+        
+    
+    def untrack(self, platform, instanceIds, region = None):
+        
+        with self._lock:
+            
+            tracked = self._tracked.get((platform, region), {})
+            
+            for instanceId in instanceIds:
+                
+                tracked.pop(instanceId, None)
+                
+            
+        
+    
+    def state(self, platform, instanceId):
+        
+        with self._lock:
+            
+            return self._states.get((platform, instanceId))
+            
+        
+    
+    def snapshot(self):
+        
+        #{platform : {instance ID : {"state", "seen"}}} as of the last polls
+        
+        with self._lock:
+            
+            snapshot = {}
+            
+            for (platform, instanceId), state in self._states.items():
+                
+                snapshot.setdefault(platform, {})[instanceId] = {"state" : state, "seen" : self._seen[(platform, instanceId)]}
+                
+            
+            return snapshot
+            
+        
+    
+    def subscribe(self, callback = None, platform = None, ids = None, states = None):
+        
+        subscription = Subscription(self, callback, platform, ids, states)
+        
+        with self._lock:
+            
+            self._subscriptions.append(subscription)
+            
+        
+        return subscription
+        
+    
+    def unsubscribe(self, subscription):
+        
+        with self._lock:
+            
+            if subscription in self._subscriptions:
+                
+                self._subscriptions.remove(subscription)
+                
+            
+        
+    
+    def wait_for(self, platform, instanceIds, state, timeout = None):
+        
+        #Block until every instance is in state, sharing the watcher's polls; returns
+        #the IDs still elsewhere when timeout passes
+        
+        target = state if state in TARGET_STATES.values() else normalize_state(platform, state)
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        with self._lock:
+            
+            while True:
+                
+                pending = [instanceId for instanceId in instanceIds if self._states.get((platform, instanceId)) != target]
+                
+                remaining = None if deadline is None else deadline - time.monotonic()
+                
+                if not pending or self._closed or (remaining is not None and remaining <= 0):
+                    
+                    return pending
+                    
+                
+                self._changed.wait(remaining)
+                
+            
+        
+    
+    def refresh(self, platform = None):
+        
+        #Poll now instead of at the next interval
+        
+        with self._lock:
+            
+            for key, wake in self._wake.items():
+                
+                if platform is None or key[0] == platform:
+                    
+                    wake.set()
+                    
+                
+            
+        
+    
+    def _loop(self, key):
+        
+        delay = self.interval
+        
+        while True:
+            
+            self._wake[key].wait(delay)
+            
+            with self._lock:
+                
+                if self._closed:
+                    
+                    return
+                    
+                
+                self._wake[key].clear()
+                
+                #Instances grouped by location, so each location costs the calls of one
+                #fetch_states
+                
+                locations = {}
+                
+                for instanceId, location in self._tracked.get(key, {}).items():
+                    
+                    locations.setdefault(location, []).append(instanceId)
+                    
+                
+            
+            if not locations:
+                
+                delay = self.max_interval
+                
+                continue
+                
+            
+            states = {}
+            
+            for (group, area), instanceIds in locations.items():
+                
+                try:
+                    
+                    states.update(self._clouds[key].fetch_states(instanceIds, group, area))
+                    
+                
+                except Exception:
+                    
+                    with self._lock:
+                        
+                        self.poll_failures += 1
+                        
+                    
+                
+            
+            changing = self._update(key, states)
+            
+            #Fast while something is moving, otherwise back off towards max_interval
+            
+            delay = self.interval if changing else min(self.max_interval, delay * 2)
+            
+        
+    
+    def _update(self, key, states):
+        
+        platform = key[0]
+        
+        now = time.time()
+        
+        events = []
+        
+        with self._lock:
+            
+            self.polls += 1
+            
+            for instanceId, state in states.items():
+                
+                old = self._states.get((platform, instanceId))
+                
+                self._states[(platform, instanceId)] = state
+                self._seen[(platform, instanceId)] = now
+                
+                if state != old:
+                    
+                    events.append({"platform" : platform, "id" : instanceId, "old" : old, "new" : state, "at" : now})
+                    
+                
+                #Nothing comes back from terminated
+                
+                if state == "terminated":
+                    
+                    self._tracked.get(key, {}).pop(instanceId, None)
+                    
+                
+            
+            subscriptions = list(self._subscriptions)
+            
+            changing = any(state in TRANSITIONAL_STATES for state in states.values())
+            
+            if events:
+                
+                self._changed.notify_all()
+                
+            
+        
+        if events and self.inventory is not None:
+            
+            for state in set(event["new"] for event in events if event["new"] != "unknown"):
+                
+                self.inventory.set_state(platform, [event["id"] for event in events if event["new"] == state], state)
+                
+            
+        
+        for event in events:
+            
+            for subscription in subscriptions:
+                
+                if subscription.matches(event):
+                    
+                    subscription.deliver(event)
+                    
+                
+            
+        
+        return changing
+        
+    
+    def close(self):
+        
+        with self._lock:
+            
+            self._closed = True
+            
+            loops = list(self._loops.values())
+            
+            for wake in self._wake.values():
+                
+                wake.set()
+                
+            
+            self._changed.notify_all()
+            
+        
+        for loop in loops:
+            
+            loop.join()
+            
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#asyncio counterpart of Cloud. Each coroutine submits like the matching Cloud method and
+#returns the handle once it has finished, so provider semantics, inventory and metrics
+#are Cloud's own. GCP goes over the Compute REST API with aiohttp when it is installed:
+#submissions and operation polls are plain awaits on the event loop. The AWS and Azure
+#SDKs used here only block (the Azure aio clients belong to the newer SDK generation,
+#whose API differs from the one Cloud calls), so their submissions run on a bounded
+#executor and every pending handle is checked by one poll task that hands each kind's
+#poll_many to the executor, batching status calls as wait_all does. At most
+#max_in_flight operations run at once; further calls wait for a slot.
+
+ASYNC_IN_FLIGHT = 1000
+
+GCP_REST = "https://compute.googleapis.com/compute/v1/"
+
+class GcpRestError(Exception):
+    
+    #Failed Compute REST call, shaped for _throttled()
+    
+    def __init__(self, status_code, content, headers):
+        
+        Exception.__init__(self, "HTTP {}: {}".format(status_code, content[:500]))
+        
+        self.status_code = status_code
+        self.content = content
+        self.resp = headers
+        
+    
+
+class GcpRestOperation(GcpOperation):
+    
+    #GCP operation started over REST, which has no discovery client to poll it with.
+    #AsyncCloud polls it on the event loop; a blocking waiter (wait_all, a watcher)
+    #polls the same REST endpoint through urllib instead.
+    
+    def __init__(self, token, project, zone, action, ids, operation, scheduler = None):
+        
+        GcpOperation.__init__(self, None, project, zone, action, ids, operation, scheduler)
+        
+        #Called for a bearer token before each blocking poll
+        
+        self.token = token
+        
+    
+    def poll(self):
+        
+        request = importlib.import_module("urllib.request")
+        
+        def fetch():
+            
+            url = GCP_REST + "projects/{}/zones/{}/operations/{}".format(self.project, self.zone, self.operation["name"])
+            
+            try:
+                
+                with request.urlopen(request.Request(url, headers = {"Authorization" : "Bearer " + self.token()}), timeout = 60) as response:
+                    
+                    return json.loads(response.read().decode("utf-8"))
+                    
+                
+            
+            except importlib.import_module("urllib.error").HTTPError as error:
+                
+                raise GcpRestError(error.code, error.read().decode("utf-8", "replace"), dict(error.headers))
+                
+            
+        
+        self.update(self.scheduler.call("gcp", "describe", fetch))
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        super(GcpOperation, cls).poll_many(operations)
+        
+    
+
+class AsyncCloud(object):
+    
+    def __init__(self, platform = "", region = None, credentials = None, cloud = None, max_workers = MAX_WORKERS, max_in_flight = ASYNC_IN_FLIGHT, native = True, **options):
+        
+        #options go to Cloud (pool, inventory, scheduler, metrics, ...) unless a cloud
+        #is handed in
+        
+        self.cloud = cloud if cloud is not None else Cloud(platform, region, credentials, **options)
+        self.platform = self.cloud.platform
+        
+        self.max_in_flight = max_in_flight
+        self.native = native
+        
+        self._executor = ThreadPoolExecutor(max_workers = max_workers)
+        
+        #Made on first use, inside the running loop
+        
+        self._in_flight = None
+        self._session = None
+        self._gcp_credentials = None
+        
+        #Handles waiting on the shared poll task, with the future each caller awaits
+        
+        self._waiting = []
+        self._schedule = {}
+        self._poller = None
+        self._wake = None
+        
+    
+    async def __aenter__(self):
+        
+        return self
+        
+    
+    async def __aexit__(self, *exc_info):
+        
+        await self.aclose()
+        
+    
+    async def aclose(self):
+        
+        if self._poller is not None and not self._poller.done():
+            
+            self._poller.cancel()
+            
+            try:
+                
+                await self._poller
+                
+            
+            except _asyncio().CancelledError:
+                
+                pass
+                
+            
+        
+        self._poller = None
+        
+        #Anyone still awaiting a handle hears that nothing will finish it now
+        
+        for operation, future in self._waiting:
+            
+            if not future.done():
+                
+                future.cancel()
+                
+            
+        
+        self._waiting = []
+        
+        if self._session is not None:
+            
+            await self._session.close()
+            
+            self._session = None
+            
+        
+        self._executor.shutdown(wait = False)
+        
+    
+    def _rest(self):
+        
+        #Whether GCP calls go over aiohttp
+        
+        if not (self.native and self.platform == "gcp"):
+            
+            return False
+            
+        
+        try:
+            
+            _require("aiohttp")
+            
+        
+        except ImportError:
+            
+            self.native = False
+            
+        
+        return self.native
+        
+    
+    async def _blocking(self, function, *args):
+        
+        return await _asyncio().get_running_loop().run_in_executor(self._executor, lambda: function(*args))
+        
+    
+    async def _run(self, submit, *args):
+        
+        #One operation: a slot, the submission, then the wait for the handle (GCP REST
+        #submissions return it finished)
+        
+        if self._in_flight is None:
+            
+            self._in_flight = _asyncio().Semaphore(self.max_in_flight)
+            
+        
+        async with self._in_flight:
+            
+            operation = await submit(*args)
+            
+            return await self._settle(operation)
+            
+        
+    
+    async def launch_instance(self, specifications = [], overrides = None):
+        
+        if self._rest():
+            
+            return await self._run(self._gcp_launch, specifications, overrides)
+            
+        
+        return await self._run(self._blocking, self.cloud.launch_instance, specifications, overrides)
+        
+    
+    async def stop_instance(self, instanceId, group = "", area = "", hibernate = False):
+        
+        if self._rest():
+            
+            return await self._run(self._gcp_instance, "stop", instanceId, group, area)
+            
+        
+        return await self._run(self._blocking, self.cloud.stop_instance, instanceId, group, area, hibernate)
+        
+    
+    async def start_instance(self, instanceId, group = "", area = ""):
+        
+        if self._rest():
+            
+            return await self._run(self._gcp_instance, "start", instanceId, group, area)
+            
+        
+        return await self._run(self._blocking, self.cloud.start_instance, instanceId, group, area)
+        
+    
+    async def terminate_instance(self, instanceId = "", group = "", area = "", nic_name = "", ip_name = "", key_name = ""):
+        
+        if self._rest():
+            
+            return await self._run(self._gcp_instance, "terminate", instanceId, group, area)
+            
+        
+        return await self._run(self._blocking, self.cloud.terminate_instance, instanceId, group, area, nic_name, ip_name, key_name)
+        
+    
+    async def create_key(self, key_name, key_type = None):
+        
+        return await self._blocking(self.cloud.create_key, key_name, key_type)
+        
+    
+    #Shared poll task for handles submitted through the executor
+    
+    async def _settle(self, operation):
+        
+        if operation.done:
+            
+            return operation
+            
+        
+        asyncio = _asyncio()
+        
+        future = asyncio.get_running_loop().create_future()
+        
+        self._waiting.append((operation, future))
+        
+        #A new handle is checked on its kind's first interval, not after the backoff
+        #the kind has built up
+        
+        self._schedule.pop(type(operation), None)
+        
+        if self._poller is None or self._poller.done():
+            
+            self._wake = asyncio.Event()
+            self._poller = asyncio.ensure_future(self._poll())
+            
+        
+        else:
+            
+            self._wake.set()
+            
+        
+        return await future
+        
+    
+    async def _poll(self):
+        
+        asyncio = _asyncio()
+        
+        while self._waiting:
+            
+            now = time.perf_counter()
+            
+            pending = [operation for operation, future in self._waiting if not operation.done]
+            
+            kinds = {}
+            
+            for operation in pending:
+                
+                kinds.setdefault(type(operation), []).append(operation)
+                
+            
+            for kind, group in kinds.items():
+                
+                due, delay = self._schedule.setdefault(kind, [0.0, kind.poll_interval[0]])
+                
+                if due <= now:
+                    
+                    try:
+                        
+                        await self._blocking(kind.poll_many, group)
+                        
+                    
+                    except Exception as error:
+                        
+                        for operation in group:
+                            
+                            operation._finish(error = error)
+                            
+                        
+                    
+                    first, ceiling, growth = kind.poll_interval
+                    
+                    self._schedule[kind] = [time.perf_counter() + delay, min(delay * growth, ceiling)]
+                    
+                
+            
+            waiting = []
+            
+            for operation, future in self._waiting:
+                
+                if future.done():
+                    
+                    continue
+                    
+                
+                if operation.done:
+                    
+                    future.set_result(operation)
+                    
+                
+                else:
+                    
+                    waiting.append((operation, future))
+                    
+                
+            
+            self._waiting = waiting
+            
+            if not waiting:
+                
+                return
+                
+            
+            #A kind whose schedule was reset while polling is due at once
+            
+            wake = min(self._schedule.get(type(operation), [0.0])[0] for operation, future in waiting)
+            
+            self._wake.clear()
+            
+            try:
+                
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake - time.perf_counter()))
+                
+            
+            except asyncio.TimeoutError:
+                
+                pass
+                
+            
+        
+    
+    #GCP over aiohttp
+    
+    def _gcp_blocking_token(self):
+        
+        #For GcpRestOperation.poll, which runs off the event loop
+        
+        return self.cloud.pool.credential_cache.gcp_credentials(self.cloud.credentials).token
+        
+    
+    async def _gcp_token(self):
+        
+        #The credential cache refreshes ahead of expiry, so this is normally just a read
+        
+        cache = self.cloud.pool.credential_cache
+        
+        if self._gcp_credentials is None or not getattr(self._gcp_credentials, "valid", True):
+            
+            self._gcp_credentials = await self._blocking(cache.gcp_credentials, self.cloud.credentials)
+            
+        
+        return self._gcp_credentials.token
+        
+    
+    async def _gcp(self, family, method, path, body = None):
+        
+        if self._session is None:
+            
+            self._session = _require("aiohttp").ClientSession()
+            
+        
+        async def call():
+            
+            #Fetched per attempt: a retry after backoff may outlive the token
+            
+            token = await self._gcp_token()
+            
+            async with self._session.request(method, GCP_REST + path, json = body, headers = {"Authorization" : "Bearer " + token}) as response:
+                
+                content = await response.text()
+                
+                if response.status >= 400:
+                    
+                    raise GcpRestError(response.status, content, dict(response.headers))
+                    
+                
+                return json.loads(content)
+                
+            
+        
+        started = time.perf_counter()
+        
+        try:
+            
+            result = await self.cloud.scheduler.call_async("gcp", family, call)
+            
+        
+        except Exception:
+            
+            self.cloud.metrics.observe("cloud_vms_call_seconds", time.perf_counter() - started, False, platform = "gcp", family = family, call = "rest")
+            
+            raise
+            
+        
+        self.cloud.metrics.observe("cloud_vms_call_seconds", time.perf_counter() - started, True, platform = "gcp", family = family, call = "rest")
+        
+        return result
+        
+    
+    async def _gcp_launch(self, specifications, overrides):
+        
+        spec = as_spec("gcp", specifications)
+        
+        overrides = spec.check(overrides or {})
+        
+        values = collections.ChainMap(overrides, spec)
+        
+        #requestId lets GCP recognise a retried insert as the one it already has
+        
+        operation = await self._gcp("launch", "POST", "projects/{}/zones/{}/instances?requestId={}".format(values["PROJECT"], values["ZONE"], uuid.uuid4()), spec.request(overrides))
+        
+        handle = GcpRestOperation(self._gcp_blocking_token, values["PROJECT"], values["ZONE"], "launch", [values["INSTANCE_NAME"]], operation, self.cloud.scheduler)
+        
+        if self.cloud.inventory is not None:
+            
+            self.cloud._record_launch(handle, values)
+            
+        
+        return await self._wait_rest(self.cloud._track(handle))
+        
+    
+    async def _gcp_instance(self, action, instanceId, group, area):
+        
+        project, zone = self.cloud._locate(instanceId, group, area)
+        
+        method, suffix = {"stop" : ("POST", "/stop"), "start" : ("POST", "/start"), "terminate" : ("DELETE", "")}[action]
+        
+        operation = await self._gcp("mutate", method, "projects/{}/zones/{}/instances/{}{}?requestId={}".format(project, zone, instanceId, suffix, uuid.uuid4()))
+        
+        return await self._wait_rest(self.cloud._track(GcpRestOperation(self._gcp_blocking_token, project, zone, action, [instanceId], operation, self.cloud.scheduler)))
+        
+    
+    async def _wait_rest(self, handle):
+        
+        #Polls one GCP operation on the event loop with the handle's own backoff
+        
+        first, ceiling, growth = handle.poll_interval
+        
+        delay = first
+        
+        handle.update(handle.operation)
+        
+        while not handle.done:
+            
+            await _asyncio().sleep(delay)
+            
+            delay = min(delay * growth, ceiling)
+            
+            try:
+                
+                handle.update(await self._gcp("describe", "GET", "projects/{}/zones/{}/operations/{}".format(handle.project, handle.zone, handle.operation["name"])))
+                
+            
+            except Exception as error:
+                
+                handle._finish(error = error)
+                
+            
+        
+        return handle
+        
+    
+
+#-----------------------------------------------#
+#              ______   __  __    ____          #
+#             / ____/  / / / /   /  _/          #
+#            / / __   / / / /    / /            #
+#           / /_/ /  / /_/ /   _/ /             #
+#           \____/   \____/   /___/             #
+#                                               #
+#-----------------------------------------------#
+
+dictionary_one = {"1" : "aws", "2" : "gcp", "3" : "azu"}
+dictionary_two = {"aws" : "Amazon Web Services", "gcp" : "Google Cloud Platform", "azu" : "Microsoft Azure"}
+dictionary_three = {"1" : "launch", "2" : "stop", "3" : "start", "4" : "terminate", "5" : "back"}
+dictionary_four = {"1" : "list", "2" : "change", "3" : "back"}
+
+def finish(operation):
+    
+    print("\nWaiting for {} to finish...".format(operation.action))
+    
+    operation.wait()
+    
+    if operation.error is not None:
+        
+        print("\nError: {}".format(operation.error))
+        
+        input("\n\nPress 'Enter' to Continue...")
+        
+    
+
+def menu(inventory = None):
+    
+    print("\033c", end = "")
+
+    while True:
+    
+        print("\nSelect a Cloud Service Provider:\n")
+        print("\t1: Amazon Web Services\n")
+        print("\t2: Google Cloud Platform\n")
+        print("\t3: Microsoft Azure\n")
+        print("\t4: Specifications\n")
+        print("\t5: Launch on All Providers\n")
+        print("\t6: Exit\n")
+    
+        provider = input(" :")
+    
+        try:
+        
+            if provider == "4":
+            
+                print("\033c", end = "Specifications\n")
+            
+                while True:
+                
+                    print("\nChoose an Option:\n")
+                    print("\t1: List Specifications\n")
+                    print("\t2: Change Specifications\n")
+                    print("\t3: Back\n")
+                
+                    selection = input(" :")
+                
+                    if dictionary_four[selection] == "list":
+                    
+                        for i in range(len(mySpecs)):
+                        
+                            print("\033c", end = dictionary_two[dictionary_one[str(i+1)]] + "\n\n\n")
+                        
+                            for keys, values in mySpecs[i].items():
+                            
+                                print(str(keys) + " : " + str(values))
+                            
+                        
+                            input("\n\nPress 'Enter' to Continue...")
+                        
+                            print("\033c", end = "")
+                        
+                    
+                        print("\033c", end = "Specifications\n")
+                    
+                
+                    elif dictionary_four[selection] == "change":
+                    
+                        print("\033c", end = "Specifications\n")
+                    
+                        print("\nChoose a Cloud Provider:\n")
+                        print("\t1: Amazon Web Services\n")
+                        print("\t2: Google Cloud Platform\n")
+                        print("\t3: Microsoft Azure\n")
+                        print("\t4: Back\n")
+                    
+                        choice = input(" :")
+                    
+                        print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                    
+                        if dictionary_one[choice] == "aws":
+                        
+                            while True:
+                        
+                                for keys, values in mySpecs[0].items():
+                                
+                                    print(str(keys) + " : " + str(values))
+                                
+                            
+                                change = input("\n\nChange a value? (y/n): ")
+                            
+                                if change == "y":
+                                
+                                    name_of_key = input("\nName of Key: ")
+                                    name_of_value = input("New Value: ")
+                                
+                                    try:
+                                    
+                                        mySpecs[0][name_of_key] = name_of_value
+                                    
+                                        print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                    except (KeyError, ValueError) as error:
+                                    
+                                        print("\033c", end = "Invalid value: " + str(error).strip("'\"") + "\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                
+                            
+                                elif change == "n":
+                                
+                                    print("\033c", end = "Specifications\n")
+                                
+                                    break
+                                
+                            
+                                else:
+                                
+                                    print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                
+                            
+                        
+                    
+                        elif dictionary_one[choice] == "gcp":
+                        
+                            while True:
+                        
+                                for keys, values in mySpecs[1].items():
+                                
+                                    print(str(keys) + " : " + str(values))
+                                
+                            
+                                change = input("\n\nChange a value? (y/n): ")
+                            
+                                if change == "y":
+                                
+                                    name_of_key = input("\nName of Key: ")
+                                    name_of_value = input("New Value: ")
+                                
+                                    try:
+                                    
+                                        mySpecs[1][name_of_key] = name_of_value
+                                    
+                                        print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                    except (KeyError, ValueError) as error:
+                                    
+                                        print("\033c", end = "Invalid value: " + str(error).strip("'\"") + "\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                
                             
-                            print("\033c", end = "")
+                                elif change == "n":
+                                
+                                    print("\033c", end = "Specifications\n")
+                                
+                                    break
+                                
                             
-                            print(response)
+                                else:
+                                
+                                    print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                
                             
-                            input("\n\nPress 'Enter' to Continue...")
+                        
+                    
+                        elif dictionary_one[choice] == "azu":
+                        
+                            while True:
+                        
+                                for keys, values in mySpecs[2].items():
+                                
+                                    print(str(keys) + " : " + str(values))
+                                
                             
-                            print("\033c", end = "")
+                                change = input("\n\nChange a value? (y/n): ")
+                            
+                                if change == "y":
+                                
+                                    name_of_key = input("\nName of Key: ")
+                                    name_of_value = input("New Value: ")
+                                
+                                    try:
+                                    
+                                        mySpecs[2][name_of_key] = name_of_value
+                                    
+                                        print("\033c", end = dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                    except (KeyError, ValueError) as error:
+                                    
+                                        print("\033c", end = "Invalid value: " + str(error).strip("'\"") + "\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                    
+                                
+                            
+                                elif change == "n":
+                                
+                                    print("\033c", end = "Specifications\n")
+                                
+                                    break
+                                
+                            
+                                else:
+                                
+                                    print("\033c", end = "Please type valid input\n\n" + dictionary_two[dictionary_one[choice]] + "\n\n\n")
+                                
+                            
+                        
+                    
+                        elif dictionary_one[choice] == "back":
+                        
+                            pass
+                        
+                    
+                
+                    elif dictionary_four[selection] == "back":
+                    
+                        print("\033c", end = "")
+                    
+                        break
+                    
+                
+            
+        
+            elif provider == "5":
+            
+                print("\033c", end = "Launch on All Providers\n")
+            
+                try:
+                
+                    count = int(input("\nInstances per Provider: "))
+                
+            
+                except ValueError:
+                
+                    print("\033c", end = "Error: Invalid Count\n")
+                
+                    continue
+                
+            
+                print("")
+            
+                launcher = FanOut(inventory = inventory)
+            
+                for record in launcher.run((dictionary_one[str(i+1)], mySpecs[i], count) for i in range(len(mySpecs))):
+                
+                    status = "running" if record["ok"] else "failed: " + "; ".join(record["errors"])
+                
+                    print("\t{} ({} instances) {} after {:.1f} s\n".format(dictionary_two[record["platform"]], record["count"], status, record["elapsed"]))
+                
+            
+                print("Time to all running: {:.1f} s".format(launcher.elapsed))
+            
+                input("\n\nPress 'Enter' to Continue...")
+            
+                print("\033c", end = "")
+            
+        
+            elif provider == "6":
+            
+                print("\033c", end = "")
+            
+                break
+            
+        
+            else:
+            
+                cloud = Cloud(dictionary_one[provider], inventory = inventory)
+            
+                print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+            
+                while True:
+                
+                    print("\nChoose an Option:\n")
+                    print("\t1: Launch Instance\n")
+                    print("\t2: Stop Instance\n")
+                    print("\t3: Start Instance\n")
+                    print("\t4: Terminate Instance\n")
+                    print("\t5: Back\n")
+                
+                    selection = input(" :")
+                
+                    if dictionary_three[selection] == "launch":
+                    
+                        print("\033c", end = "")
+                    
+                        while True:
+                        
+                            new_key = input("\nCreate New Key? (y/n): ")
+                        
+                            if new_key == "y":
+                            
+                                response = cloud.create_key(input("\nEnter Key Name: "))
+                            
+                                print("\033c", end = "")
+                            
+                                print(response)
                             
-                            cloud.launch_instance(mySpecs[int(provider)-1])
+                                input("\n\nPress 'Enter' to Continue...")
                             
-                            print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                                print("\033c", end = "")
                             
-                            break
+                                finish(cloud.launch_instance(mySpecs[int(provider)-1]))
+                            
+                                print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                            
+                                break
                             
                         
-                        elif new_key == "n":
+                            elif new_key == "n":
                             
-                            if provider == 3:
+                                if provider == 3:
                                 
-                                try:
+                                    try:
                                     
-                                    file = open(".ssh/authorized_keys/{}.pem".format(specifications["PUBLIC_KEY_NAME"]),"r")
-                                    file.close()
+                                        file = open(".ssh/authorized_keys/{}.pem".format(specifications["PUBLIC_KEY_NAME"]),"r")
+                                        file.close()
                                     
-                                    cloud.launch_instance(mySpecs[int(provider)-1])
+                                        finish(cloud.launch_instance(mySpecs[int(provider)-1]))
                                     
-                                    print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                                        print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
                                     
-                                    break
+                                        break
                                     
                                 
-                                except FileNotFoundError:
+                                    except FileNotFoundError:
                                     
-                                    print("\033c", end = "Error: no public key found... Closing...")
+                                        print("\033c", end = "Error: no public key found... Closing...")
                                     
-                                    sys.exit(0)
+                                        sys.exit(0)
                                     
                                 
                             
-                            else:
+                                else:
                                 
-                                cloud.launch_instance(mySpecs[int(provider)-1])
+                                    finish(cloud.launch_instance(mySpecs[int(provider)-1]))
                                 
-                                print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                                    print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
                                 
-                                break
+                                    break
                                 
                             
                         
-                        else:
+                            else:
                             
-                            print("\033c", end = "Try again...")
+                                print("\033c", end = "Try again...")
                             
                         
                     
                 
-                elif dictionary_three[selection] == "stop":
-                    
-                    print("\033c", end = "")
-                    
-                    instance = input("\nEnter Instance ID: ")
-                    project = input("\nEnter Group/Project (Press 'Enter' if N/A): ")
-                    zone = input("\nEnter Zone (Press 'Enter' if N/A): ")
-                    
-                    cloud.stop_instance(instanceId = instance, group = project, area = zone)
-                    
-                    print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
-                   
+                    elif dictionary_three[selection] == "stop":
+                    
+                        print("\033c", end = "")
+                    
+                        instance = input("\nEnter Instance ID: ")
+                        known = inventory is not None and inventory.get(cloud.platform, instance) is not None
+                        
+                        #The inventory fills in whatever was recorded at launch
+                        
+                        project = "" if known else input("\nEnter Group/Project (Press 'Enter' if N/A): ")
+                        zone = "" if known else input("\nEnter Zone (Press 'Enter' if N/A): ")
+                    
+                        finish(cloud.stop_instance(instanceId = instance, group = project, area = zone))
+                    
+                        print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                   
+                
+                    elif dictionary_three[selection] == "start":
+                    
+                        print("\033c", end = "")
+                    
+                        instance = input("\nEnter Instance ID: ")
+                        known = inventory is not None and inventory.get(cloud.platform, instance) is not None
+                        
+                        #The inventory fills in whatever was recorded at launch
+                        
+                        project = "" if known else input("\nEnter Group/Project (Press 'Enter' if N/A): ")
+                        zone = "" if known else input("\nEnter Zone (Press 'Enter' if N/A): ")
+                    
+                        finish(cloud.start_instance(instanceId = instance, group = project, area = zone))
+                    
+                        print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                    
+                
+                    elif dictionary_three[selection] == "terminate":
+                    
+                        print("\033c", end = "")
+                    
+                        instance = input("\nEnter Instance ID: ")
+                        known = inventory is not None and inventory.get(cloud.platform, instance) is not None
+                        
+                        #The inventory fills in whatever was recorded at launch
+                        
+                        project = "" if known else input("\nEnter Group/Project (Press 'Enter' if N/A): ")
+                        zone = "" if known else input("\nEnter Zone (Press 'Enter' if N/A): ")
+                        nic = "" if known else input("\nEnter NIC Name (Press 'Enter' if N/A): ")
+                        ip = "" if known else input("\nEnter IP Name (Press 'Enter' if N/A): ")
+                        key = input("\nEnter Key Name (Press 'Enter' if N/A): ")
+                    
+                        finish(cloud.terminate_instance(instanceId=instance, group=project, area=zone, nic_name=nic, ip_name=ip, key_name=key))
+                    
+                        print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                   
+                
+                    elif dictionary_three[selection] == "back":
+                    
+                        print("\033c", end = "")
+                    
+                        break
+                    
+                
+                
+            
+        
+    
+        except KeyError:
+        
+            print("\033c", end = "")
+        
+            print("Error: Invalid Option")
+        
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Headless batch mode. Each input line is a JSON object such as
+#
+#   {"op" : "launch", "platform" : "aws", "spec" : {...}, "count" : 2}
+#   {"op" : "stop", "platform" : "gcp", "instance" : "instance-1", "group" : "my-project", "area" : "us-west1-a"}
+#   {"op" : "terminate", "platform" : "azu", "instances" : ["vm-1", "vm-2"], "group" : "TestResourceGroup"}
+#
+#Instead of "instance"/"instances", {"tag" : "..."} selects every inventoried instance of
+#the platform carrying that tag, and project/group, zone, NIC and IP names are looked up
+#in the inventory when omitted.
+#
+#"spec" defaults to the matching entry of mySpecs, and "wait" (default true) decides
+#whether the result is reported once the operation finishes or as soon as it is
+#submitted. One JSON result per line is written to stdout, in completion order.
+
+BATCH_OPS = ("launch", "stop", "start", "terminate")
+
+class BatchRunner(object):
+    
+    def __init__(self, pool = None, timeout = None, inventory = None):
+        
+        self.pool = pool
+        self.timeout = timeout
+        self.inventory = inventory
+        
+        self._clouds = {}
+        self._lock = threading.Lock()
+        
+    
+    def _cloud(self, platform):
+        
+        with self._lock:
+            
+            if platform not in self._clouds:
+                
+                self._clouds[platform] = Cloud(platform, pool = self.pool, inventory = self.inventory)
+                
+            
+            return self._clouds[platform]
+            
+        
+    
+    def execute(self, request):
+        
+        op = request.get("op")
+        platform = request.get("platform")
+        
+        if op not in BATCH_OPS:
+            
+            raise ValueError("unknown op {!r}".format(op))
+            
+        
+        if platform not in dictionary_two:
+            
+            raise ValueError("unknown platform {!r}".format(platform))
+            
+        
+        cloud = self._cloud(platform)
+        
+        if op == "launch":
+            
+            specifications = request.get("spec") or mySpecs[list(dictionary_two).index(platform)]
+            count = int(request.get("count", 1))
+            
+            operations = cloud.launch_copies(specifications, count)
+            
+        
+        else:
+            
+            group = request.get("group", "")
+            area = request.get("area", "")
+            
+            if "tag" in request:
+                
+                if self.inventory is None:
+                    
+                    raise ValueError("selecting instances by tag needs an inventory")
+                    
+                
+                request = dict(request, instances = cloud.select(tag = request["tag"]))
+                
+            
+            if "instances" in request:
+                
+                if op == "terminate":
+                    
+                    results = cloud.terminate_instances(request["instances"], group, area, request.get("nic_names"), request.get("ip_names"), request.get("key_names"))
+                    
+                
+                else:
+                    
+                    results = getattr(cloud, op + "_instances")(request["instances"], group, area)
+                    
+                
+                failed = {instanceId : result["error"] for instanceId, result in results.items() if not result["ok"]}
+                
+                if failed:
+                    
+                    raise RuntimeError("; ".join("{}: {}".format(instanceId, error) for instanceId, error in sorted(failed.items())))
+                    
+                
+                operations = list({id(result["operation"]) : result["operation"] for result in results.values()}.values())
+                
+            
+            elif op == "terminate":
+                
+                operations = [cloud.terminate_instance(request["instance"], group, area, request.get("nic_name", ""), request.get("ip_name", ""), request.get("key_name", ""))]
+                
+            
+            else:
+                
+                operations = [getattr(cloud, op + "_instance")(request["instance"], group, area)]
+                
+            
+        
+        if request.get("wait", True):
+            
+            wait_all(operations, self.timeout)
+            
+        
+        return operations
+        
+    
+    def _run_line(self, numbered):
+        
+        number, line = numbered
+        
+        record = {"line" : number}
+        
+        try:
+            
+            request = json.loads(line)
+            
+            record.update({key : request[key] for key in ("id", "op", "platform") if key in request})
+            
+            operations = self.execute(request)
+            
+        
+        except Exception as error:
+            
+            record.update(_failure(error))
+            
+            return record
+            
+        
+        record["operations"] = [operation.to_dict() for operation in operations]
+        
+        failed = any(operation.done and not operation.ok for operation in operations)
+        unfinished = request.get("wait", True) and not all(operation.done for operation in operations)
+        
+        record["ok"] = not (failed or unfinished)
+        
+        return record
+        
+    
+    def run(self, lines, parallelism = MAX_WORKERS):
+        
+        numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+        
+        for numbered_line, future in _bounded_map(self._run_line, numbered, parallelism):
+            
+            yield future.result()
+            
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Desired-state reconciler. The desired-state file names specs and how many instances of
+#each should exist, and in which state:
+#
+#   {
+#       "specs" : {"gcp-east" : {"base" : "gcp-default", "ZONE" : "us-east1-b", "MACHINE_TYPE" : "zones/us-east1-b/machineTypes/f1-micro"}},
+#       "desired" : [{"spec" : "aws-default", "count" : 3}, {"spec" : "gcp-east", "count" : 2, "state" : "stopped"}]
+#   }
+#
+#"spec" is the SPEC_NAME of an entry of mySpecs or of "specs", where "base" starts from
+#an existing spec. Location comes from the spec, so one zone or group per spec.
+#
+#A pass lists each provider once per project/group (through the list cache), counts the
+#inventoried instances of each spec that the listing still shows, and plans the fewest
+#actions: surplus instances are terminated (stopped ones first), a shortfall is covered
+#by starting stopped instances before launching new ones. Actions run concurrently. An
+#instance whose state cannot be read counts as present but not ready: nothing is
+#launched or terminated on its account, and the next pass lists afresh to look again.
+
+RECONCILE_INTERVAL = 60.0
+
+#States the plan knows what to do with
+
+KNOWN_STATES = ("running", "pending", "stopped", "stopping")
+
+#Seconds a fresh launch may be missing from listings before it counts as gone
+
+LIST_GRACE = 120.0
+
+class Reconciler(object):
+    
+    def __init__(self, desired, inventory, pool = None, timeout = None, max_workers = MAX_WORKERS):
+        
+        if inventory is None:
+            
+            raise ValueError("the reconciler needs an inventory to know which instances it manages")
+            
+        
+        self.inventory = inventory
+        self.pool = pool
+        self.timeout = timeout
+        self.max_workers = max_workers
+        
+        self._clouds = {}
+        self._lock = threading.Lock()
+        
+        self._last = None
+        self._relist = False
+        
+        self.load(desired)
+        
+    
+    @staticmethod
+    def read(path):
+        
+        with open(path) as desired_file:
+            
+            return json.load(desired_file)
+            
+        
+    
+    def load(self, desired):
+        
+        specs = {spec["SPEC_NAME"] : spec for spec in mySpecs if spec["SPEC_NAME"]}
+        
+        for name, values in desired.get("specs", {}).items():
+            
+            values = dict(values)
+            
+            if "base" in values:
+                
+                specs[name] = specs[values.pop("base")].replace(SPEC_NAME = name, **values)
                 
-                elif dictionary_three[selection] == "start":
-                    
-                    print("\033c", end = "")
-                    
-                    instance = input("\nEnter Instance ID: ")
-                    project = input("\nEnter Group/Project (Press 'Enter' if N/A): ")
-                    zone = input("\nEnter Zone (Press 'Enter' if N/A): ")
-                    
-                    cloud.start_instance(instanceId = instance, group = project, area = zone)
+            
+            else:
+                
+                platform = values.pop("platform")
+                
+                specs[name] = as_spec(platform, dict(values, SPEC_NAME = name))
+                
+            
+        
+        self.targets = []
+        
+        for entry in desired.get("desired", []):
+            
+            if entry["spec"] not in specs:
+                
+                raise KeyError("desired state names unknown spec {!r}".format(entry["spec"]))
+                
+            
+            state = entry.get("state", "running")
+            
+            if state not in ("running", "stopped"):
+                
+                raise ValueError("desired state of {} must be running or stopped, got {!r}".format(entry["spec"], state))
+                
+            
+            self.targets.append((specs[entry["spec"]], int(entry["count"]), state))
+            
+        
+        self._desired = json.dumps(desired, sort_keys = True)
+        
+    
+    def _cloud(self, platform):
+        
+        with self._lock:
+            
+            if platform not in self._clouds:
+                
+                self._clouds[platform] = Cloud(platform, pool = self.pool, inventory = self.inventory)
+                
+            
+            return self._clouds[platform]
+            
+        
+    
+    def observe(self, refresh = False):
+        
+        #{spec name : [(instance ID, state, launched)]} for every spec in the desired state
+        
+        listings = {}
+        
+        for spec, count, state in self.targets:
+            
+            group = {"aws" : "", "gcp" : spec.get("PROJECT"), "azu" : spec.get("GROUP_NAME")}[spec.platform]
+            
+            if (spec.platform, group) not in listings:
+                
+                listings[(spec.platform, group)] = {record["id"] : record["state"] for record in self._cloud(spec.platform).list_instances(group, refresh)}
+                
+            
+        
+        now = time.time()
+        
+        observed = {}
+        
+        for spec, count, state in self.targets:
+            
+            group = {"aws" : "", "gcp" : spec.get("PROJECT"), "azu" : spec.get("GROUP_NAME")}[spec.platform]
+            
+            listing = listings[(spec.platform, group)]
+            
+            members = []
+            gone = []
+            
+            for row in self.inventory.find(platform = spec.platform, spec_name = spec["SPEC_NAME"]):
+                
+                if row["state"] == "failed":
                     
-                    print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
+                    continue
                     
                 
-                elif dictionary_three[selection] == "terminate":
+                if row["instance_id"] in listing:
                     
-                    print("\033c", end = "")
+                    members.append((row["instance_id"], listing[row["instance_id"]], row["launched"]))
                     
-                    instance = input("\nEnter Instance ID: ")
-                    project = input("\nEnter Group/Project (Press 'Enter' if N/A): ")
-                    zone = input("\nEnter Zone (Press 'Enter' if N/A): ")
-                    nic = input("\nEnter NIC Name (Press 'Enter' if N/A): ")
-                    ip = input("\nEnter IP Name (Press 'Enter' if N/A): ")
-                    key = input("\nEnter Key Name (Press 'Enter' if N/A): ")
+                
+                elif now - (row["launched"] or 0) < LIST_GRACE:
                     
-                    cloud.terminate_instance(instanceId=instance, group=project, area=zone, nic_name=nic, ip_name=ip, key_name=key)
+                    members.append((row["instance_id"], "pending", row["launched"]))
                     
-                    print("\033c", end = dictionary_two[dictionary_one[provider]] + "\n")
-                   
                 
-                elif dictionary_three[selection] == "back":
-                    
-                    print("\033c", end = "")
+                else:
                     
-                    break
+                    gone.append(row["instance_id"])
                     
                 
+            
+            if gone:
+                
+                self.inventory.set_state(spec.platform, gone, "terminated")
+                
+            
+            #Rows whose listing carried no state it could map; ask for those instances'
+            #views instead
+            
+            unknown = [member[0] for member in members if member[1] == "unknown"]
+            
+            if unknown:
+                
+                states = self._cloud(spec.platform).fetch_states(unknown)
+                
+                members = [(instanceId, states.get(instanceId, current) if current == "unknown" else current, launched) for instanceId, current, launched in members]
+                
+            
+            observed[spec["SPEC_NAME"]] = [member for member in members if member[1] not in ("terminated", "shutting-down")]
+            
+        
+        return observed
+        
+    
+    def plan(self, observed):
+        
+        actions = []
+        
+        for spec, count, state in self.targets:
+            
+            members = sorted(observed[spec["SPEC_NAME"]], key = lambda member: member[2] or 0)
+            
+            up = [instanceId for instanceId, current, launched in members if current in ("running", "pending")]
+            down = [instanceId for instanceId, current, launched in members if current in ("stopped", "stopping")]
+            
+            unsettled = [instanceId for instanceId, current, launched in members if current not in KNOWN_STATES]
+            
+            if state == "stopped":
+                
+                up, down = down, up
+                
+            
+            #Surplus goes first from the instances in the wrong state, then the newest
+            
+            surplus = max(0, len(up) + len(down) - count)
+            
+            doomed = down[::-1][:surplus]
+            doomed += up[::-1][:surplus - len(doomed)]
+            
+            up = [instanceId for instanceId in up if instanceId not in doomed]
+            down = [instanceId for instanceId in down if instanceId not in doomed]
+            
+            if doomed:
+                
+                actions.append({"action" : "terminate", "spec" : spec, "ids" : doomed})
+                
+            
+            #Whatever is left in the wrong state is switched over
+            
+            switch = [instanceId for instanceId, current, launched in members if instanceId in down and current in ("stopped", "running")]
+            
+            if switch:
+                
+                actions.append({"action" : "start" if state == "running" else "stop", "spec" : spec, "ids" : switch})
+                
+            
+            missing = count - len(up) - len(down) - len(unsettled)
+            
+            if missing > 0:
+                
+                actions.append({"action" : "launch", "spec" : spec, "count" : missing, "then_stop" : state == "stopped"})
+                
+            
+        
+        return actions
+        
+    
+    def _execute(self, action):
+        
+        spec = action["spec"]
+        cloud = self._cloud(spec.platform)
+        
+        if action["action"] == "launch":
+            
+            operations = wait_all(cloud.launch_copies(spec, action["count"], "r{}-".format(uuid.uuid4().hex[:6])), self.timeout)
+            
+            if action["then_stop"]:
+                
+                launched = [instanceId for operation in operations if operation.ok for instanceId in operation.ids]
+                
+                operations = [operation for operation in operations if not operation.ok]
+                operations += wait_all([cloud.stop_instance(instanceId) for instanceId in launched], self.timeout)
+                
+            
+        
+        else:
+            
+            bulk = {"start" : cloud.start_instances, "stop" : cloud.stop_instances, "terminate" : cloud.terminate_instances}[action["action"]]
+            
+            results = bulk(action["ids"])
+            
+            operations = list({id(result["operation"]) : result["operation"] for result in results.values() if result["ok"]}.values())
+            
+            operations += [Operation.completed(spec.platform, action["action"], [instanceId], error = RuntimeError(result["error"])) for instanceId, result in results.items() if not result["ok"]]
+            
+            wait_all(operations, self.timeout)
+            
+        
+        errors = [_failure(operation.error)["error"] for operation in operations if operation.done and not operation.ok]
+        
+        if any(not operation.done for operation in operations):
+            
+            errors.append("timed out")
+            
+        
+        record = {"action" : action["action"], "spec" : spec["SPEC_NAME"], "platform" : spec.platform, "ok" : not errors, "ids" : [i for operation in operations if operation.ok for i in operation.ids]}
+        
+        if errors:
+            
+            record["errors"] = errors
+            
+        
+        return record
+        
+    
+    def reconcile(self, refresh = False):
+        
+        #One pass; the report says what was done and how long each part took
+        
+        started = time.perf_counter()
+        
+        observed = self.observe(refresh or self._relist)
+        
+        observed_at = time.perf_counter()
+        
+        unsettled = any(member[1] not in KNOWN_STATES for members in observed.values() for member in members)
+        
+        self._relist = unsettled
+        
+        fingerprint = (self._desired, json.dumps({name : sorted(member[:2] for member in members) for name, members in observed.items()}, sort_keys = True))
+        
+        report = {"observe_seconds" : round(observed_at - started, 3), "actions" : [], "skipped" : False}
+        
+        #Nothing changed since a pass that left everything as desired
+        
+        if fingerprint == self._last:
+            
+            report.update(skipped = True, converged = True, seconds = round(time.perf_counter() - started, 3))
+            
+            return report
+            
+        
+        actions = self.plan(observed)
+        
+        for action, future in _bounded_map(self._execute, actions, self.max_workers):
+            
+            try:
+                
+                report["actions"].append(future.result())
+                
+            
+            except Exception as error:
+                
+                report["actions"].append({"action" : action["action"], "spec" : action["spec"]["SPEC_NAME"], "platform" : action["spec"].platform, "ok" : False, "errors" : [_failure(error)["error"]]})
+                
+            
+        
+        report["converged"] = not actions and not unsettled
+        
+        #Only a pass with nothing to do is remembered; after any action, or with states
+        #still unread, the next pass has to look again
+        
+        self._last = fingerprint if report["converged"] else None
+        
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        
+        return report
+        
+    
+    def run(self, interval = RECONCILE_INTERVAL, passes = None, path = None):
+        
+        #Reconcile every interval seconds, reloading the desired state from path when
+        #the file changes; yields one report per pass
+        
+        modified = os.path.getmtime(path) if path else None
+        
+        count = 0
+        
+        while passes is None or count < passes:
+            
+            if path and os.path.getmtime(path) != modified:
+                
+                modified = os.path.getmtime(path)
+                
+                self.load(self.read(path))
+                
+            
+            pass_started = time.perf_counter()
+            
+            report = self.reconcile()
+            
+            count += 1
+            
+            report["pass"] = count
+            
+            yield report
+            
+            if passes is None or count < passes:
+                
+                time.sleep(max(0.0, interval - (time.perf_counter() - pass_started)))
+                
+            
+        
+    
+
+def main(argv = None):
+    
+    parser = argparse.ArgumentParser(description = "Launch, stop, start and terminate instances on AWS, GCP and Azure")
+    
+    parser.add_argument("--batch", metavar = "FILE", help = "run JSON-lines operations from FILE ('-' for stdin) instead of the menu")
+    parser.add_argument("--parallelism", type = int, default = MAX_WORKERS, help = "operations run at once in batch mode")
+    parser.add_argument("--timeout", type = float, default = None, help = "seconds to wait for each operation in batch mode")
+    parser.add_argument("--inventory", metavar = "PATH", default = INVENTORY_PATH, help = "SQLite inventory of launched resources")
+    parser.add_argument("--token-cache", metavar = "PATH", help = "share GCP and Azure access tokens with other processes through PATH")
+    parser.add_argument("--profile-startup", action = "store_true", help = "report import times against the startup budget and exit")
+    parser.add_argument("--reconcile", metavar = "FILE", help = "bring instances in line with the desired-state FILE instead of showing the menu")
+    parser.add_argument("--loop", metavar = "SECONDS", type = float, default = None, help = "with --reconcile, repeat every SECONDS instead of running one pass")
+    parser.add_argument("--matrix", metavar = "FILE", help = "launch every combination of the spec matrix in FILE ({\"platform\", \"spec\", \"axes\"}) and exit")
+    parser.add_argument("--metrics", metavar = "PATH", action = "append", default = [], help = "write latency metrics to PATH on exit (.json for a JSON snapshot, otherwise Prometheus text); repeatable")
+    
+    args = parser.parse_args(argv)
+    
+    if args.profile_startup:
+        
+        return 0 if profile_startup() else 1
+        
+    
+    default_credentials.path = args.token_cache
+    
+    inventory = Inventory(args.inventory)
+    
+    if args.reconcile is not None:
+        
+        reconciler = Reconciler(Reconciler.read(args.reconcile), inventory, timeout = args.timeout, max_workers = args.parallelism)
+        
+        failures = 0
+        
+        try:
+            
+            for report in reconciler.run(args.loop or 0.0, None if args.loop else 1, args.reconcile):
+                
+                failures = sum(not action["ok"] for action in report["actions"])
+                
+                print(json.dumps(report), flush = True)
+                
+            
+        
+        except KeyboardInterrupt:
+            
+            pass
+            
+        
+        finally:
+            
+            for path in args.metrics:
+                
+                default_metrics.write(path)
+                
+            
+        
+        return 1 if failures else 0
+        
+    
+    if args.matrix is not None:
+        
+        with open(args.matrix) as matrix_file:
+            
+            matrix = json.load(matrix_file)
+            
+        
+        platform = matrix["platform"]
+        
+        #"spec" names an entry of mySpecs or is a spec of its own
+        
+        base = matrix.get("spec", next(spec for spec in mySpecs if spec.platform == platform)["SPEC_NAME"])
+        base = next(spec for spec in mySpecs if spec["SPEC_NAME"] == base) if isinstance(base, str) else base
+        
+        failures = 0
+        
+        try:
+            
+            for record in launch_matrix(platform, base, matrix["axes"], timeout = args.timeout, inventory = inventory, max_workers = args.parallelism):
+                
+                failures += not record["ok"]
+                
+                print(json.dumps(record), flush = True)
+                
+            
+        
+        finally:
+            
+            for path in args.metrics:
+                
+                default_metrics.write(path)
+                
+            
+        
+        return 1 if failures else 0
+        
+    
+    if args.batch is None:
+        
+        try:
+            
+            menu(inventory)
+            
+        
+        finally:
+            
+            for path in args.metrics:
+                
+                default_metrics.write(path)
                 
             
         
+        return 0
+        
+    
+    source = sys.stdin if args.batch == "-" else open(args.batch)
+    
+    failures = 0
+    
+    try:
+        
+        for record in BatchRunner(timeout = args.timeout, inventory = inventory).run(source, args.parallelism):
+            
+            failures += not record["ok"]
+            
+            print(json.dumps(record), flush = True)
+            
+        
     
-    except KeyError:
+    finally:
         
-        print("\033c", end = "")
+        if source is not sys.stdin:
+            
+            source.close()
+            
         
-        print("Error: Invalid Option")
+        for path in args.metrics:
+            
+            default_metrics.write(path)
+            
         
+    
+    #Throughput counters go to stderr so stdout stays one result per line
+    
+    print(json.dumps({"scheduler" : default_scheduler.stats()}), file = sys.stderr)
+    
+    return 1 if failures else 0
+    
+
+if __name__ == "__main__":
+    
+    sys.exit(main())
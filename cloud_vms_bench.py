@@ -0,0 +1,926 @@
+#Offline benchmarks for cloud_vms
+
+#Runs Cloud against local stand-ins instead of real accounts: moto for EC2, a routing
+#fake behind googleapiclient for GCP, and SDK doubles for Azure. Every stand-in call can
+#be slowed down by an injected latency, and long-running operations take a configurable
+#time to finish, so the numbers reflect this module's own overhead and concurrency.
+#
+#Each run launches, stops, starts and terminates fleets of each size and reports ops/sec
+#with p50/p99 latency per action. Results are appended to a JSON-lines history file and
+#compared with the last run that used the same settings.
+#
+#Needs moto, boto3 and google-api-python-client; Azure needs nothing extra.
+
+#----------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import collections
+import argparse
+import importlib
+import random
+import re
+import subprocess
+import threading
+import time
+import platform as python_platform
+from email.parser import Parser
+from urllib.parse import urlparse, parse_qs
+
+import cloud_vms
+
+PROVIDERS = ("aws", "gcp", "azu")
+
+SIZES = (1, 10, 100, 1000)
+
+ACTIONS = ("launch", "stop", "start", "terminate")
+
+HISTORY_PATH = "bench_history.jsonl"
+
+#----------------------------------------------------------------------------------------
+
+#Injected latency: every stand-in call sleeps base + uniform(0, jitter) seconds
+
+class Latency(object):
+    
+    def __init__(self, base = 0.0, jitter = 0.0, seed = None):
+        
+        self.base = base
+        self.jitter = jitter
+        
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        
+    
+    def draw(self):
+        
+        if not self.jitter:
+            
+            return self.base
+            
+        
+        with self._lock:
+            
+            return self.base + self._random.uniform(0, self.jitter)
+            
+        
+    
+    def sleep(self):
+        
+        delay = self.draw()
+        
+        if delay > 0:
+            
+            time.sleep(delay)
+            
+        
+    
+
+class Delayed(object):
+    
+    #Proxy that sleeps before every method call on the wrapped client
+    
+    def __init__(self, target, latency):
+        
+        self._target = target
+        self._latency = latency
+        
+    
+    def __getattr__(self, name):
+        
+        value = getattr(self._target, name)
+        
+        if not callable(value):
+            
+            return value
+            
+        
+        def call(*args, **kwargs):
+            
+            self._latency.sleep()
+            
+            return value(*args, **kwargs)
+            
+        
+        call.__name__ = name
+        
+        return call
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#AWS: moto's in-process EC2, reached through ordinary boto3 clients
+
+class AwsStandIn(object):
+    
+    def __init__(self, latency):
+        
+        self.latency = latency
+        
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SECURITY_TOKEN", "AWS_SESSION_TOKEN"):
+            
+            os.environ.setdefault(name, "testing")
+            
+        
+        moto = importlib.import_module("moto")
+        
+        #mock_aws since moto 5, mock_ec2 before that
+        
+        self._mock = getattr(moto, "mock_aws", None) or getattr(moto, "mock_ec2")
+        self._mock = self._mock()
+        self._mock.start()
+        
+        self._session = importlib.import_module("boto3").session.Session(region_name = "us-east-1")
+        
+    
+    def factories(self):
+        
+        return {
+            
+            ("aws", "client") : lambda region, credentials: Delayed(self._session.client("ec2"), self.latency),
+            ("aws", "resource") : lambda region, credentials: Delayed(self._session.resource("ec2"), self.latency)
+            
+        }
+        
+    
+    def prepare(self, cloud, spec):
+        
+        cloud.create_key(spec["KEY_NAME"])
+        
+        return spec
+        
+    
+    def close(self):
+        
+        self._mock.stop()
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#GCP: googleapiclient builds compute from its bundled discovery document and sends every
+#request to a fake HTTP object that routes on method and path. (HttpMockSequence replays
+#responses in a fixed order, which concurrent launches and polls do not follow.)
+
+class GcpHttp(object):
+    
+    def __init__(self, latency, operation_time):
+        
+        self.latency = latency
+        self.operation_time = operation_time
+        
+        self.instances = {}
+        self.operations = {}
+        
+        #Operations not yet applied to their instance, oldest first
+        
+        self._unsettled = collections.deque()
+        
+        self._lock = threading.Lock()
+        self._counter = 0
+        
+        #HTTP round trips, batches counting once
+        
+        self.round_trips = 0
+        
+    
+    def request(self, uri, method = "GET", body = None, headers = None, **kwargs):
+        
+        self.latency.sleep()
+        
+        url = urlparse(uri)
+        
+        with self._lock:
+            
+            self.round_trips += 1
+            
+            if url.path.startswith("/batch/"):
+                
+                return self._batch(body, headers)
+                
+            
+            status, content = self._call(method, uri, body)
+            
+        
+        response = importlib.import_module("httplib2").Response({"status" : str(status), "content-type" : "application/json"})
+        
+        return response, json.dumps(content).encode()
+        
+    
+    def _call(self, method, uri, body):
+        
+        url = urlparse(uri)
+        
+        path = url.path.split("/compute/v1/", 1)[-1].strip("/").split("/")
+        
+        return self._route(method, path, parse_qs(url.query), json.loads(body) if body else None)
+        
+    
+    def _batch(self, body, headers):
+        
+        #multipart/mixed in, multipart/mixed out, one application/http part per call
+        
+        message = Parser().parsestr("content-type: {}\r\n\r\n{}".format(headers["content-type"], body))
+        
+        parts = []
+        
+        for part in message.get_payload():
+            
+            request_line, _, rest = part.get_payload().partition("\n")
+            
+            method, target = request_line.split(" ")[:2]
+            
+            inner_body = rest.split("\n\n", 1)[1] if "\n\n" in rest else ""
+            
+            status, content = self._call(method, "https://compute.googleapis.com" + target, inner_body.strip() or None)
+            
+            parts.append("--bench\r\nContent-Type: application/http\r\nContent-ID: <response-{}>\r\n\r\nHTTP/1.1 {} {}\r\nContent-Type: application/json\r\n\r\n{}\r\n".format(
+                
+                part["Content-ID"][1:-1], status, "OK" if status < 300 else "Error", json.dumps(content)
+                
+            ))
+            
+        
+        response = importlib.import_module("httplib2").Response({"status" : "200", "content-type" : 'multipart/mixed; boundary="bench"'})
+        
+        return response, ("".join(parts) + "--bench--\r\n").encode()
+        
+    
+    def _route(self, method, path, query, body):
+        
+        #Finished operations change their instance whether or not anyone polls them
+        
+        while self._unsettled and time.monotonic() >= self._unsettled[0]["done_at"]:
+            
+            self._operation_view(self._unsettled.popleft())
+            
+        
+        #projects/{project}/zones/{zone}/...
+        
+        if path[-2:-1] == ["aggregated"] or path[-1] == "instances" and "aggregated" in path:
+            
+            return 200, {"items" : {"zones/bench" : {"instances" : list(self.instances.values())}}}
+            
+        
+        project, zone, rest = path[1], path[3], path[4:]
+        
+        if rest[0] == "operations":
+            
+            operation = self.operations.get(rest[1])
+            
+            if operation is None:
+                
+                return 404, {"error" : {"code" : 404, "message" : "operation not found"}}
+                
+            
+            return 200, self._operation_view(operation)
+            
+        
+        if rest == ["instances"] and method == "POST":
+            
+            if body["name"] in self.instances:
+                
+                return 409, {"error" : {"code" : 409, "message" : "instance {} already exists".format(body["name"])}}
+                
+            
+            self.instances[body["name"]] = {"name" : body["name"], "status" : "PROVISIONING", "zone" : "zones/" + zone, "machineType" : body.get("machineType", "")}
+            
+            return 200, self._start_operation("insert", body["name"], "RUNNING")
+            
+        
+        if rest == ["instances"]:
+            
+            names = set(re.findall(r'name = "([^"]+)"', query.get("filter", [""])[0]))
+            
+            return 200, {"items" : [instance for name, instance in self.instances.items() if not names or name in names]}
+            
+        
+        name = rest[1]
+        
+        if name not in self.instances:
+            
+            return 404, {"error" : {"code" : 404, "message" : "instance {} not found".format(name)}}
+            
+        
+        if method == "DELETE":
+            
+            self.instances[name]["status"] = "STOPPING"
+            
+            return 200, self._start_operation("delete", name, None)
+            
+        
+        if rest[2:] == ["stop"]:
+            
+            self.instances[name]["status"] = "STOPPING"
+            
+            return 200, self._start_operation("stop", name, "TERMINATED")
+            
+        
+        if rest[2:] == ["start"]:
+            
+            self.instances[name]["status"] = "STAGING"
+            
+            return 200, self._start_operation("start", name, "RUNNING")
+            
+        
+        return 200, self.instances[name]
+        
+    
+    def _start_operation(self, kind, name, final):
+        
+        self._counter += 1
+        
+        operation = {"name" : "operation-{}".format(self._counter), "operationType" : kind, "targetId" : name, "done_at" : time.monotonic() + self.operation_time, "final" : final}
+        
+        self.operations[operation["name"]] = operation
+        self._unsettled.append(operation)
+        
+        return self._operation_view(operation)
+        
+    
+    def _operation_view(self, operation):
+        
+        done = time.monotonic() >= operation["done_at"]
+        
+        if done and "applied" not in operation:
+            
+            operation["applied"] = True
+            
+            if operation["final"] is None:
+                
+                self.instances.pop(operation["targetId"], None)
+                
+            
+            elif operation["targetId"] in self.instances:
+                
+                self.instances[operation["targetId"]]["status"] = operation["final"]
+                
+            
+        
+        return {"name" : operation["name"], "operationType" : operation["operationType"], "targetId" : operation["targetId"], "status" : "DONE" if done else "RUNNING"}
+        
+    
+
+class GcpStandIn(object):
+    
+    def __init__(self, latency, operation_time):
+        
+        self.http = GcpHttp(latency, operation_time)
+        
+        self._discovery = importlib.import_module("googleapiclient.discovery")
+        
+    
+    def factories(self):
+        
+        return {("gcp", "compute") : lambda region, credentials: self._discovery.build("compute", "v1", http = self.http, static_discovery = True)}
+        
+    
+    def prepare(self, cloud, spec):
+        
+        return spec
+        
+    
+    def close(self):
+        
+        pass
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#Azure: doubles with the shape of the management SDK's operation groups. Mutating calls
+#return pollers that finish after the configured operation time.
+
+class AzurePoller(object):
+    
+    def __init__(self, value, seconds):
+        
+        self._value = value
+        self._done_at = time.monotonic() + seconds
+        
+    
+    def done(self):
+        
+        return time.monotonic() >= self._done_at
+        
+    
+    def result(self, timeout = None):
+        
+        remaining = self._done_at - time.monotonic()
+        
+        if remaining > 0:
+            
+            time.sleep(remaining)
+            
+        
+        return self._value
+        
+    
+    def wait(self, timeout = None):
+        
+        self.result(timeout)
+        
+    
+    def add_done_callback(self, func):
+        
+        #Like the SDK's pollers, calls func(result) from another thread once done
+        
+        timer = threading.Timer(max(0.0, self._done_at - time.monotonic()), func, (self._value,))
+        timer.daemon = True
+        timer.start()
+        
+    
+
+class AzureResource(object):
+    
+    def __init__(self, **fields):
+        
+        self.__dict__.update(fields)
+        
+    
+
+class AzureNotFound(Exception):
+    
+    pass
+    
+
+class AzureGroup(object):
+    
+    #One operation group (virtual_machines, network_interfaces, ...) over a shared store
+    
+    def __init__(self, kind, stand_in):
+        
+        self.kind = kind
+        self.stand_in = stand_in
+        
+    
+    def _store(self):
+        
+        return self.stand_in.resources.setdefault(self.kind, {})
+        
+    
+    def _resource(self, group, name, **fields):
+        
+        return AzureResource(id = "/subscriptions/bench/resourceGroups/{}/providers/{}/{}".format(group, self.kind, name), name = name, **fields)
+        
+    
+    def _lookup(self, name):
+        
+        with self.stand_in.lock:
+            
+            if name not in self._store():
+                
+                raise AzureNotFound("ResourceNotFound: {} {} was not found".format(self.kind, name))
+                
+            
+            return self._store()[name]
+            
+        
+    
+    def create_or_update(self, group, name, parameters):
+        
+        self.stand_in.latency.sleep()
+        
+        resource = self._resource(group, name, location = parameters.get("location"), zones = parameters.get("zones"), hardware_profile = None, power = "PowerState/running")
+        
+        with self.stand_in.lock:
+            
+            self._store()[name] = resource
+            
+        
+        return AzurePoller(resource, self.stand_in.operation_time)
+        
+    
+    def delete(self, group, name):
+        
+        self.stand_in.latency.sleep()
+        
+        self._lookup(name)
+        
+        with self.stand_in.lock:
+            
+            del self._store()[name]
+            
+        
+        return AzurePoller(None, self.stand_in.operation_time)
+        
+    
+    def _power(self, name, state):
+        
+        self.stand_in.latency.sleep()
+        
+        self._lookup(name).power = state
+        
+        return AzurePoller(None, self.stand_in.operation_time)
+        
+    
+    def power_off(self, group, name):
+        
+        return self._power(name, "PowerState/stopped")
+        
+    
+    def deallocate(self, group, name):
+        
+        return self._power(name, "PowerState/deallocated")
+        
+    
+    def start(self, group, name):
+        
+        return self._power(name, "PowerState/running")
+        
+    
+    def get(self, group, *names):
+        
+        self.stand_in.latency.sleep()
+        
+        if self.kind == "subnets":
+            
+            return self._resource(group, "/".join(names))
+            
+        
+        return self._lookup(names[-1])
+        
+    
+    def instance_view(self, group, name):
+        
+        self.stand_in.latency.sleep()
+        
+        return AzureResource(statuses = [AzureResource(code = "ProvisioningState/succeeded"), AzureResource(code = self._lookup(name).power)])
+        
+    
+    def list(self, resource_group_name):
+        
+        self.stand_in.latency.sleep()
+        
+        with self.stand_in.lock:
+            
+            return list(self._store().values())
+            
+        
+    
+    def list_all(self, status_only = None):
+        
+        #With status_only the service returns each VM's instance view alongside it
+        
+        resources = self.list(None)
+        
+        if status_only != "true":
+            
+            return resources
+            
+        
+        return [AzureResource(instance_view = AzureResource(statuses = [AzureResource(code = "ProvisioningState/succeeded"), AzureResource(code = resource.power)]), **resource.__dict__) for resource in resources]
+        
+    
+
+class AzureStandIn(object):
+    
+    def __init__(self, latency, operation_time):
+        
+        self.latency = latency
+        self.operation_time = operation_time
+        
+        self.resources = {}
+        self.lock = threading.Lock()
+        
+        self.compute = AzureResource(virtual_machines = AzureGroup("virtualMachines", self))
+        self.network = AzureResource(network_interfaces = AzureGroup("networkInterfaces", self), public_ip_addresses = AzureGroup("publicIPAddresses", self), subnets = AzureGroup("subnets", self))
+        
+    
+    def factories(self):
+        
+        return {("azu", "compute") : lambda region, credentials: self.compute, ("azu", "network") : lambda region, credentials: self.network}
+        
+    
+    def prepare(self, cloud, spec):
+        
+        #Hand the key over in the spec so no key files are read or deleted
+        
+        return spec.replace(PUBLIC_KEY = "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC bench", PUBLIC_KEY_NAME = "")
+        
+    
+    def close(self):
+        
+        pass
+        
+    
+
+def stand_in(platform, latency, operation_time):
+    
+    if platform == "aws":
+        
+        return AwsStandIn(latency)
+        
+    
+    if platform == "gcp":
+        
+        return GcpStandIn(latency, operation_time)
+        
+    
+    return AzureStandIn(latency, operation_time)
+    
+
+#----------------------------------------------------------------------------------------
+
+def percentile(values, q):
+    
+    #Nearest-rank percentile
+    
+    if not values:
+        
+        return 0.0
+        
+    
+    ordered = sorted(values)
+    
+    return ordered[max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))]
+    
+
+def unlimited_scheduler():
+    
+    #The real rate limits would turn every large fleet into a measurement of the limits
+    
+    return cloud_vms.Scheduler({key : (1e9, 10 ** 9) for key in cloud_vms.RATE_LIMITS})
+    
+
+class Bench(object):
+    
+    def __init__(self, latency = 0.0, jitter = 0.0, operation_time = 0.0, rate_limits = False, timeout = 600.0, seed = None):
+        
+        self.latency = Latency(latency, jitter, seed)
+        self.operation_time = operation_time
+        
+        self.rate_limits = rate_limits
+        self.timeout = timeout
+        
+    
+    def settings(self):
+        
+        return {"latency" : self.latency.base, "jitter" : self.latency.jitter, "operation_time" : self.operation_time, "rate_limits" : self.rate_limits}
+        
+    
+    def run(self, platform, size):
+        
+        #Fresh stand-ins, pool, inventory and caches for every fleet, so runs do not
+        #share state
+        
+        backend = stand_in(platform, self.latency, self.operation_time)
+        
+        metrics = cloud_vms.Metrics()
+        
+        cloud = cloud_vms.Cloud(platform, region = "us-east-1" if platform == "aws" else None,
+                                pool = cloud_vms.ClientPool(backend.factories()),
+                                inventory = cloud_vms.Inventory(":memory:"),
+                                list_cache = cloud_vms.ListCache(),
+                                scheduler = cloud_vms.Scheduler() if self.rate_limits else unlimited_scheduler(),
+                                metrics = metrics,
+                                launch_templates = cloud_vms.LaunchTemplates())
+                                
+        records = []
+        
+        try:
+            
+            spec = backend.prepare(cloud, cloud_vms.mySpecs[PROVIDERS.index(platform)])
+            
+            ids = []
+            
+            for action in ACTIONS:
+                
+                record, ids = self._measure(cloud, action, spec, size, ids)
+                
+                record.update(platform = platform, size = size)
+                
+                records.append(record)
+                
+            
+        
+        finally:
+            
+            backend.close()
+            cloud.inventory.close()
+            
+        
+        return records
+        
+    
+    def _measure(self, cloud, action, spec, size, ids):
+        
+        started = time.perf_counter()
+        
+        errors = 0
+        
+        if action == "launch":
+            
+            operations = cloud.launch_copies(spec, size)
+            
+        
+        else:
+            
+            bulk = {"stop" : cloud.stop_instances, "start" : cloud.start_instances, "terminate" : cloud.terminate_instances}[action]
+            
+            results = bulk(ids)
+            
+            errors += sum(not result["ok"] for result in results.values())
+            
+            operations = list({id(result["operation"]) : result["operation"] for result in results.values() if result["ok"]}.values())
+            
+        
+        cloud_vms.wait_all(operations, self.timeout)
+        
+        seconds = time.perf_counter() - started
+        
+        #Every instance counts once, with the latency of the handle that covers it
+        
+        latencies = []
+        covered = []
+        
+        for operation in operations:
+            
+            if operation.ok:
+                
+                latencies.extend([operation.seconds] * len(operation.ids))
+                covered.extend(operation.ids)
+                
+            
+            else:
+                
+                errors += len(operation.ids) or 1
+                
+            
+        
+        record = {
+            
+            "action" : action,
+            "ops" : len(latencies),
+            "errors" : errors,
+            "seconds" : round(seconds, 4),
+            "ops_per_sec" : round(len(latencies) / seconds, 2) if seconds else 0.0,
+            "p50" : round(percentile(latencies, 0.5), 4),
+            "p99" : round(percentile(latencies, 0.99), 4)
+            
+        }
+        
+        return record, covered if action == "launch" else ids
+        
+    
+    def run_all(self, providers = PROVIDERS, sizes = SIZES, report = None):
+        
+        results = []
+        
+        for platform in providers:
+            
+            for size in sizes:
+                
+                records = self.run(platform, size)
+                
+                for record in records:
+                    
+                    if report is not None:
+                        
+                        report(record)
+                        
+                    
+                
+                results.extend(records)
+                
+            
+        
+        return results
+        
+    
+
+#----------------------------------------------------------------------------------------
+
+#History: one JSON object per run
+
+def _commit():
+    
+    try:
+        
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(__file__)))
+        
+        return result.stdout.strip() or None
+        
+    
+    except OSError:
+        
+        return None
+        
+    
+
+def load_history(path):
+    
+    if not os.path.exists(path):
+        
+        return []
+        
+    
+    with open(path) as history_file:
+        
+        return [json.loads(line) for line in history_file if line.strip()]
+        
+    
+
+def append_history(path, entry):
+    
+    with open(path, "a") as history_file:
+        
+        history_file.write(json.dumps(entry, sort_keys = True) + "\n")
+        
+    
+
+def compare(previous, results):
+    
+    #{(platform, size, action) : (old ops/sec, new ops/sec, old p99, new p99)}
+    
+    old = {(record["platform"], record["size"], record["action"]) : record for record in previous["results"]}
+    
+    changes = {}
+    
+    for record in results:
+        
+        key = (record["platform"], record["size"], record["action"])
+        
+        if key in old:
+            
+            changes[key] = (old[key]["ops_per_sec"], record["ops_per_sec"], old[key]["p99"], record["p99"])
+            
+        
+    
+    return changes
+    
+
+def _row(record):
+    
+    return "{platform:>4} {size:>5} {action:>10} {ops:>6} {errors:>6} {seconds:>9.3f} {ops_per_sec:>10.2f} {p50:>8.3f} {p99:>8.3f}".format(**record)
+    
+
+def main(argv = None):
+    
+    parser = argparse.ArgumentParser(description = "Benchmark cloud_vms against local provider stand-ins")
+    
+    parser.add_argument("--providers", nargs = "+", choices = PROVIDERS, default = list(PROVIDERS))
+    parser.add_argument("--sizes", nargs = "+", type = int, default = list(SIZES), help = "fleet sizes to run")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds added to every stand-in call")
+    parser.add_argument("--jitter", type = float, default = 0.0, help = "up to this many more seconds, drawn uniformly")
+    parser.add_argument("--operation-time", type = float, default = 0.0, help = "seconds a GCP or Azure long-running operation takes")
+    parser.add_argument("--rate-limits", action = "store_true", help = "keep the scheduler's real per-provider rate limits")
+    parser.add_argument("--timeout", type = float, default = 600.0, help = "seconds to wait for each action")
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--history", metavar = "PATH", default = HISTORY_PATH, help = "JSON-lines file results are appended to")
+    parser.add_argument("--no-history", action = "store_true", help = "do not read or write the history file")
+    
+    args = parser.parse_args(argv)
+    
+    bench = Bench(args.latency, args.jitter, args.operation_time, args.rate_limits, args.timeout, args.seed)
+    
+    print("{:>4} {:>5} {:>10} {:>6} {:>6} {:>9} {:>10} {:>8} {:>8}".format("prov", "size", "action", "ops", "errors", "seconds", "ops/sec", "p50", "p99"))
+    
+    results = bench.run_all(args.providers, args.sizes, lambda record: print(_row(record), flush = True))
+    
+    if args.no_history:
+        
+        return 0
+        
+    
+    entry = {"time" : time.time(), "commit" : _commit(), "python" : python_platform.python_version(), "settings" : bench.settings(), "results" : results}
+    
+    #The most recent run with the same settings that covered any of the same fleets
+    
+    for previous in reversed(load_history(args.history)):
+        
+        changes = compare(previous, results) if previous.get("settings") == entry["settings"] else {}
+        
+        if changes:
+            
+            break
+            
+        
+    
+    else:
+        
+        changes = {}
+        
+    
+    if changes:
+        
+        print("\nAgainst {} ({}):\n".format(previous.get("commit") or "previous run", time.strftime("%Y-%m-%d %H:%M", time.localtime(previous["time"]))))
+        
+        for (platform, size, action), (old_rate, new_rate, old_p99, new_p99) in sorted(changes.items()):
+            
+            change = (new_rate - old_rate) / old_rate * 100 if old_rate else 0.0
+            
+            print("{:>4} {:>5} {:>10} ops/sec {:>10.2f} -> {:>10.2f} ({:+.1f}%)  p99 {:.3f} -> {:.3f}".format(platform, size, action, old_rate, new_rate, change, old_p99, new_p99))
+            
+        
+    
+    append_history(args.history, entry)
+    
+    return 0
+    
+
+if __name__ == "__main__":
+    
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+#cloud_vms and its bench are top-level modules in the repository root
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloud_vms
+import cloud_vms_bench
+
+
+@pytest.fixture
+def client_error():
+    
+    #Builds the botocore error EC2 raises for an error code, with an optional Retry-After
+    
+    def make(code, retry_after = None):
+        
+        headers = {} if retry_after is None else {"Retry-After": str(retry_after)}
+        
+        return ClientError({"Error" : {"Code" : code, "Message" : code}, "ResponseMetadata" : {"HTTPStatusCode" : 400, "HTTPHeaders" : headers}}, "StopInstances")
+        
+    
+    return make
+    
+
+@pytest.fixture
+def settle():
+    
+    #Waits out the handles behind a bulk call's accepted results
+    
+    def wait(results):
+        
+        operations = list({id(result["operation"]) : result["operation"] for result in results.values() if result["ok"]}.values())
+        
+        return cloud_vms.wait_all(operations, 30)
+        
+    
+    return wait
+    
+
+@pytest.fixture
+def make_cloud():
+    
+    #Cloud against a fresh local stand-in: moto for EC2, the fake HTTP endpoint for
+    #GCP and the SDK doubles for Azure, with no latency and, unless operation_time says
+    #otherwise, instant operations
+    
+    backends = []
+    
+    def make(platform, inventory = None, operation_time = 0.0):
+        
+        backend = cloud_vms_bench.stand_in(platform, cloud_vms_bench.Latency(0.0, 0.0), operation_time)
+        
+        backends.append(backend)
+        
+        cloud = cloud_vms.Cloud(platform, region = "us-east-1" if platform == "aws" else None,
+                                pool = cloud_vms.ClientPool(backend.factories()),
+                                inventory = inventory,
+                                list_cache = cloud_vms.ListCache(),
+                                scheduler = cloud_vms_bench.unlimited_scheduler(),
+                                metrics = cloud_vms.Metrics(),
+                                launch_templates = cloud_vms.LaunchTemplates())
+                                
+        spec = backend.prepare(cloud, cloud_vms.mySpecs[cloud_vms_bench.PROVIDERS.index(platform)])
+        
+        return cloud, spec
+        
+    
+    yield make
+    
+    for backend in backends:
+        
+        backend.close()
+        
+    
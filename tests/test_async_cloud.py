@@ -0,0 +1,301 @@
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+import cloud_vms
+
+
+def test_executor_calls_respect_the_in_flight_limit(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    running = {"now" : 0, "peak" : 0}
+    lock = threading.Lock()
+    
+    launch_instance = cloud.launch_instance
+    
+    def counted(specifications, overrides = None):
+        
+        with lock:
+            
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            
+        
+        time.sleep(0.02)
+        
+        try:
+            
+            return launch_instance(specifications, overrides)
+            
+        
+        finally:
+            
+            with lock:
+                
+                running["now"] -= 1
+                
+            
+        
+    
+    monkeypatch.setattr(cloud, "launch_instance", counted)
+    
+    async def main():
+        
+        async with cloud_vms.AsyncCloud(cloud = cloud, max_in_flight = 2) as clouds:
+            
+            launched = await asyncio.gather(*[clouds.launch_instance(spec, cloud_vms.unique_names("azu", spec, str(index))) for index in range(6)])
+            
+            ids = [instanceId for operation in launched for instanceId in operation.ids]
+            
+            stopped = await asyncio.gather(*[clouds.stop_instance(instanceId) for instanceId in ids])
+            terminated = await asyncio.gather(*[clouds.terminate_instance(instanceId) for instanceId in ids])
+            
+            return launched, stopped, terminated
+            
+        
+    
+    launched, stopped, terminated = asyncio.run(main())
+    
+    assert all(operation.ok for operation in launched + stopped + terminated)
+    assert len(launched) == 6
+    
+    assert running["peak"] == 2
+    
+
+def test_executor_handles_settle_through_one_shared_poller(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", operation_time = 0.2)
+    
+    async def main():
+        
+        clouds = cloud_vms.AsyncCloud(cloud = cloud, native = False)
+        
+        try:
+            
+            operations = await asyncio.gather(*[clouds.launch_instance(spec, cloud_vms.unique_names("gcp", spec, str(index))) for index in range(4)])
+            
+            return operations, clouds._waiting
+            
+        
+        finally:
+            
+            await clouds.aclose()
+            
+        
+    
+    operations, waiting = asyncio.run(main())
+    
+    assert all(isinstance(operation, cloud_vms.GcpOperation) and operation.ok for operation in operations)
+    assert waiting == []
+    
+
+class Credentials(object):
+    
+    def __init__(self):
+        
+        self.client_id = "async-test"
+        
+        self.token = None
+        self.expiry = None
+        
+    
+    def refresh(self, request):
+        
+        self.token = "T"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours = 1)
+        
+    
+
+class ComputeServer(object):
+    
+    def __init__(self, operation_time = 0.05):
+        
+        self.operation_time = operation_time
+        
+        self.instances = {}
+        self.operations = {}
+        
+        self.requests = []
+        
+    
+    def _operation(self, kind, name):
+        
+        operation = {"name" : "op-{}".format(len(self.operations)), "status" : "RUNNING", "targetId" : name, "operationType" : kind}
+        
+        self.operations[operation["name"]] = (operation, time.monotonic() + self.operation_time)
+        
+        return dict(operation)
+        
+    
+    async def handle(self, request):
+        
+        web = cloud_vms._require("aiohttp.web")
+        
+        self.requests.append((request.method, request.path))
+        
+        if request.headers.get("Authorization") != "Bearer T":
+            
+            return web.json_response({"error" : {"code" : 401, "message" : "no token"}}, status = 401)
+            
+        
+        #/compute/v1/projects/{project}/zones/{zone}/...
+        
+        rest = request.path.split("/")[7:]
+        
+        if rest[0] == "operations":
+            
+            operation, done_at = self.operations[rest[1]]
+            
+            if time.monotonic() >= done_at:
+                
+                operation["status"] = "DONE"
+                
+            
+            return web.json_response(operation)
+            
+        
+        if rest == ["instances"]:
+            
+            name = (await request.json())["name"]
+            
+            if name in self.instances:
+                
+                return web.json_response({"error" : {"code" : 409, "message" : "already exists"}}, status = 409)
+                
+            
+            self.instances[name] = "RUNNING"
+            
+            return web.json_response(self._operation("insert", name))
+            
+        
+        name = rest[1]
+        
+        if name not in self.instances:
+            
+            return web.json_response({"error" : {"code" : 404, "message" : "not found"}}, status = 404)
+            
+        
+        if request.method == "DELETE":
+            
+            del self.instances[name]
+            
+            return web.json_response(self._operation("delete", name))
+            
+        
+        self.instances[name] = {"stop" : "TERMINATED", "start" : "RUNNING"}[rest[2]]
+        
+        return web.json_response(self._operation(rest[2], name))
+        
+    
+
+def serving(test):
+    
+    #Runs test(clouds, server, spec) with the server up and GCP_REST pointed at it
+    
+    web = cloud_vms._require("aiohttp.web")
+    
+    server = ComputeServer()
+    
+    async def main():
+        
+        application = web.Application()
+        application.router.add_route("*", "/{tail:.*}", server.handle)
+        
+        runner = web.AppRunner(application)
+        
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        
+        port = runner.addresses[0][1]
+        
+        rest = cloud_vms.GCP_REST
+        cloud_vms.GCP_REST = "http://127.0.0.1:{}/compute/v1/".format(port)
+        
+        pool = cloud_vms.ClientPool(credential_cache = cloud_vms.CredentialCache(background = False))
+        
+        clouds = cloud_vms.AsyncCloud("gcp", credentials = Credentials(), pool = pool, inventory = cloud_vms.Inventory(":memory:"), list_cache = cloud_vms.ListCache(), scheduler = cloud_vms.Scheduler(), metrics = cloud_vms.Metrics())
+        
+        try:
+            
+            return await test(clouds, server, cloud_vms.mySpecs[1])
+            
+        
+        finally:
+            
+            cloud_vms.GCP_REST = rest
+            
+            await clouds.aclose()
+            await runner.cleanup()
+            
+        
+    
+    return asyncio.run(main()), server
+    
+
+def test_gcp_calls_go_over_aiohttp():
+    
+    async def test(clouds, server, spec):
+        
+        launched = await asyncio.gather(*[clouds.launch_instance(spec, cloud_vms.unique_names("gcp", spec, str(index))) for index in range(5)])
+        
+        ids = [instanceId for operation in launched for instanceId in operation.ids]
+        
+        stopped = await asyncio.gather(*[clouds.stop_instance(instanceId) for instanceId in ids])
+        
+        with pytest.raises(cloud_vms.GcpRestError) as duplicate:
+            
+            await clouds.launch_instance(spec, cloud_vms.unique_names("gcp", spec, "0"))
+            
+        
+        terminated = await asyncio.gather(*[clouds.terminate_instance(instanceId) for instanceId in ids])
+        
+        return launched, stopped, terminated, duplicate.value, clouds.cloud
+        
+    
+    (launched, stopped, terminated, duplicate, cloud), server = serving(test)
+    
+    assert all(isinstance(operation, cloud_vms.GcpRestOperation) and operation.ok for operation in launched + stopped + terminated)
+    
+    assert duplicate.status_code == 409
+    
+    assert server.instances == {}
+    
+    #Project and zone for the stops came from the inventory
+    
+    ids = [operation.ids[0] for operation in launched]
+    
+    assert {cloud.inventory.get("gcp", instanceId)["state"] for instanceId in ids} == {"terminated"}
+    
+    assert {entry["call"] for entry in cloud.metrics.snapshot()["metrics"]["cloud_vms_call_seconds"]} == {"rest"}
+    
+
+def test_rest_handles_can_also_be_waited_on_from_threads():
+    
+    async def test(clouds, server, spec):
+        
+        name = "blocking-wait"
+        
+        server.instances[name] = "RUNNING"
+        
+        operation = await clouds._gcp("mutate", "POST", "projects/{}/zones/{}/instances/{}/stop".format(spec["PROJECT"], spec["ZONE"], name))
+        
+        handle = cloud_vms.GcpRestOperation(clouds._gcp_blocking_token, spec["PROJECT"], spec["ZONE"], "stop", [name], operation)
+        
+        #The synchronous waiter polls over plain HTTP, so it runs off the event loop
+        
+        await asyncio.get_running_loop().run_in_executor(None, cloud_vms.wait_all, [handle], 10)
+        
+        return handle
+        
+    
+    handle, server = serving(test)
+    
+    assert handle.ok
+    assert handle.value["status"] == "DONE"
+    
+    assert ("GET", "/compute/v1/projects/{}/zones/{}/operations/op-0".format(cloud_vms.mySpecs[1]["PROJECT"], cloud_vms.mySpecs[1]["ZONE"])) in server.requests
+    
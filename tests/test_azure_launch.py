@@ -0,0 +1,72 @@
+import cloud_vms
+
+
+def test_each_launch_creates_ip_then_nic_then_vm(make_cloud):
+    
+    cloud, spec = make_cloud("azu")
+    
+    operations = cloud_vms.wait_all(cloud.launch_copies(spec, 3), 30)
+    
+    assert all(operation.ok for operation in operations)
+    
+    for operation in operations:
+        
+        assert [name for name, seconds, ok in operation.steps] == ["create_ip", "create_nic", "create_vm"]
+        
+    
+    resources = cloud._client("compute").virtual_machines.stand_in.resources
+    
+    assert len(resources["virtualMachines"]) == len(resources["networkInterfaces"]) == len(resources["publicIPAddresses"]) == 3
+    
+    assert sorted(resources["virtualMachines"]) == sorted(instanceId for operation in operations for instanceId in operation.ids)
+    
+
+def test_the_subnet_is_looked_up_once_for_many_launches(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("azu")
+    
+    subnets = cloud._client("network").subnets
+    
+    lookups = []
+    
+    get = subnets.get
+    
+    def counted(group, *names):
+        
+        lookups.append(names)
+        
+        return get(group, *names)
+        
+    
+    monkeypatch.setattr(subnets, "get", counted)
+    
+    operations = cloud_vms.wait_all(cloud.launch_copies(spec, 4), 30)
+    operations += cloud_vms.wait_all(cloud.launch_copies(spec, 2, prefix = "more-"), 30)
+    
+    assert all(operation.ok for operation in operations)
+    
+    assert len(lookups) == 1
+    
+
+def test_a_failed_stage_ends_the_launch_without_later_stages(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("azu")
+    
+    network_interfaces = cloud._client("network").network_interfaces
+    
+    def refuse(group, name, parameters):
+        
+        raise RuntimeError("SubnetIsFull")
+        
+    
+    monkeypatch.setattr(network_interfaces, "create_or_update", refuse)
+    
+    operation = cloud_vms.wait_all([cloud.launch_instance(spec)], 30)[0]
+    
+    assert operation.done and not operation.ok
+    assert "SubnetIsFull" in str(operation.error)
+    
+    assert [(name, ok) for name, seconds, ok in operation.steps] == [("create_ip", True), ("create_nic", False)]
+    
+    assert cloud._client("compute").virtual_machines.stand_in.resources.get("virtualMachines", {}) == {}
+    
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cloud_vms
+import cloud_vms_bench
+
+
+@pytest.fixture
+def runner():
+    
+    backend = cloud_vms_bench.stand_in("gcp", cloud_vms_bench.Latency(0.0, 0.0), 0.0)
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    batch = cloud_vms.BatchRunner(pool = cloud_vms.ClientPool(backend.factories()), timeout = 30, inventory = inventory)
+    
+    yield batch, backend.prepare(None, cloud_vms.mySpecs[1]).to_dict()
+    
+    backend.close()
+    
+
+def test_each_line_reports_one_result_record(runner):
+    
+    runner, spec = runner
+    
+    launch = {"id" : "first", "op" : "launch", "platform" : "gcp", "spec" : spec, "count" : 2}
+    
+    records = list(runner.run([json.dumps(launch), "", "not json", json.dumps({"op" : "reboot", "platform" : "gcp"})]))
+    
+    records = {record["line"] : record for record in records}
+    
+    #The blank line is skipped but still counted
+    
+    assert sorted(records) == [1, 3, 4]
+    
+    assert records[1]["ok"] and records[1]["id"] == "first"
+    assert len(records[1]["operations"]) == 2
+    assert all(operation["ok"] for operation in records[1]["operations"])
+    
+    assert not records[3]["ok"]
+    assert not records[4]["ok"] and "unknown op" in records[4]["error"]
+    
+
+def test_later_lines_act_on_inventoried_instances(runner):
+    
+    runner, spec = runner
+    
+    launched = runner.execute({"op" : "launch", "platform" : "gcp", "spec" : spec, "count" : 2})
+    
+    ids = [instanceId for operation in launched for instanceId in operation.ids]
+    
+    #Project and zone come from the inventory
+    
+    stopped = runner.execute({"op" : "stop", "platform" : "gcp", "instances" : ids})
+    
+    assert all(operation.ok for operation in stopped)
+    
+    assert {runner.inventory.get("gcp", instanceId)["state"] for instanceId in ids} == {"stopped"}
+    
+    submitted = runner.execute({"op" : "start", "platform" : "gcp", "instance" : ids[0], "wait" : False})
+    
+    assert len(submitted) == 1
+    
+    cloud_vms.wait_all(submitted, 30)
+    
+    assert submitted[0].ok
+    
+
+def test_bad_requests_are_rejected_before_any_call():
+    
+    batch = cloud_vms.BatchRunner()
+    
+    with pytest.raises(ValueError):
+        
+        batch.execute({"op" : "launch", "platform" : "oci"})
+        
+    
+    with pytest.raises(ValueError):
+        
+        batch.execute({"op" : "stop", "platform" : "gcp", "tag" : "pool"})
+        
+    
+
+def test_importing_the_module_does_not_start_the_menu():
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    
+    finished = subprocess.run([sys.executable, "-c", "import cloud_vms"], cwd = root, stdin = subprocess.DEVNULL, capture_output = True, timeout = 60)
+    
+    assert finished.returncode == 0
+    assert finished.stdout == b""
+    
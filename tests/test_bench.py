@@ -0,0 +1,55 @@
+import pytest
+
+import cloud_vms_bench
+
+
+def test_percentile_is_nearest_rank():
+    
+    values = [5, 1, 4, 2, 3]
+    
+    assert cloud_vms_bench.percentile(values, 0.5) == 3
+    assert cloud_vms_bench.percentile(values, 0.99) == 5
+    assert cloud_vms_bench.percentile(values, 0.0) == 1
+    assert cloud_vms_bench.percentile([], 0.5) == 0.0
+    
+
+def test_latency_draws_stay_within_base_and_jitter():
+    
+    latency = cloud_vms_bench.Latency(0.1, 0.05, seed = 7)
+    
+    draws = [latency.draw() for _ in range(100)]
+    
+    assert all(0.1 <= draw <= 0.15 for draw in draws)
+    
+    assert cloud_vms_bench.Latency(0.1, 0.0).draw() == 0.1
+    
+
+@pytest.mark.parametrize("platform", cloud_vms_bench.PROVIDERS)
+def test_each_provider_runs_every_action_without_errors(platform):
+    
+    records = cloud_vms_bench.Bench(timeout = 60).run(platform, 3)
+    
+    assert [record["action"] for record in records] == list(cloud_vms_bench.ACTIONS)
+    
+    for record in records:
+        
+        assert (record["ops"], record["errors"]) == (3, 0)
+        assert record["p50"] <= record["p99"]
+        
+    
+
+def test_runs_compare_against_the_last_run_of_the_same_fleets(tmp_path):
+    
+    path = str(tmp_path / "history.jsonl")
+    
+    old = {"platform" : "gcp", "size" : 10, "action" : "stop", "ops_per_sec" : 100.0, "p99" : 0.5}
+    new = dict(old, ops_per_sec = 150.0, p99 = 0.25)
+    
+    cloud_vms_bench.append_history(path, {"settings" : {}, "results" : [old]})
+    
+    history = cloud_vms_bench.load_history(path)
+    
+    assert cloud_vms_bench.compare(history[-1], [new, dict(new, size = 100)]) == {("gcp", 10, "stop") : (100.0, 150.0, 0.5, 0.25)}
+    
+    assert cloud_vms_bench.load_history(str(tmp_path / "missing.jsonl")) == []
+    
@@ -0,0 +1,105 @@
+import cloud_vms
+
+
+def launched(cloud, spec, count):
+    
+    return [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, count), 30) for instanceId in operation.ids]
+    
+
+def test_bulk_call_bisects_around_unknown_ids(make_cloud, settle):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = launched(cloud, spec, 8)
+    
+    bogus = "i-0123456789abcdef0"
+    
+    results = cloud.stop_instances(ids[:4] + [bogus] + ids[4:])
+    
+    assert all(results[instanceId]["ok"] for instanceId in ids)
+    assert not results[bogus]["ok"]
+    assert "InvalidInstanceID" in results[bogus]["error"]
+    
+    assert all(operation.ok for operation in settle(results))
+    
+
+def test_bulk_call_fails_the_whole_chunk_on_other_errors(make_cloud, monkeypatch, client_error):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = launched(cloud, spec, 4)
+    
+    calls = []
+    
+    def stop_instances(**kwargs):
+        
+        calls.append(kwargs["InstanceIds"])
+        
+        raise client_error("UnauthorizedOperation")
+        
+    
+    monkeypatch.setattr(cloud._client("client"), "stop_instances", stop_instances)
+    
+    results = cloud.stop_instances(ids)
+    
+    assert len(calls) == 1
+    
+    assert not any(result["ok"] for result in results.values())
+    assert all("UnauthorizedOperation" in results[instanceId]["error"] for instanceId in ids)
+    
+
+def test_bulk_calls_share_one_handle_per_chunk(make_cloud, settle):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = launched(cloud, spec, 3)
+    
+    results = cloud.stop_instances(ids)
+    
+    operations = settle(results)
+    
+    assert len(operations) == 1
+    assert sorted(operations[0].ids) == sorted(ids)
+    
+    assert all(result["operation"] is operations[0] for result in results.values())
+    
+
+def test_terminate_reports_key_pair_failures_next_to_the_instances(make_cloud, monkeypatch, settle, client_error):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = launched(cloud, spec, 2)
+    
+    client = cloud._client("client")
+    
+    client.create_key_pair(KeyName = "kept")
+    client.create_key_pair(KeyName = "gone")
+    
+    delete = client.delete_key_pair
+    
+    def delete_key_pair(**kwargs):
+        
+        if kwargs["KeyName"] == "kept":
+            
+            raise client_error("UnauthorizedOperation")
+            
+        
+        return delete(**kwargs)
+        
+    
+    monkeypatch.setattr(client, "delete_key_pair", delete_key_pair)
+    
+    results = cloud.terminate_instances(ids, key_names = ["kept", "gone"])
+    
+    assert all(results[instanceId]["ok"] for instanceId in ids)
+    
+    assert not results["key-pair:kept"]["ok"]
+    assert "UnauthorizedOperation" in results["key-pair:kept"]["error"]
+    assert "key-pair:gone" not in results
+    
+    names = {pair["KeyName"] for pair in client.describe_key_pairs()["KeyPairs"]}
+    
+    assert "kept" in names and "gone" not in names
+    
+    assert all(operation.ok for operation in settle({instanceId : results[instanceId] for instanceId in ids}))
+    
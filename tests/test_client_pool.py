@@ -0,0 +1,104 @@
+import threading
+
+import cloud_vms
+
+
+def counting_factories(built):
+    
+    def factory(kind):
+        
+        def build(region, credentials):
+            
+            built.append((kind, region, credentials))
+            
+            return object()
+            
+        
+        return build
+        
+    
+    return {("aws", "client") : factory("client"), ("aws", "resource") : factory("resource")}
+    
+
+def test_clients_are_built_once_per_region_and_credentials():
+    
+    built = []
+    
+    pool = cloud_vms.ClientPool(counting_factories(built))
+    
+    client = pool.get("aws", "client", "us-east-1")
+    
+    assert pool.get("aws", "client", "us-east-1") is client
+    assert pool.get("aws", "client", "eu-west-1") is not client
+    assert pool.get("aws", "client", "us-east-1", "other-profile") is not client
+    
+    assert len(built) == 3
+    
+    pool.clear()
+    
+    assert pool.get("aws", "client", "us-east-1") is not client
+    
+
+def test_concurrent_first_use_builds_one_client():
+    
+    built = []
+    
+    pool = cloud_vms.ClientPool(counting_factories(built))
+    
+    start = threading.Barrier(8)
+    clients = []
+    
+    def get():
+        
+        start.wait()
+        
+        clients.append(pool.get("aws", "client", "us-east-1"))
+        
+    
+    threads = [threading.Thread(target = get) for index in range(8)]
+    
+    for thread in threads:
+        
+        thread.start()
+        
+    
+    for thread in threads:
+        
+        thread.join()
+        
+    
+    assert len(built) == 1
+    assert len({id(client) for client in clients}) == 1
+    
+
+def test_thread_local_kinds_get_one_client_per_thread():
+    
+    built = []
+    
+    pool = cloud_vms.ClientPool(counting_factories(built))
+    
+    here = pool.get("aws", "resource", "us-east-1")
+    
+    assert pool.get("aws", "resource", "us-east-1") is here
+    
+    there = []
+    
+    thread = threading.Thread(target = lambda: there.append(pool.get("aws", "resource", "us-east-1")))
+    
+    thread.start()
+    thread.join()
+    
+    assert there[0] is not here
+    assert len(built) == 2
+    
+
+def test_cloud_reuses_pooled_clients_across_calls(make_cloud):
+    
+    cloud, spec = make_cloud("aws")
+    
+    assert cloud._client("client") is cloud._client("client")
+    
+    other = cloud_vms.Cloud("aws", region = "us-east-1", pool = cloud.pool)
+    
+    assert other._client("client") is cloud._client("client")
+    
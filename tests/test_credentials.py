@@ -0,0 +1,189 @@
+import datetime
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+import cloud_vms
+
+
+class Credentials(object):
+    
+    #google-auth style credentials whose refresh hands out numbered tokens
+    
+    def __init__(self, client_id = "client", lifetime = 3600.0, fail = False):
+        
+        self.client_id = client_id
+        self.lifetime = lifetime
+        self.fail = fail
+        
+        self.token = None
+        self.expiry = None
+        
+        self.refreshed = 0
+        
+    
+    def refresh(self, request):
+        
+        if self.fail:
+            
+            raise RuntimeError("token endpoint unreachable")
+            
+        
+        time.sleep(0.01)
+        
+        self.refreshed += 1
+        
+        self.token = "{}-{}".format(self.client_id, self.refreshed)
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds = self.lifetime)
+        
+    
+
+def test_threads_share_one_resolve_and_one_refresh():
+    
+    cache = cloud_vms.CredentialCache(background = False)
+    
+    credentials = Credentials()
+    
+    start = threading.Barrier(16)
+    results = []
+    
+    def use():
+        
+        start.wait()
+        
+        results.append(cache.gcp_credentials(credentials))
+        
+    
+    threads = [threading.Thread(target = use) for _ in range(16)]
+    
+    for thread in threads:
+        
+        thread.start()
+        
+    
+    for thread in threads:
+        
+        thread.join()
+        
+    
+    assert all(result is credentials for result in results)
+    
+    assert credentials.refreshed == 1
+    assert (cache.stats()["resolves"], cache.stats()["refreshes"]) == (1, 1)
+    
+
+def test_tokens_are_refreshed_only_within_the_margin():
+    
+    cache = cloud_vms.CredentialCache(margin = 60, background = False)
+    
+    lasting = Credentials("lasting")
+    
+    cache.gcp_credentials(lasting)
+    cache.gcp_credentials(lasting)
+    
+    assert lasting.refreshed == 1
+    
+    expiring = Credentials("expiring", lifetime = 30)
+    
+    cache.gcp_credentials(expiring)
+    cache.gcp_credentials(expiring)
+    
+    #Each use finds the token inside the margin again
+    
+    assert expiring.refreshed == 2
+    
+
+def test_the_background_thread_refreshes_ahead_of_expiry():
+    
+    cache = cloud_vms.CredentialCache(margin = 1000)
+    
+    credentials = Credentials(lifetime = 1000.5)
+    
+    try:
+        
+        cache.gcp_credentials(credentials)
+        
+        deadline = time.monotonic() + 5
+        
+        while credentials.refreshed < 2 and time.monotonic() < deadline:
+            
+            time.sleep(0.05)
+            
+        
+        assert credentials.refreshed >= 2
+        
+    
+    finally:
+        
+        cache.close()
+        
+    
+
+def test_processes_adopt_a_token_another_one_refreshed(tmp_path):
+    
+    path = str(tmp_path / "tokens.json")
+    
+    first = cloud_vms.CredentialCache(path, background = False)
+    
+    first.gcp_credentials(Credentials("shared"))
+    
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    
+    #Another process: its own cache and credentials object, the same account
+    
+    second = cloud_vms.CredentialCache(path, background = False)
+    
+    adopted = second.gcp_credentials(Credentials("shared"))
+    
+    assert adopted.refreshed == 0
+    assert adopted.token == "shared-1"
+    
+    assert second.stats()["shared"] == 1 and second.stats()["refreshes"] == 0
+    
+
+def test_concurrent_writers_keep_every_token(tmp_path):
+    
+    path = str(tmp_path / "tokens.json")
+    
+    cache = cloud_vms.CredentialCache(path, background = False)
+    
+    threads = [threading.Thread(target = cache.gcp_credentials, args = (Credentials("account-{}".format(index)),)) for index in range(8)]
+    
+    for thread in threads:
+        
+        thread.start()
+        
+    
+    for thread in threads:
+        
+        thread.join()
+        
+    
+    for index in range(8):
+        
+        assert cache._read(("gcp", "account-{}".format(index)))["token"] == "account-{}-1".format(index)
+        
+    
+    assert os.listdir(str(tmp_path)) == ["tokens.json"]
+    
+
+def test_write_and_refresh_failures_are_counted(tmp_path):
+    
+    cache = cloud_vms.CredentialCache(str(tmp_path / "missing" / "tokens.json"), background = False)
+    
+    #The token still comes back when it cannot be shared
+    
+    assert cache.gcp_credentials(Credentials()).token == "client-1"
+    
+    assert cache.stats()["write_failures"] == 1
+    
+    with pytest.raises(RuntimeError):
+        
+        cache.gcp_credentials(Credentials("broken", fail = True))
+        
+    
+    assert cache.stats()["refresh_failures"] == 1
+    
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import cloud_vms
+import cloud_vms_bench
+
+
+class Counting(object):
+    
+    #Cloud double whose launches take a moment and count how many overlap
+    
+    def __init__(self, platform, usage):
+        
+        self.platform = platform
+        self.usage = usage
+        
+    
+    def launch_copies(self, specifications, count = 1, prefix = "", overrides = None):
+        
+        with self.usage["lock"]:
+            
+            self.usage[self.platform] += 1
+            self.usage["peak"][self.platform] = max(self.usage["peak"][self.platform], self.usage[self.platform])
+            self.usage["overall"] = max(self.usage["overall"], sum(self.usage[platform] for platform in cloud_vms.FAN_OUT_LIMITS))
+            
+        
+        time.sleep(0.05)
+        
+        with self.usage["lock"]:
+            
+            self.usage[self.platform] -= 1
+            
+        
+        if specifications == "broken":
+            
+            raise RuntimeError("quota exceeded")
+            
+        
+        return [cloud_vms.Operation.completed(self.platform, "launch", ["{}{}".format(prefix, index) for index in range(count)])]
+        
+    
+
+def counting_fan_out(monkeypatch, limits):
+    
+    usage = dict.fromkeys(cloud_vms.FAN_OUT_LIMITS, 0)
+    usage.update(lock = threading.Lock(), peak = dict.fromkeys(cloud_vms.FAN_OUT_LIMITS, 0), overall = 0)
+    
+    fan_out = cloud_vms.FanOut(limits)
+    
+    monkeypatch.setattr(fan_out, "_cloud", lambda platform: Counting(platform, usage))
+    
+    return fan_out, usage
+    
+
+def test_each_provider_runs_no_more_jobs_than_its_limit(monkeypatch):
+    
+    fan_out, usage = counting_fan_out(monkeypatch, {"aws" : 2, "gcp" : 3})
+    
+    jobs = [("aws", "spec", 1)] * 6 + [("gcp", "spec", 1)] * 6
+    
+    records = list(fan_out.run(jobs, max_workers = 12))
+    
+    assert len(records) == 12 and all(record["ok"] for record in records)
+    
+    assert usage["peak"] == {"aws" : 2, "gcp" : 3, "azu" : 0}
+    
+    #The providers' jobs overlap rather than queueing behind each other
+    
+    assert usage["overall"] == 5
+    
+    assert fan_out.elapsed is not None
+    
+
+def test_jobs_are_read_lazily_and_failures_become_records(monkeypatch):
+    
+    fan_out, usage = counting_fan_out(monkeypatch, {"gcp" : 2})
+    
+    read = []
+    
+    def jobs():
+        
+        for index in range(40):
+            
+            read.append(index)
+            
+            yield ("gcp", "broken" if index == 0 else "spec", 2, None, "job{}-".format(index))
+            
+        
+    
+    records = fan_out.run(jobs(), max_workers = 2)
+    
+    first = next(records)
+    
+    #Only a window of twice the workers is pulled ahead of the results
+    
+    assert len(read) <= 5
+    
+    rest = list(records)
+    
+    failed = [record for record in [first] + rest if not record["ok"]]
+    
+    assert len(failed) == 1
+    assert "quota exceeded" in failed[0]["errors"][0]
+    
+    assert sum(len(record["ids"]) for record in rest + [first]) == 39 * 2
+    
+
+def test_fan_out_launches_against_a_stand_in():
+    
+    backend = cloud_vms_bench.stand_in("gcp", cloud_vms_bench.Latency(0.0, 0.0), 0.0)
+    
+    try:
+        
+        pool = cloud_vms.ClientPool(backend.factories())
+        
+        spec = backend.prepare(None, cloud_vms.mySpecs[1])
+        
+        records = list(cloud_vms.fan_out([("gcp", spec, 2, None, "a-"), ("gcp", spec, 3, None, "b-")], pool = pool, timeout = 30))
+        
+    
+    finally:
+        
+        backend.close()
+        
+    
+    assert sorted(len(record["ids"]) for record in records) == [2, 3]
+    assert all(record["ok"] for record in records)
+    
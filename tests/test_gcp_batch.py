@@ -0,0 +1,65 @@
+import cloud_vms
+
+
+def round_trips(cloud):
+    
+    return cloud._client("compute")._http.round_trips
+    
+
+def test_gcp_bulk_call_is_one_counted_call_per_instance(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 5), 30) for instanceId in operation.ids]
+    
+    assert cloud.scheduler.stats()["gcp/launch"]["calls"] == 5
+    
+    results = cloud.stop_instances(ids)
+    
+    assert all(result["ok"] for result in results.values())
+    
+    assert cloud.scheduler.stats()["gcp/mutate"]["calls"] == 5
+    
+
+def test_many_instances_share_one_http_round_trip(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    before = round_trips(cloud)
+    
+    launched = cloud.launch_copies(spec, 6)
+    
+    assert round_trips(cloud) - before == 1
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(launched, 30) for instanceId in operation.ids]
+    
+    before = round_trips(cloud)
+    
+    results = cloud.stop_instances(ids)
+    
+    assert round_trips(cloud) - before == 1
+    
+    #Pending operations are polled together too
+    
+    before = round_trips(cloud)
+    
+    operations = list({id(result["operation"]) : result["operation"] for result in results.values()}.values())
+    
+    assert len(operations) == 6
+    
+    cloud_vms.GcpOperation.poll_many(operations)
+    
+    assert round_trips(cloud) - before == 1
+    
+
+def test_errors_inside_a_batch_stay_with_their_own_instance(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 3), 30) for instanceId in operation.ids]
+    
+    results = cloud.stop_instances(ids + ["never-launched"], spec["PROJECT"], spec["ZONE"])
+    
+    assert all(results[instanceId]["ok"] for instanceId in ids)
+    assert not results["never-launched"]["ok"]
+    
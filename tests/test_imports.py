@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import cloud_vms
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_after(code):
+    
+    #Top-level modules a fresh interpreter has loaded once code has run
+    
+    script = "import sys\n{}\nprint(__import__('json').dumps(sorted(name.split('.')[0] for name in sys.modules)))".format(code)
+    
+    output = subprocess.check_output([sys.executable, "-c", script], cwd = ROOT)
+    
+    return set(json.loads(output.decode().splitlines()[-1]))
+    
+
+def test_importing_the_module_loads_no_provider_sdk():
+    
+    loaded = loaded_after("import cloud_vms")
+    
+    assert not loaded & {"boto3", "botocore", "googleapiclient", "google", "azure", "Crypto", "asyncio", "aiohttp"}
+    
+
+def test_a_platform_loads_only_its_own_sdk():
+    
+    loaded = loaded_after("import cloud_vms\ncloud_vms._require('boto3')")
+    
+    assert "boto3" in loaded
+    assert not loaded & {"googleapiclient", "azure"}
+    
+
+def test_require_times_each_module_once():
+    
+    module = cloud_vms._require("json")
+    
+    assert module is json
+    
+    cloud_vms.import_times.pop("colorsys", None)
+    sys.modules.pop("colorsys", None)
+    
+    colorsys = cloud_vms._require("colorsys")
+    
+    assert colorsys.__name__ == "colorsys"
+    
+    seconds = cloud_vms.import_times["colorsys"]
+    
+    assert cloud_vms._require("colorsys") is colorsys
+    assert cloud_vms.import_times["colorsys"] == seconds
+    
@@ -0,0 +1,69 @@
+import cloud_vms
+
+
+def test_inventory_follows_instances_through_their_lifecycle(make_cloud, settle):
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud, spec = make_cloud("aws", inventory)
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30) for instanceId in operation.ids]
+    
+    states = lambda: {instanceId : inventory.get("aws", instanceId)["state"] for instanceId in ids}
+    
+    assert states() == dict.fromkeys(ids, "running")
+    
+    settle(cloud.stop_instances(ids))
+    
+    assert states() == dict.fromkeys(ids, "stopped")
+    
+    results = cloud.terminate_instances(ids)
+    
+    #The interim state is recorded as soon as the call is made
+    
+    assert set(states().values()) <= {"shutting-down", "terminated"}
+    
+    settle(results)
+    
+    assert states() == dict.fromkeys(ids, "terminated")
+    
+    assert inventory.find(platform = "aws") == []
+    assert len(inventory.find(platform = "aws", include_terminated = True)) == 2
+    
+
+def test_inventory_finds_by_tag_and_state():
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    inventory.record_launch("gcp", ["a", "b"], group = "project", area = "zone", spec_name = "web", tags = ("pool",))
+    inventory.record_launch("gcp", ["c"], group = "project", area = "zone", spec_name = "db")
+    
+    inventory.set_state("gcp", ["a"], "stopped")
+    inventory.untag("gcp", ["b"], "pool")
+    
+    assert [row["instance_id"] for row in inventory.find(tag = "pool")] == ["a"]
+    assert [row["instance_id"] for row in inventory.find(state = "stopped")] == ["a"]
+    assert sorted(row["instance_id"] for row in inventory.find(spec_name = "web")) == ["a", "b"]
+    
+    assert inventory.get("gcp", "c")["area"] == "zone"
+    assert inventory.get("aws", "c") is None
+    
+
+def test_inventory_survives_reopening(tmp_path):
+    
+    path = str(tmp_path / "inventory.db")
+    
+    inventory = cloud_vms.Inventory(path)
+    
+    inventory.record_launch("azu", ["vm-1"], group = "group", nic_name = "nic-1", ip_name = "ip-1", tags = ("web",))
+    inventory.close()
+    
+    reopened = cloud_vms.Inventory(path)
+    
+    row = reopened.get("azu", "vm-1")
+    
+    assert (row["group_name"], row["nic_name"], row["ip_name"], row["state"]) == ("group", "nic-1", "ip-1", "pending")
+    assert [row["instance_id"] for row in reopened.find(tag = "web")] == ["vm-1"]
+    
+    reopened.close()
+    
@@ -0,0 +1,114 @@
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cloud_vms
+
+
+class ThreadWorkers(ThreadPoolExecutor):
+    
+    #Stands in for the process pool; key generation itself is faked below
+    
+    def __init__(self, max_workers, mp_context = None):
+        
+        ThreadPoolExecutor.__init__(self, max_workers = max_workers)
+        
+    
+
+@pytest.fixture
+def generated(monkeypatch):
+    
+    numbers = itertools.count()
+    made = []
+    
+    def generate(key_type):
+        
+        key = ("private-{}".format(next(numbers)), "ssh-{} public".format(key_type))
+        
+        made.append(key)
+        
+        return key
+        
+    
+    monkeypatch.setattr(cloud_vms, "_generate_key", generate)
+    monkeypatch.setattr(cloud_vms, "ProcessPoolExecutor", ThreadWorkers)
+    monkeypatch.setattr(cloud_vms, "_key_pools", {})
+    
+    return made
+    
+
+def stocked(pool, count):
+    
+    deadline = time.monotonic() + 10
+    
+    while len(pool) < count and time.monotonic() < deadline:
+        
+        time.sleep(0.01)
+        
+    
+    return len(pool)
+    
+
+def test_unknown_key_types_are_rejected():
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.KeyPool("dsa")
+        
+    
+
+def test_the_pool_starts_on_first_take_and_keeps_its_watermark(generated):
+    
+    pool = cloud_vms.KeyPool("rsa", watermark = 3, processes = 1)
+    
+    assert pool._executor is None
+    
+    #Nothing is ready yet, so the first key is made on the spot
+    
+    first = pool.take()
+    
+    assert first in generated
+    
+    assert stocked(pool, 3) == 3
+    
+    assert first not in pool._keys
+    
+    ready = list(pool._keys)
+    
+    assert pool.take() == ready[0]
+    
+    assert stocked(pool, 3) == 3
+    assert len(generated) == 5
+    
+    pool.close()
+    
+    assert pool._executor is None
+    
+
+def test_clouds_only_start_the_pools_they_use(generated, tmp_path, monkeypatch):
+    
+    monkeypatch.chdir(tmp_path)
+    
+    (tmp_path / ".ssh" / "authorized_keys").mkdir(parents = True)
+    
+    cloud = cloud_vms.Cloud("azu")
+    
+    assert cloud_vms._key_pools == {}
+    
+    private = cloud.create_key("web", "ed25519")
+    
+    assert private.startswith("private-")
+    assert (tmp_path / ".ssh" / "authorized_keys" / "web.pem").read_text() == "ssh-ed25519 public"
+    
+    assert list(cloud_vms._key_pools) == ["ed25519"]
+    
+    pool = cloud_vms._key_pools["ed25519"]
+    
+    assert pool._executor is not None
+    
+    cloud.close()
+    
+    assert pool._executor is None
+    
@@ -0,0 +1,100 @@
+import cloud_vms
+
+
+def recorded_launches(cloud, monkeypatch):
+    
+    client = cloud._client("client")
+    
+    calls = []
+    
+    run_instances = client.run_instances
+    
+    def recording(**kwargs):
+        
+        calls.append(kwargs)
+        
+        return run_instances(**kwargs)
+        
+    
+    monkeypatch.setattr(client, "run_instances", recording)
+    
+    return calls
+    
+
+def templates(cloud):
+    
+    return cloud._client("client").describe_launch_templates()["LaunchTemplates"]
+    
+
+def test_launches_of_one_spec_share_a_template(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("aws")
+    
+    calls = recorded_launches(cloud, monkeypatch)
+    
+    operations = cloud_vms.wait_all(cloud.launch_copies(spec, 2) + [cloud.launch_instance(spec.replace(MIN_COUNT = 3, MAX_COUNT = 3))], 30)
+    
+    assert all(operation.ok for operation in operations)
+    
+    assert len(templates(cloud)) == 1
+    assert templates(cloud)[0]["LaunchTemplateName"].startswith(cloud_vms.TEMPLATE_PREFIX)
+    
+    assert len({call["LaunchTemplate"]["LaunchTemplateId"] for call in calls}) == 1
+    assert all("ImageId" not in call for call in calls)
+    
+    assert sorted(call["MaxCount"] for call in calls) == [2, 3]
+    
+    #A different instance type is a different template
+    
+    cloud_vms.wait_all([cloud.launch_instance(spec.replace(INSTANCE_TYPE = "t3.small"))], 30)
+    
+    assert len(templates(cloud)) == 2
+    
+
+def test_a_template_made_elsewhere_is_found_by_name(make_cloud):
+    
+    cloud, spec = make_cloud("aws")
+    
+    payload = spec.request()
+    
+    first = cloud.launch_templates.get(cloud, payload)
+    
+    #Another process with its own registry, against the same account
+    
+    second = cloud_vms.LaunchTemplates().get(cloud, payload)
+    
+    assert second["LaunchTemplateId"] == first["LaunchTemplateId"]
+    assert len(templates(cloud)) == 1
+    
+    assert cloud.launch_templates.get(cloud, payload) is first
+    
+
+def test_launches_go_inline_without_template_permissions(make_cloud, monkeypatch, client_error):
+    
+    cloud, spec = make_cloud("aws")
+    
+    def refuse(**kwargs):
+        
+        raise client_error("UnauthorizedOperation")
+        
+    
+    monkeypatch.setattr(cloud._client("client"), "create_launch_template", refuse)
+    
+    calls = recorded_launches(cloud, monkeypatch)
+    
+    operations = cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30)
+    
+    assert all(operation.ok for operation in operations)
+    
+    assert all("LaunchTemplate" not in call and call["ImageId"] == spec["IMAGE_ID"] for call in calls)
+    
+
+def test_hibernation_options_are_sent_only_when_set():
+    
+    spec = cloud_vms.mySpecs[0]
+    
+    assert "HibernationOptions" not in spec.template()
+    assert spec.replace(HIBERNATE = True).template()["HibernationOptions"] == {"Configured" : True}
+    
+    assert spec.request(spec.check({"HIBERNATE" : True}))["HibernationOptions"] == {"Configured" : True}
+    
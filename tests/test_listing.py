@@ -0,0 +1,123 @@
+import time
+
+import cloud_vms
+
+
+def test_list_cache_expires_and_invalidates_by_platform():
+    
+    cache = cloud_vms.ListCache(ttl = 60)
+    
+    cache.put(("aws", "us-east-1", None, ""), ["a"], time.monotonic())
+    cache.put(("gcp", None, None, "project"), ["b"], time.monotonic())
+    cache.put(("azu", None, None, "group"), ["c"], time.monotonic() - 120)
+    
+    assert cache.get(("aws", "us-east-1", None, "")) == ["a"]
+    assert cache.get(("azu", None, None, "group")) is None
+    
+    cache.invalidate("aws")
+    
+    assert cache.get(("aws", "us-east-1", None, "")) is None
+    assert cache.get(("gcp", None, None, "project")) == ["b"]
+    
+    cache.invalidate()
+    
+    assert cache.get(("gcp", None, None, "project")) is None
+    
+
+def test_list_instances_is_served_from_cache_until_a_mutation(make_cloud, settle):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 3), 30) for instanceId in operation.ids]
+    
+    describes = lambda: cloud.scheduler.stats()["aws/describe"]["calls"]
+    
+    first = list(cloud.list_instances())
+    
+    listed = describes()
+    
+    assert sorted(record["id"] for record in first) == sorted(ids)
+    
+    assert list(cloud.list_instances()) == first
+    assert describes() == listed
+    
+    settle(cloud.stop_instances(ids[:1]))
+    
+    records = {record["id"] : record for record in cloud.list_instances()}
+    
+    assert describes() > listed
+    assert records[ids[0]]["state"] == "stopped"
+    
+
+
+def test_a_sweep_overtaken_by_a_mutation_is_not_cached():
+    
+    cache = cloud_vms.ListCache(ttl = 60)
+    
+    key = ("aws", "us-east-1", None, "")
+    
+    generation = cache.generation("aws")
+    
+    #A stop lands while the listing is still paging
+    
+    cache.invalidate("aws")
+    
+    cache.put(key, ["stale"], time.monotonic(), generation)
+    
+    assert cache.get(key) is None
+    
+    cache.put(key, ["fresh"], time.monotonic(), cache.generation("aws"))
+    
+    assert cache.get(key) == ["fresh"]
+    
+    #Other platforms' invalidations leave the generation alone; a global one does not
+    
+    generation = cache.generation("aws")
+    
+    cache.invalidate("gcp")
+    
+    assert cache.generation("aws") == generation
+    
+    cache.invalidate()
+    
+    assert cache.generation("aws") != generation
+    
+
+def test_listing_yields_records_as_pages_arrive(make_cloud):
+    
+    cloud, spec = make_cloud("gcp")
+    
+    cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30)
+    
+    listing = cloud.list_instances(spec["PROJECT"])
+    
+    first = next(listing)
+    
+    assert first["platform"] == "gcp" and first["state"] == "running"
+    
+    #Nothing is cached until the sweep is read to the end
+    
+    assert cloud.list_cache.get(("gcp", None, None, spec["PROJECT"])) is None
+    
+    assert len([first] + list(listing)) == 2
+    
+    assert len(cloud.list_cache.get(("gcp", None, None, spec["PROJECT"]))) == 2
+    
+
+def test_azure_listing_reports_power_state_and_filters_by_group(make_cloud, settle):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30) for instanceId in operation.ids]
+    
+    settle(cloud.stop_instances(ids[:1]))
+    
+    records = {record["id"] : record for record in cloud.list_instances(spec["GROUP_NAME"])}
+    
+    assert records[ids[0]]["state"] == "stopped"
+    assert records[ids[1]]["state"] == "running"
+    
+    assert all(record["group"] == spec["GROUP_NAME"] for record in records.values())
+    
+    assert list(cloud.list_instances("SomeOtherGroup")) == []
+    
@@ -0,0 +1,119 @@
+import json
+import time
+
+import cloud_vms
+
+
+def test_observations_land_in_the_first_bucket_that_holds_them():
+    
+    histogram = cloud_vms.Histogram()
+    
+    for seconds in (0.005, 0.01, 0.3, 0.3, 1000.0):
+        
+        histogram.observe(seconds, seconds < 100)
+        
+    
+    assert histogram.counts[0] == 2
+    assert histogram.counts[cloud_vms.METRIC_BUCKETS.index(0.5)] == 2
+    assert histogram.counts[-1] == 1
+    
+    assert (histogram.count, histogram.ok, histogram.errors) == (5, 4, 1)
+    
+    assert histogram.quantile(0.5) == 0.5
+    assert histogram.quantile(0.99) == float("inf")
+    
+
+def test_json_snapshot_reports_each_labelled_series():
+    
+    metrics = cloud_vms.Metrics()
+    
+    metrics.observe("cloud_vms_operation_seconds", 0.2, platform = "gcp", action = "stop")
+    metrics.observe("cloud_vms_operation_seconds", 0.4, False, platform = "gcp", action = "stop")
+    metrics.observe("cloud_vms_operation_seconds", 3.0, platform = "aws", action = "launch")
+    
+    snapshot = json.loads(metrics.to_json())
+    
+    series = {(entry["platform"], entry["action"]) : entry for entry in snapshot["metrics"]["cloud_vms_operation_seconds"]}
+    
+    stop = series[("gcp", "stop")]
+    
+    assert (stop["count"], stop["ok"], stop["errors"]) == (2, 1, 1)
+    assert stop["sum"] == 0.6 and stop["mean"] == 0.3
+    assert stop["buckets"]["0.25"] == 1 and stop["buckets"]["0.5"] == 1
+    
+    assert series[("aws", "launch")]["p50"] == 5.0
+    
+    metrics.reset()
+    
+    assert metrics.snapshot()["metrics"] == {}
+    
+
+def test_prometheus_text_has_cumulative_buckets_and_outcome_counters():
+    
+    metrics = cloud_vms.Metrics()
+    
+    metrics.observe("cloud_vms_call_seconds", 0.02, platform = "azu", family = 'we"ird')
+    metrics.observe("cloud_vms_call_seconds", 7.0, False, platform = "azu", family = 'we"ird')
+    
+    lines = metrics.to_prometheus().splitlines()
+    
+    assert lines[0].startswith("# HELP cloud_vms_call_seconds ")
+    assert lines[1] == "# TYPE cloud_vms_call_seconds histogram"
+    
+    labels = 'family="we\\"ird",platform="azu"'
+    
+    assert 'cloud_vms_call_seconds_bucket{{{},le="0.01"}} 0'.format(labels) in lines
+    assert 'cloud_vms_call_seconds_bucket{{{},le="0.025"}} 1'.format(labels) in lines
+    assert 'cloud_vms_call_seconds_bucket{{{},le="5.0"}} 1'.format(labels) in lines
+    assert 'cloud_vms_call_seconds_bucket{{{},le="10.0"}} 2'.format(labels) in lines
+    assert 'cloud_vms_call_seconds_bucket{{{},le="+Inf"}} 2'.format(labels) in lines
+    
+    assert "cloud_vms_call_seconds_count{{{}}} 2".format(labels) in lines
+    assert 'cloud_vms_call_total{{{},outcome="ok"}} 1'.format(labels) in lines
+    assert 'cloud_vms_call_total{{{},outcome="error"}} 1'.format(labels) in lines
+    
+
+def test_write_picks_the_format_from_the_path(tmp_path):
+    
+    metrics = cloud_vms.Metrics()
+    
+    metrics.observe("cloud_vms_step_seconds", 0.1, platform = "azu", action = "launch", step = "create_vm")
+    
+    metrics.write(str(tmp_path / "metrics.json"))
+    metrics.write(str(tmp_path / "metrics.prom"))
+    
+    assert "cloud_vms_step_seconds" in json.loads((tmp_path / "metrics.json").read_text())["metrics"]
+    assert (tmp_path / "metrics.prom").read_text().startswith("# HELP cloud_vms_step_seconds")
+    
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "metrics.prom"]
+    
+
+def test_cloud_operations_and_calls_are_timed(make_cloud):
+    
+    cloud, spec = make_cloud("azu")
+    
+    cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30)
+    
+    #Handles finished on a worker thread run their callbacks just after they read as done
+    
+    deadline = time.monotonic() + 5
+    
+    recorded = lambda: sum(entry["count"] for entry in cloud.metrics.snapshot()["metrics"].get("cloud_vms_operation_seconds", []))
+    
+    while recorded() < 2 and time.monotonic() < deadline:
+        
+        time.sleep(0.01)
+        
+    
+    metrics = cloud.metrics.snapshot()["metrics"]
+    
+    operations = metrics["cloud_vms_operation_seconds"]
+    
+    assert [(entry["platform"], entry["action"], entry["count"], entry["ok"]) for entry in operations] == [("azu", "launch", 2, 2)]
+    
+    steps = {entry["step"] : entry["count"] for entry in metrics["cloud_vms_step_seconds"]}
+    
+    assert steps == {"create_ip" : 2, "create_nic" : 2, "create_vm" : 2}
+    
+    assert sum(entry["count"] for entry in metrics["cloud_vms_call_seconds"]) >= 6
+    
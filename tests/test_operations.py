@@ -0,0 +1,160 @@
+import logging
+
+import pytest
+
+import cloud_vms
+
+
+class Countdown(cloud_vms.Operation):
+    
+    #Finishes after a set number of polls; records each batch it is polled in
+    
+    poll_interval = (0.001, 0.005, 2.0)
+    
+    batches = []
+    
+    def __init__(self, polls, name = "", error = None):
+        
+        cloud_vms.Operation.__init__(self, "aws", "launch", [name])
+        
+        self.polls = polls
+        self.failure = error
+        
+    
+    def poll(self):
+        
+        self.polls -= 1
+        
+        if self.failure is not None:
+            
+            raise self.failure
+            
+        
+        if self.polls <= 0:
+            
+            self._finish(self.ids[0])
+            
+        
+    
+    @classmethod
+    def poll_many(cls, operations):
+        
+        cls.batches.append([operation.ids[0] for operation in operations])
+        
+        cloud_vms.Operation.poll_many(operations)
+        
+    
+
+@pytest.fixture(autouse = True)
+def batches():
+    
+    Countdown.batches = []
+    
+    return Countdown.batches
+    
+
+def test_handles_are_yielded_in_the_order_they_finish():
+    
+    operations = [Countdown(3, "slow"), Countdown(1, "fast"), Countdown(2, "middle")]
+    
+    assert [operation.value for operation in cloud_vms.as_completed(operations)] == ["fast", "middle", "slow"]
+    
+
+def test_pending_handles_of_one_kind_are_polled_together(batches):
+    
+    operations = [Countdown(1, "a"), Countdown(2, "b"), Countdown(2, "c")]
+    
+    cloud_vms.wait_all(operations)
+    
+    assert batches == [["a", "b", "c"], ["b", "c"]]
+    
+
+def test_finished_and_repeated_handles_are_yielded_once(batches):
+    
+    done = cloud_vms.Operation.completed("gcp", "stop", ["x"], value = "x")
+    
+    pending = Countdown(1, "y")
+    
+    assert list(cloud_vms.as_completed([done, pending, done, pending])) == [done, pending]
+    
+    assert batches == [["y"]]
+    
+
+def test_handles_still_pending_at_the_timeout_are_not_yielded():
+    
+    operation = Countdown(10 ** 9, "stuck")
+    
+    assert list(cloud_vms.as_completed([operation], timeout = 0.05)) == []
+    
+    assert not operation.done
+    
+    with pytest.raises(TimeoutError):
+        
+        operation.result(timeout = 0.01)
+        
+    
+
+def test_a_failing_poll_finishes_only_its_own_handle():
+    
+    broken = Countdown(1, "broken", error = RuntimeError("describe failed"))
+    healthy = Countdown(2, "healthy")
+    
+    cloud_vms.wait_all([broken, healthy])
+    
+    assert broken.done and not broken.ok
+    assert healthy.ok
+    
+    with pytest.raises(RuntimeError):
+        
+        broken.result()
+        
+    
+    assert broken.to_dict()["error"]
+    
+
+def test_done_callbacks_run_once_each_even_when_one_fails(caplog):
+    
+    operation = Countdown(1, "a")
+    
+    seen = []
+    
+    def failing(finished):
+        
+        raise ValueError("inventory is locked")
+        
+    
+    operation.add_done_callback(failing)
+    operation.add_done_callback(seen.append)
+    
+    with caplog.at_level(logging.ERROR, logger = "cloud_vms"):
+        
+        operation.wait()
+        
+    
+    assert seen == [operation]
+    assert "done-callback" in caplog.text
+    
+    #Registered after the handle finished: runs right away
+    
+    operation.add_done_callback(seen.append)
+    
+    assert seen == [operation, operation]
+    
+    operation._finish("again")
+    
+    assert operation.value == "a" and len(seen) == 2
+    
+
+def test_launches_return_handles_that_settle_through_the_waiter(make_cloud):
+    
+    cloud, spec = make_cloud("gcp")
+    
+    operations = cloud.launch_copies(spec, 3)
+    
+    assert all(isinstance(operation, cloud_vms.GcpOperation) for operation in operations)
+    
+    finished = list(cloud_vms.as_completed(operations, timeout = 30))
+    
+    assert sorted(map(id, finished)) == sorted(map(id, operations))
+    assert all(operation.ok and operation.seconds >= 0 for operation in finished)
+    
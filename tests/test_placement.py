@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+import cloud_vms
+
+EAST = {"ZONE" : "us-east1-b"}
+WEST = {"ZONE" : "us-west1-a"}
+
+
+def recorded(inventory, candidate, seconds, ok = True, capacity = False):
+    
+    inventory.record_placement("gcp", cloud_vms.PlacementPolicy.key(candidate), seconds, ok, capacity, "" if ok else "failed")
+    
+
+def test_candidates_are_ranked_by_recent_launch_latency():
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud = cloud_vms.Cloud("gcp", inventory = inventory)
+    
+    central = {"ZONE" : "us-central1-a"}
+    
+    policy = cloud_vms.PlacementPolicy([EAST, WEST, central])
+    
+    for seconds in (30.0, 32.0, 31.0):
+        
+        recorded(inventory, EAST, seconds)
+        
+    
+    for seconds in (10.0, 12.0):
+        
+        recorded(inventory, WEST, seconds)
+        
+    
+    #Never tried: assumed as fast as the typical candidate (here the slower one),
+    #and ties keep the listed order
+    
+    assert policy.rank(cloud) == [WEST, EAST, central]
+    
+    stats = policy.stats(cloud)[policy.key(EAST)]
+    
+    assert (stats["launches"], stats["failures"], stats["p50"]) == (3, 0, 31.0)
+    
+    #A capacity error sends a candidate to the back until the cooldown passes
+    
+    recorded(inventory, WEST, 1.0, ok = False, capacity = True)
+    
+    assert policy.rank(cloud)[-1] == WEST
+    
+    assert cloud_vms.PlacementPolicy([EAST, WEST], cooldown = 0.0).rank(cloud)[0] == WEST
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.PlacementPolicy([])
+        
+    
+
+def test_a_failed_candidate_falls_back_to_the_next(make_cloud, monkeypatch):
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud, spec = make_cloud("gcp", inventory)
+    
+    launch_instance = cloud.launch_instance
+    
+    def out_of_capacity(specifications, overrides = None, placement = None):
+        
+        if overrides and overrides.get("ZONE") == EAST["ZONE"]:
+            
+            raise RuntimeError("ZONE_RESOURCE_POOL_EXHAUSTED")
+            
+        
+        return launch_instance(specifications, overrides, placement)
+        
+    
+    monkeypatch.setattr(cloud, "launch_instance", out_of_capacity)
+    
+    policy = cloud_vms.PlacementPolicy([EAST, WEST])
+    
+    operation = policy.launch(cloud, spec).wait(30)
+    
+    assert operation.ok
+    assert operation.candidate == WEST
+    assert [candidate for candidate, attempt in operation.attempts] == [EAST, WEST]
+    
+    assert cloud.fetch_states(operation.ids, spec["PROJECT"], WEST["ZONE"]) == dict.fromkeys(operation.ids, "running")
+    
+    stats = policy.stats(cloud)
+    
+    assert stats[policy.key(EAST)]["failures"] == 1 and stats[policy.key(EAST)]["capacity_at"] is not None
+    assert stats[policy.key(WEST)]["launches"] == 1
+    
+    #The exhausted zone now goes last
+    
+    assert policy.rank(cloud) == [WEST, EAST]
+    
+
+def test_the_last_error_is_reported_when_every_candidate_fails(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("gcp")
+    
+    def refuse(specifications, overrides = None, placement = None):
+        
+        raise RuntimeError("quota exceeded in {}".format(overrides["ZONE"]))
+        
+    
+    monkeypatch.setattr(cloud, "launch_instance", refuse)
+    
+    operation = cloud_vms.PlacementPolicy([EAST, WEST]).launch(cloud, spec).wait(30)
+    
+    assert operation.done and not operation.ok
+    assert "us-west1-a" in str(operation.error)
+    
+    assert operation.ids == [] and operation.candidate is None
+    
+
+def test_a_slow_attempt_spills_over_and_the_loser_is_removed(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", operation_time = 1.0)
+    
+    policy = cloud_vms.PlacementPolicy([EAST, WEST], spill_after = 0.1)
+    
+    operation = cloud.launch_instance(spec, placement = policy)
+    
+    assert isinstance(operation, cloud_vms.PlacedOperation)
+    
+    operation.wait(30)
+    
+    assert operation.ok
+    assert len(operation.attempts) == 2
+    
+    loser = [attempt for candidate, attempt in operation.attempts if candidate != operation.candidate][0]
+    
+    #The second attempt carries names of its own
+    
+    assert loser.ids != operation.ids
+    
+    deadline = time.monotonic() + 30
+    
+    while not operation.discarded and time.monotonic() < deadline:
+        
+        time.sleep(0.05)
+        
+    
+    assert operation.discarded == {loser.ids[0] : {"ok" : True}}
+    assert operation.to_dict()["discarded"] == operation.discarded
+    
+    live = [record["id"] for record in cloud.list_instances(spec["PROJECT"], refresh = True) if record["state"] != "terminated"]
+    
+    assert live == operation.ids
+    
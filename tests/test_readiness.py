@@ -0,0 +1,117 @@
+import cloud_vms
+
+
+def launched(cloud, spec, count):
+    
+    return [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, count), 30) for instanceId in operation.ids]
+    
+
+def describes(cloud):
+    
+    return cloud.scheduler.stats().get("{}/describe".format(cloud.platform), {}).get("calls", 0)
+    
+
+def test_aws_states_come_from_one_describe_call(make_cloud):
+    
+    cloud, spec = make_cloud("aws")
+    
+    ids = launched(cloud, spec, 5)
+    
+    before = describes(cloud)
+    
+    assert cloud.fetch_states(ids) == dict.fromkeys(ids, "running")
+    
+    assert describes(cloud) - before == 1
+    
+
+def test_gcp_states_come_from_one_filtered_list_per_zone(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    ids = launched(cloud, spec, 3)
+    
+    before = describes(cloud)
+    
+    states = cloud.fetch_states(ids + ["never-launched"], spec["PROJECT"], spec["ZONE"])
+    
+    assert describes(cloud) - before == 1
+    
+    assert states == dict(dict.fromkeys(ids, "running"), **{"never-launched" : "terminated"})
+    
+
+def test_azure_reports_deleted_vms_as_terminated(make_cloud):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    ids = launched(cloud, spec, 2)
+    
+    states = cloud.fetch_states(ids + ["gone"], spec["GROUP_NAME"])
+    
+    assert states == dict(dict.fromkeys(ids, "running"), gone = "terminated")
+    
+
+def scripted(monkeypatch, cloud, rounds):
+    
+    #fetch_states answers from rounds, one dict per poll; sleeps are recorded, not slept
+    
+    polled = []
+    slept = []
+    
+    def fetch_states(instanceIds, group = "", area = ""):
+        
+        polled.append(sorted(instanceIds))
+        
+        return rounds[min(len(polled), len(rounds)) - 1]
+        
+    
+    monkeypatch.setattr(cloud, "fetch_states", fetch_states)
+    monkeypatch.setattr(cloud_vms.time, "sleep", slept.append)
+    
+    return polled, slept
+    
+
+def test_waiting_polls_only_the_instances_still_pending(monkeypatch):
+    
+    cloud = cloud_vms.Cloud("gcp")
+    
+    polled, slept = scripted(monkeypatch, cloud, [
+        
+        {"a" : "pending", "b" : "pending"},
+        {"a" : "running", "b" : "pending"},
+        {"b" : "running"}
+        
+    ])
+    
+    converged = []
+    
+    reached = cloud.wait_for_state(["a", "b"], "RUNNING", interval = 1.0, callback = lambda instanceId, seconds: converged.append(instanceId))
+    
+    assert polled == [["a", "b"], ["a", "b"], ["b"]]
+    assert converged == ["a", "b"]
+    
+    assert set(reached) == {"a", "b"} and all(seconds is not None for seconds in reached.values())
+    
+    #Backs off while nothing moves and drops back to the interval once something does
+    
+    assert len(slept) == 2
+    assert 1.2 <= slept[0] <= 1.8
+    assert 0.8 <= slept[1] <= 1.2
+    
+
+def test_instances_still_pending_at_the_timeout_map_to_none(monkeypatch):
+    
+    cloud = cloud_vms.Cloud("aws")
+    
+    polled, slept = scripted(monkeypatch, cloud, [{"a" : "running", "b" : "pending"}])
+    
+    clock = iter(range(1000))
+    
+    monkeypatch.setattr(cloud_vms.time, "perf_counter", lambda: float(next(clock)))
+    
+    reached = cloud.wait_for_state(["a", "b"], "running", timeout = 3, interval = 0.5)
+    
+    assert reached["a"] is not None
+    assert reached["b"] is None
+    
+    assert len(polled) >= 2
+    
@@ -0,0 +1,100 @@
+import pytest
+
+import cloud_vms
+
+
+def planned(count, members, state = "running"):
+    
+    reconciler = cloud_vms.Reconciler({"desired" : [{"spec" : "gcp-default", "count" : count, "state" : state}]}, cloud_vms.Inventory(":memory:"))
+    
+    actions = reconciler.plan({"gcp-default" : members})
+    
+    return [(action["action"], action.get("ids", action.get("count"))) for action in actions]
+    
+
+def test_a_shortfall_starts_stopped_instances_before_launching():
+    
+    assert planned(3, [("a", "running", 1), ("b", "stopped", 2)]) == [("start", ["b"]), ("launch", 1)]
+    
+
+def test_surplus_goes_from_the_wrong_state_first_then_the_newest():
+    
+    members = [("a", "running", 1), ("b", "running", 2), ("c", "stopped", 3), ("d", "running", 4)]
+    
+    assert planned(2, members) == [("terminate", ["c", "d"])]
+    
+
+def test_a_stopped_target_stops_running_instances():
+    
+    assert planned(2, [("a", "running", 1), ("b", "stopped", 2)], "stopped") == [("stop", ["a"])]
+    
+
+def test_instances_in_flight_count_toward_the_target():
+    
+    assert planned(2, [("a", "pending", 1), ("b", "running", 2)]) == []
+    assert planned(2, [("a", "stopping", 1)], "stopped") == [("launch", 1)]
+    
+
+def test_unreadable_instances_are_neither_replaced_nor_removed():
+    
+    assert planned(2, [("a", "running", 1), ("b", "unknown", 2)]) == []
+    assert planned(1, [("a", "unknown", 1)]) == []
+    assert planned(3, [("a", "unknown", 1)]) == [("launch", 2)]
+    
+
+def test_bad_desired_states_are_rejected():
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    with pytest.raises(KeyError):
+        
+        cloud_vms.Reconciler({"desired" : [{"spec" : "nope", "count" : 1}]}, inventory)
+        
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.Reconciler({"desired" : [{"spec" : "gcp-default", "count" : 1, "state" : "hibernated"}]}, inventory)
+        
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.Reconciler({"desired" : []}, None)
+        
+    
+
+def test_passes_converge_and_then_skip_until_something_changes(make_cloud):
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud, spec = make_cloud("gcp", inventory)
+    
+    desired = {"specs" : {"web" : {"base" : "gcp-default", "INSTANCE_NAME" : "web"}}, "desired" : [{"spec" : "web", "count" : 2}]}
+    
+    reconciler = cloud_vms.Reconciler(desired, inventory, timeout = 30)
+    
+    reconciler._clouds["gcp"] = cloud
+    
+    first = reconciler.reconcile()
+    
+    assert [(action["action"], action["ok"], len(action["ids"])) for action in first["actions"]] == [("launch", True, 2)]
+    assert not first["converged"]
+    
+    second = reconciler.reconcile()
+    
+    assert second["actions"] == [] and second["converged"] and not second["skipped"]
+    
+    assert reconciler.reconcile()["skipped"]
+    
+    #A new desired state is acted on straight away
+    
+    reconciler.load(dict(desired, desired = [{"spec" : "web", "count" : 1, "state" : "stopped"}]))
+    
+    third = reconciler.reconcile()
+    
+    assert sorted(action["action"] for action in third["actions"]) == ["stop", "terminate"]
+    assert all(action["ok"] for action in third["actions"])
+    
+    assert reconciler.reconcile()["converged"]
+    
+    assert [row["state"] for row in inventory.find(platform = "gcp", spec_name = "web")] == ["stopped"]
+    
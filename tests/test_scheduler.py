@@ -0,0 +1,119 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import cloud_vms
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    
+    slept = []
+    
+    monkeypatch.setattr(cloud_vms.time, "sleep", slept.append)
+    
+    return slept
+    
+
+def test_scheduler_retries_throttled_calls_and_honors_retry_after(sleeps, client_error):
+    
+    scheduler = cloud_vms.Scheduler(retries = 3, base_delay = 0.01)
+    
+    replies = [client_error("Throttling", retry_after = 7), "done"]
+    
+    def call():
+        
+        reply = replies.pop(0)
+        
+        if isinstance(reply, Exception):
+            
+            raise reply
+            
+        
+        return reply
+        
+    
+    assert scheduler.call("aws", "mutate", call) == "done"
+    
+    assert sleeps == [7.0]
+    
+    stats = scheduler.stats()["aws/mutate"]
+    
+    assert (stats["calls"], stats["throttled"], stats["retries"], stats["failed"]) == (2, 1, 1, 0)
+    
+
+def test_scheduler_backs_off_exponentially_without_retry_after(sleeps, client_error):
+    
+    scheduler = cloud_vms.Scheduler(retries = 3, base_delay = 1.0, max_delay = 3.0)
+    
+    def call():
+        
+        raise client_error("RequestLimitExceeded")
+        
+    
+    with pytest.raises(ClientError):
+        
+        scheduler.call("aws", "mutate", call)
+        
+    
+    #Jitter keeps each pause within half to all of min(max_delay, base_delay * 2^attempt)
+    
+    assert len(sleeps) == 3
+    
+    for attempt, seconds in enumerate(sleeps):
+        
+        ceiling = min(3.0, 2 ** attempt)
+        
+        assert ceiling / 2 <= seconds <= ceiling
+        
+    
+    stats = scheduler.stats()["aws/mutate"]
+    
+    assert (stats["calls"], stats["throttled"], stats["failed"]) == (4, 3, 1)
+    
+
+def test_scheduler_does_not_retry_other_errors(sleeps, client_error):
+    
+    scheduler = cloud_vms.Scheduler()
+    
+    def call():
+        
+        raise client_error("UnauthorizedOperation")
+        
+    
+    with pytest.raises(ClientError):
+        
+        scheduler.call("aws", "mutate", call)
+        
+    
+    assert sleeps == []
+    
+    assert scheduler.stats()["aws/mutate"]["calls"] == 1
+    
+
+def test_scheduler_charges_batches_per_inner_call():
+    
+    scheduler = cloud_vms.Scheduler({("gcp", "mutate") : (1000.0, 50)})
+    
+    scheduler.call_batch("gcp", "mutate", 20, lambda: None)
+    
+    stats = scheduler.stats()["gcp/mutate"]
+    
+    assert stats["calls"] == 20
+    assert stats["tokens"] == pytest.approx(30, abs = 1)
+    
+
+def test_token_bucket_waits_for_tokens_and_carries_debt():
+    
+    bucket = cloud_vms.TokenBucket(10.0, 5)
+    
+    assert bucket.take(3) == 0.0
+    
+    #Two tokens left: a request for eight waits for a full bucket of five
+    
+    assert bucket.take(8) == pytest.approx(0.3, abs = 0.01)
+    
+    bucket.tokens = 5.0
+    
+    assert bucket.take(8) == 0.0
+    assert bucket.tokens == pytest.approx(-3.0, abs = 0.01)
+    
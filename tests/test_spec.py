@@ -0,0 +1,114 @@
+import pytest
+
+import cloud_vms
+
+
+def aws_spec(**changes):
+    
+    return cloud_vms.mySpecs[0].replace(**changes)
+    
+
+def test_values_are_coerced_to_each_field_type():
+    
+    spec = aws_spec(VOLUME_SIZE = "20", ENCRYPTED = "no", TAGS = "web, blue ,", MIN_COUNT = 2.0, MAX_COUNT = 3)
+    
+    assert spec["VOLUME_SIZE"] == 20
+    assert spec.encrypted is False
+    assert spec["TAGS"] == ("web", "blue")
+    assert spec["MIN_COUNT"] == 2
+    
+
+@pytest.mark.parametrize("key, value", [("VOLUME_SIZE", "big"), ("VOLUME_SIZE", 8.5), ("VOLUME_SIZE", True), ("ENCRYPTED", "maybe")])
+def test_values_that_do_not_fit_the_field_are_rejected(key, value):
+    
+    with pytest.raises(ValueError):
+        
+        aws_spec(**{key : value})
+        
+    
+
+def test_unknown_and_missing_fields_are_rejected():
+    
+    values = cloud_vms.mySpecs[0].to_dict()
+    
+    with pytest.raises(KeyError):
+        
+        cloud_vms.AwsSpec(**dict(values, ZONE = "us-east-1a"))
+        
+    
+    del values["IMAGE_ID"]
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.AwsSpec(**values)
+        
+    
+    with pytest.raises(AttributeError):
+        
+        cloud_vms.mySpecs[0].zone = "us-east-1a"
+        
+    
+
+def test_the_template_is_compiled_once_and_recompiled_after_a_change():
+    
+    spec = aws_spec()
+    
+    template = spec.template()
+    
+    assert spec.template() is template
+    assert template["BlockDeviceMappings"][0]["Ebs"]["VolumeSize"] == 8
+    
+    spec["VOLUME_SIZE"] = 30
+    
+    assert spec.template() is not template
+    assert spec.template()["BlockDeviceMappings"][0]["Ebs"]["VolumeSize"] == 30
+    
+    with pytest.raises(ValueError):
+        
+        aws_spec(MIN_COUNT = 3, MAX_COUNT = 2).template()
+        
+    
+
+def test_requests_copy_only_the_overridden_paths():
+    
+    spec = aws_spec()
+    
+    template = spec.template()
+    
+    request = spec.request(spec.check({"VOLUME_SIZE" : "50"}))
+    
+    assert request["BlockDeviceMappings"][0]["Ebs"]["VolumeSize"] == 50
+    assert template["BlockDeviceMappings"][0]["Ebs"]["VolumeSize"] == 8
+    
+    #Untouched sections are shared with the compiled template
+    
+    assert request["NetworkInterfaces"] is template["NetworkInterfaces"]
+    assert request["BlockDeviceMappings"] is not template["BlockDeviceMappings"]
+    
+    assert spec.request() == template
+    
+    with pytest.raises(KeyError):
+        
+        spec.check({"ZONE" : "us-east-1a"})
+        
+    
+
+def test_patched_creates_sections_the_template_leaves_out():
+    
+    template = {"a" : {"b" : 1}, "items" : [{"c" : 2}]}
+    
+    patched = cloud_vms._patched(template, {("a", "b") : 3, ("items", 0, "c") : 4, ("new", "d") : 5})
+    
+    assert patched == {"a" : {"b" : 3}, "items" : [{"c" : 4}], "new" : {"d" : 5}}
+    assert template == {"a" : {"b" : 1}, "items" : [{"c" : 2}]}
+    
+
+def test_each_provider_spec_compiles_its_own_payload():
+    
+    gcp = cloud_vms.mySpecs[1]
+    azure = cloud_vms.mySpecs[2]
+    
+    assert gcp.template()["name"] == gcp["INSTANCE_NAME"]
+    
+    assert set(azure.template()) == {"ip", "nic", "vm"}
+    
@@ -0,0 +1,91 @@
+import pytest
+
+import cloud_vms
+
+
+def test_spec_matrix_expands_every_combination():
+    
+    matrix = cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], {
+        
+        "INSTANCE_TYPE" : ["t3.micro", "t3.small"],
+        "disk" : [{"VOLUME_SIZE" : 8, "VOLUME_TYPE" : "gp2"}, {"VOLUME_SIZE" : 20, "VOLUME_TYPE" : "gp3"}],
+        "count" : [1, 3]
+        
+    }, prefix = "t-")
+    
+    assert len(matrix) == 8
+    assert matrix.instances == 16
+    
+    cells = list(matrix.cells())
+    
+    assert cells[0] == ({"INSTANCE_TYPE" : "t3.micro", "VOLUME_SIZE" : 8, "VOLUME_TYPE" : "gp2"}, 1)
+    assert cells[-1] == ({"INSTANCE_TYPE" : "t3.small", "VOLUME_SIZE" : 20, "VOLUME_TYPE" : "gp3"}, 3)
+    
+    jobs = list(matrix)
+    
+    assert [job[4] for job in jobs] == ["t-{}-".format(index) for index in range(1, 9)]
+    assert all(job[0] == "aws" and job[1] is matrix.spec for job in jobs)
+    
+    assert sum(job[2] for job in jobs) == matrix.instances
+    
+
+def test_spec_matrix_rejects_bad_axes():
+    
+    with pytest.raises(KeyError):
+        
+        cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], {"NOT_A_FIELD" : [1]})
+        
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], {"INSTANCE_TYPE" : []})
+        
+    
+    with pytest.raises(ValueError):
+        
+        cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], {"count" : [0]})
+        
+    
+
+
+def test_huge_matrices_are_expanded_as_they_are_read():
+    
+    axes = [("VOLUME_SIZE", list(range(10, 1010))), ("INSTANCE_TYPE", ["t3.micro", "t3.small"] * 50), ("count", [1, 2] * 50)]
+    
+    matrix = cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], axes)
+    
+    assert len(matrix) == 10 ** 7
+    
+    jobs = iter(matrix)
+    
+    platform, spec, count, overrides, prefix = next(jobs)
+    
+    assert (count, overrides) == (1, {"VOLUME_SIZE" : 10, "INSTANCE_TYPE" : "t3.micro"})
+    assert prefix == matrix.prefix + "1-"
+    
+    #Two expansions of the same matrix get different run tags
+    
+    assert cloud_vms.SpecMatrix("aws", cloud_vms.mySpecs[0], axes).prefix != matrix.prefix
+    
+
+def test_launch_matrix_launches_every_cell(make_cloud):
+    
+    cloud, spec = make_cloud("gcp")
+    
+    records = list(cloud_vms.launch_matrix("gcp", spec, {
+        
+        "MACHINE_TYPE" : ["zones/us-west1-a/machineTypes/e2-micro", "zones/us-west1-a/machineTypes/e2-small"],
+        "count" : [1, 2]
+        
+    }, pool = cloud.pool, timeout = 30))
+    
+    assert len(records) == 4
+    assert all(record["ok"] for record in records)
+    
+    assert sorted(len(record["ids"]) for record in records) == [1, 1, 2, 2]
+    assert sorted(record["overrides"]["MACHINE_TYPE"][-8:] for record in records) == ["e2-micro", "e2-micro", "e2-small", "e2-small"]
+    
+    types = sorted(record["type"] for record in cloud.list_instances(spec["PROJECT"]))
+    
+    assert types == ["e2-micro"] * 3 + ["e2-small"] * 3
+    
@@ -0,0 +1,122 @@
+import pytest
+
+import cloud_vms
+
+
+@pytest.fixture
+def watched(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 3), 30) for instanceId in operation.ids]
+    
+    watcher = cloud_vms.StatusWatcher(inventory = cloud.inventory, interval = 0.02, max_interval = 0.1, clouds = {("gcp", None) : cloud})
+    
+    yield watcher, cloud, ids
+    
+    watcher.close()
+    
+
+def test_every_tracked_instance_is_read_in_one_call_per_poll(watched, monkeypatch):
+    
+    watcher, cloud, ids = watched
+    
+    calls = []
+    
+    fetch_states = cloud.fetch_states
+    
+    def counted(instanceIds, group = "", area = ""):
+        
+        calls.append(sorted(instanceIds))
+        
+        return fetch_states(instanceIds, group, area)
+        
+    
+    monkeypatch.setattr(cloud, "fetch_states", counted)
+    
+    watcher.track("gcp", ids)
+    
+    assert watcher.wait_for("gcp", ids, "RUNNING", timeout = 10) == []
+    
+    assert calls and all(call == sorted(ids) for call in calls)
+    
+    assert set(watcher.snapshot()["gcp"]) == set(ids)
+    
+
+def test_subscribers_hear_each_transition_once(watched, settle):
+    
+    watcher, cloud, ids = watched
+    
+    everything = watcher.subscribe(platform = "gcp")
+    
+    stops = []
+    
+    watcher.subscribe(lambda event: stops.append(event), states = ["stopped"])
+    
+    def failing(event):
+        
+        raise RuntimeError("subscriber bug")
+        
+    
+    watcher.subscribe(failing)
+    
+    watcher.track("gcp", ids)
+    
+    first = [everything.get(10) for _ in ids]
+    
+    assert sorted(event["id"] for event in first) == sorted(ids)
+    assert all(event["old"] is None and event["new"] == "running" for event in first)
+    
+    settle(cloud.stop_instances(ids[:1]))
+    
+    watcher.refresh("gcp")
+    
+    assert watcher.wait_for("gcp", ids[:1], "stopped", timeout = 10) == []
+    
+    event = everything.get(10)
+    
+    assert (event["id"], event["old"], event["new"]) == (ids[0], "running", "stopped")
+    
+    assert [(event["id"], event["new"]) for event in stops] == [(ids[0], "stopped")]
+    
+    #Steady states make no further events
+    
+    assert everything.get(0.3) is None
+    
+    everything.close()
+    
+
+def test_terminated_instances_stop_being_polled(watched, settle):
+    
+    watcher, cloud, ids = watched
+    
+    watcher.track("gcp", ids)
+    
+    assert watcher.wait_for("gcp", ids, "running", timeout = 10) == []
+    
+    settle(cloud.terminate_instances(ids[:1]))
+    
+    watcher.refresh()
+    
+    assert watcher.wait_for("gcp", ids[:1], "terminated", timeout = 10) == []
+    
+    assert ids[0] not in watcher._tracked[("gcp", None)]
+    
+    assert cloud.inventory.get("gcp", ids[0])["state"] == "terminated"
+    
+
+def test_waiting_times_out_with_the_instances_still_elsewhere(watched):
+    
+    watcher, cloud, ids = watched
+    
+    watcher.track("gcp", ids)
+    
+    assert sorted(watcher.wait_for("gcp", ids, "stopped", timeout = 0.2)) == sorted(ids)
+    
+    watcher.close()
+    
+    with pytest.raises(RuntimeError):
+        
+        watcher.track("gcp", ids)
+        
+    
@@ -0,0 +1,103 @@
+import cloud_vms
+
+
+def test_teardown_deletes_each_resource_after_the_one_it_hangs_off(make_cloud, settle):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    launched = cloud_vms.wait_all(cloud.launch_copies(spec, 2), 30)
+    
+    assert all(operation.ok for operation in launched)
+    
+    ids = [instanceId for operation in launched for instanceId in operation.ids]
+    
+    for operation in settle(cloud.terminate_instances(ids)):
+        
+        assert operation.ok
+        
+        steps = [name for name, seconds, ok in operation.steps]
+        
+        assert steps == ["delete_vm", "delete_nic", "delete_ip"]
+        
+        assert operation.outcomes["key"]["skipped"]
+        
+    
+
+def test_teardown_leaves_dependents_when_a_delete_fails(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 1), 30) for instanceId in operation.ids]
+    
+    delete = cloud_vms.Teardown._delete
+    
+    def failing(self, operation, kind):
+        
+        if kind == "vm":
+            
+            raise RuntimeError("vm is locked")
+            
+        
+        return delete(self, operation, kind)
+        
+    
+    monkeypatch.setattr(cloud_vms.Teardown, "_delete", failing)
+    
+    result = cloud.terminate_instances(ids)[ids[0]]
+    
+    #The per-ID result reports how the teardown settled, as the bulk calls do
+    
+    assert not result["ok"]
+    assert "vm" in result["error"]
+    
+    operation = result["operation"]
+    
+    assert operation.done and not operation.ok
+    
+    assert "vm is locked" in operation.outcomes["vm"]["error"]
+    
+    for kind in ("nic", "ip", "key"):
+        
+        assert not operation.outcomes[kind]["ok"]
+        assert operation.outcomes[kind]["error"].startswith("not attempted")
+        
+    
+
+
+def test_one_failed_teardown_does_not_hold_up_the_others(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    ids = [instanceId for operation in cloud_vms.wait_all(cloud.launch_copies(spec, 3), 30) for instanceId in operation.ids]
+    
+    delete = cloud_vms.Teardown._delete
+    
+    def failing(self, operation, kind):
+        
+        if operation.ids[0] == ids[1] and kind == "nic":
+            
+            raise RuntimeError("nic is in use")
+            
+        
+        return delete(self, operation, kind)
+        
+    
+    monkeypatch.setattr(cloud_vms.Teardown, "_delete", failing)
+    
+    results = cloud.terminate_instances(ids + ["never-launched"], spec["GROUP_NAME"])
+    
+    assert [instanceId for instanceId in ids if results[instanceId]["ok"]] == [ids[0], ids[2]]
+    
+    assert results[ids[1]]["operation"].outcomes["vm"]["ok"]
+    assert not results[ids[1]]["operation"].outcomes["ip"]["ok"]
+    
+    #A VM that is already gone counts as torn down
+    
+    assert results["never-launched"]["ok"]
+    assert results["never-launched"]["operation"].outcomes["vm"]["absent"]
+    
+    resources = cloud._client("compute").virtual_machines.stand_in.resources
+    
+    assert resources["virtualMachines"] == {}
+    assert list(resources["networkInterfaces"]) == [results[ids[1]]["operation"].resources["nic"]]
+    
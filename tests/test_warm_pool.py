@@ -0,0 +1,137 @@
+import time
+
+import cloud_vms
+
+
+def eventually(predicate, timeout = 10):
+    
+    deadline = time.monotonic() + timeout
+    
+    while not predicate() and time.monotonic() < deadline:
+        
+        time.sleep(0.01)
+        
+    
+    return predicate()
+    
+
+def test_acquire_starts_a_ready_member_and_refills(make_cloud):
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud, spec = make_cloud("gcp", inventory)
+    
+    pool = cloud_vms.WarmPool(cloud, spec, size = 2, timeout = 30)
+    
+    pool.refill()
+    
+    assert eventually(lambda: pool.stats()["ready"] == 2)
+    
+    members = [row["instance_id"] for row in inventory.find(tag = pool.tag)]
+    
+    assert len(members) == 2
+    assert cloud.fetch_states(members) == dict.fromkeys(members, "stopped")
+    
+    operation = pool.acquire().wait(30)
+    
+    assert operation.ok and operation.action == "start"
+    assert operation.ids[0] in members
+    
+    #The member leaves the pool, and the pool builds a replacement
+    
+    assert operation.ids[0] not in [row["instance_id"] for row in inventory.find(tag = pool.tag)]
+    assert eventually(lambda: pool.stats()["ready"] == 2)
+    
+    stats = pool.stats()
+    
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 0, 1.0)
+    assert stats["hit_p50"] is not None
+    
+    pool.close()
+    
+
+def test_an_empty_pool_launches_cold(make_cloud):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    pool = cloud_vms.WarmPool(cloud, spec, size = 0, timeout = 30)
+    
+    operation = pool.acquire().wait(30)
+    
+    assert operation.ok and operation.action == "launch"
+    
+    assert (pool.stats()["hits"], pool.stats()["misses"]) == (0, 1)
+    
+
+def test_members_survive_a_restart_through_the_inventory(make_cloud):
+    
+    inventory = cloud_vms.Inventory(":memory:")
+    
+    cloud, spec = make_cloud("gcp", inventory)
+    
+    pool = cloud_vms.WarmPool(cloud, spec, size = 2, timeout = 30)
+    
+    pool.refill()
+    
+    assert eventually(lambda: pool.stats()["ready"] == 2)
+    
+    pool.close()
+    
+    assert cloud_vms.WarmPool(cloud, spec, size = 2).stats()["ready"] == 2
+    
+
+def test_a_failed_build_is_recorded_and_backs_off(make_cloud, monkeypatch):
+    
+    cloud, spec = make_cloud("gcp", cloud_vms.Inventory(":memory:"))
+    
+    attempts = []
+    
+    def no_capacity(*args, **kwargs):
+        
+        attempts.append(args)
+        
+        raise RuntimeError("ZONE_RESOURCE_POOL_EXHAUSTED")
+        
+    
+    monkeypatch.setattr(cloud, "launch_copies", no_capacity)
+    
+    pool = cloud_vms.WarmPool(cloud, spec, size = 2, timeout = 30)
+    
+    pool.refill()
+    
+    assert eventually(lambda: pool.stats()["last_error"] is not None)
+    assert eventually(lambda: not pool._refilling)
+    
+    stats = pool.stats()
+    
+    assert "ZONE_RESOURCE_POOL_EXHAUSTED" in stats["last_error"]
+    assert stats["refill_failures"] == 2
+    assert 0 < stats["retry_in"] <= cloud_vms.WARM_POOL_BACKOFF
+    
+    #Held off until the backoff runs out
+    
+    pool.refill()
+    
+    assert not pool._refilling and len(attempts) == 1
+    
+
+def test_azure_members_are_deallocated(make_cloud):
+    
+    cloud, spec = make_cloud("azu", cloud_vms.Inventory(":memory:"))
+    
+    pool = cloud_vms.WarmPool(cloud, spec, size = 1, timeout = 30)
+    
+    pool.refill()
+    
+    assert eventually(lambda: pool.stats()["ready"] == 1)
+    
+    vms = cloud._client("compute").virtual_machines.stand_in.resources["virtualMachines"]
+    
+    assert [vm.power for vm in vms.values()] == ["PowerState/deallocated"]
+    
+    results = pool.close(drain = True)
+    
+    assert len(results) == 1 and all(result["ok"] for result in results.values())
+    
+    assert vms == {}
+    